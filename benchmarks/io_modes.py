@@ -0,0 +1,107 @@
+"""Benchmark of the I/O modes.
+
+Measures the throughput of generating a DIF and the page cache footprint
+(the amount of the hashed data that is still cached afterwards) for each I/O
+mode. The page cache footprint is measured with mincore(2) and is only
+available on Linux.
+
+Usage: python3 io_modes.py [-n FILES] [-s SIZE_MB] [DIRECTORY]
+
+For meaningful throughput numbers, drop the page cache before each run (e.g.
+`sync; echo 3 > /proc/sys/vm/drop_caches`) or use a data set larger than the
+available memory.
+
+"""
+
+
+import os
+import sys
+import time
+import mmap
+import ctypes
+import ctypes.util
+import argparse
+import tempfile
+import shutil
+
+from dataintegrityfingerprint import DataIntegrityFingerprint
+
+
+def cached_bytes(filename):
+    """Return the number of bytes of a file in the page cache (Linux only)."""
+
+    size = os.path.getsize(filename)
+    if size == 0:
+        return 0
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t,
+                             ctypes.c_char_p]
+    with open(filename, "rb") as f:
+        mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_COPY)
+        try:
+            pages = (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+            vec = ctypes.create_string_buffer(pages)
+            address = ctypes.addressof(ctypes.c_char.from_buffer(mm))
+            if libc.mincore(ctypes.c_void_p(address), size, vec) != 0:
+                return None
+            return sum(x & 1 for x in vec.raw) * mmap.PAGESIZE
+        finally:
+            mm.close()
+
+
+def create_data(directory, n_files, size):
+    block = os.urandom(1024 * 1024)
+    for i in range(n_files):
+        with open(os.path.join(directory, "file_{0:04d}".format(i)),
+                  "wb") as f:
+            for _ in range(size // len(block)):
+                f.write(block)
+            f.write(block[:size % len(block)])
+
+
+def run(directory):
+    print("{0:10} {1:>12} {2:>18}".format("I/O mode", "MB/s",
+                                          "page cache (MB)"))
+    for io_mode in DataIntegrityFingerprint.IO_MODES:
+        dif = DataIntegrityFingerprint(directory, io_mode=io_mode)
+        files = dif.get_files()
+        for filename in files:  # evict data of previous run
+            with open(filename, "rb") as f:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        start = time.time()
+        dif.generate()
+        elapsed = time.time() - start
+        total = dif.stats["bytes"]
+        try:
+            cached = sum(cached_bytes(x) for x in files)
+        except (AttributeError, OSError, TypeError):
+            cached = None
+        print("{0:10} {1:12.1f} {2:>18}".format(
+            io_mode, total / elapsed / 1e6,
+            "n/a" if cached is None else "{0:.1f}".format(cached / 1e6)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("DIRECTORY", nargs="?", default=None,
+                        help="data directory (default: temporary test data)")
+    parser.add_argument("-n", "--files", type=int, default=8,
+                        help="number of test files (default=8)")
+    parser.add_argument("-s", "--size", type=int, default=128,
+                        help="size of test files in MB (default=128)")
+    args = parser.parse_args()
+
+    if not hasattr(os, "posix_fadvise"):
+        print("posix_fadvise is not available on this platform.")
+        sys.exit()
+
+    if args.DIRECTORY is not None:
+        run(args.DIRECTORY)
+    else:
+        # not in /tmp, which is often a tmpfs without O_DIRECT support
+        tmp_dir = tempfile.mkdtemp(dir=os.getcwd())
+        try:
+            create_data(tmp_dir, args.files, args.size * 1024 * 1024)
+            run(tmp_dir)
+        finally:
+            shutil.rmtree(tmp_dir)
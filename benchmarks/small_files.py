@@ -0,0 +1,71 @@
+"""Benchmark of hashing many tiny files.
+
+Creates a synthetic tree of tiny files (default: 1,000,000 files of 0 to 4
+KiB in directories of 1,000 files) and compares hashing with one file per
+task to hashing batches of files.
+
+Usage: python3 small_files.py [-n FILES] [-e EXECUTION] [DIRECTORY]
+
+"""
+
+
+import os
+import time
+import random
+import argparse
+import tempfile
+import shutil
+
+from dataintegrityfingerprint import DataIntegrityFingerprint
+from dataintegrityfingerprint import dif as dif_module
+
+
+def create_tree(directory, n_files, files_per_directory=1000):
+    rnd = random.Random(42)
+    data = os.urandom(4096)
+    for i in range(n_files):
+        subdir = os.path.join(directory,
+                              "dir_{0:05d}".format(i // files_per_directory))
+        if i % files_per_directory == 0:
+            os.makedirs(subdir)
+        with open(os.path.join(subdir, "file_{0:07d}".format(i)), "wb") as f:
+            f.write(data[:rnd.randint(0, len(data))])
+
+
+def run(directory, execution):
+    print("{0:12} {1:>10} {2:>12} {3:>10}".format("batch size", "seconds",
+                                                  "files/s", "tasks"))
+    default_batch_size = dif_module.BATCH_SIZE
+    for batch_size in (1, default_batch_size):
+        dif_module.BATCH_SIZE = batch_size
+        dif = DataIntegrityFingerprint(directory, execution=execution)
+        dif.generate()
+        stats = dif.stats
+        print("{0:12} {1:10.2f} {2:12.0f} {3:>10}".format(
+            batch_size, stats["elapsed"], stats["files"] / stats["elapsed"],
+            stats["batches"]))
+    dif_module.BATCH_SIZE = default_batch_size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("DIRECTORY", nargs="?", default=None,
+                        help="data directory (default: synthetic tree)")
+    parser.add_argument("-n", "--files", type=int, default=1000000,
+                        help="number of files of the synthetic tree " +
+                             "(default=1000000)")
+    parser.add_argument("-e", "--execution", type=str, default="processes",
+                        choices=DataIntegrityFingerprint.EXECUTION_MODES,
+                        help="execution mode (default=processes)")
+    args = parser.parse_args()
+
+    if args.DIRECTORY is not None:
+        run(args.DIRECTORY, args.execution)
+    else:
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            print("Creating {0} files...".format(args.files))
+            create_tree(tmp_dir, args.files)
+            run(tmp_dir, args.execution)
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,231 @@
+"""Reading data from tar and zip archives without extraction.
+
+Members are listed with paths normalized like those of an extracted tree,
+so that the DIF of an archive equals the DIF of its extracted content, and
+their content is streamed block by block.
+
+Archive types:
+
+* "zip"            -- members can be read independently (in parallel)
+* "tar"            -- uncompressed tar; regular members are read directly
+                      at their offset in the archive (in parallel)
+* "compressed_tar" -- gzip, bzip2 or xz compressed tar; members can only be
+                      read sequentially in the order of the archive
+
+Hard links and symbolic links to files within a tar archive are resolved
+(as if they were followed after extraction); links to directories, symbolic
+links in zip archives and members with unsafe paths (e.g. "../file") are
+skipped.
+
+"""
+
+
+import os
+import stat
+import tarfile
+import zipfile
+import posixpath
+import threading
+
+from . import file_reader
+
+
+ARCHIVE_TYPES = ["zip", "tar", "compressed_tar"]
+
+# archives opened by this process and thread: (path, type, thread) -> object
+_open_archives = {}
+
+
+def archive_type(path):
+    """Get the type of an archive.
+
+    Parameters
+    ----------
+    path : str
+        the path to the file
+
+    Returns
+    -------
+    archive_type : str or None
+        one of `ARCHIVE_TYPES` (None, if the file is not an archive)
+
+    """
+
+    if not os.path.isfile(path):
+        return None
+    if zipfile.is_zipfile(path):
+        return "zip"
+    for mode, rtn in (("r:", "tar"), ("r:*", "compressed_tar")):
+        try:
+            with tarfile.open(path, mode):
+                return rtn
+        except (tarfile.TarError, OSError, EOFError):
+            pass
+    return None
+
+
+def normalize_path(name):
+    """Normalize the name of a member to a path relative to the data.
+
+    Returns
+    -------
+    path : str or None
+        the path with "/" as separator (None, if the path points outside
+        of the archive)
+
+    """
+
+    path = posixpath.normpath(name.lstrip("/"))
+    if path in (".", "..") or path.startswith("../"):
+        return None
+    return path
+
+
+def list_members(path, archive_type):
+    """List the files in an archive.
+
+    Parameters
+    ----------
+    path : str
+        the path to the archive
+    archive_type : str
+        one of `ARCHIVE_TYPES`
+
+    Returns
+    -------
+    members : dict
+        `(size, locator)` for each normalized path, where the locator is
+        used by `read_member`
+
+    """
+
+    rtn = {}
+    if archive_type == "zip":
+        for info in _open(path, archive_type).infolist():
+            if info.is_dir() or \
+                    stat.S_ISLNK(info.external_attr >> 16):
+                continue
+            name = normalize_path(info.filename.replace("\\", "/"))
+            if name is not None:
+                rtn[name] = (info.file_size, info.filename)
+    else:
+        archive = _open(path, archive_type)
+        for info in archive.getmembers():
+            name = normalize_path(info.name)
+            if name is None:
+                continue
+            if info.isfile() and not info.issparse():
+                if archive_type == "tar":
+                    locator = (info.offset_data, info.size)
+                else:
+                    locator = info
+                rtn[name] = (info.size, locator)
+            elif info.isfile() or info.islnk() or info.issym():
+                try:
+                    # the resolution of extractfile()
+                    target = archive._find_link_target(info) \
+                        if not info.isfile() else info
+                except KeyError:
+                    continue
+                if target.isfile():
+                    # TarInfo objects are only used by the process that
+                    # listed them, i.e. for sequential reading
+                    rtn[name] = (target.size, info.name
+                                 if archive_type == "tar" else info)
+            else:
+                rtn.pop(name, None)  # e.g. replaced by a directory
+    return rtn
+
+
+def read_member(path, archive_type, locator, block_size=None):
+    """Read the content of a member block by block.
+
+    Parameters
+    ----------
+    path : str
+        the path to the archive
+    archive_type : str
+        one of `ARCHIVE_TYPES`
+    locator : object
+        the locator of the member (see `list_members`)
+    block_size : int, optional
+        the size of the blocks (default: `file_reader.BLOCK_SIZE`)
+
+    Yields
+    ------
+    block : bytes
+
+    """
+
+    if block_size is None:
+        block_size = file_reader.BLOCK_SIZE
+    if isinstance(locator, tuple):
+        # uncompressed tar: read directly at the offset
+        offset, size = locator
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            os.lseek(fd, offset, os.SEEK_SET)
+            while size > 0:
+                block = os.read(fd, min(block_size, size))
+                if not block:
+                    raise EOFError("Unexpected end of archive {0}".format(
+                        path))
+                size -= len(block)
+                yield block
+        finally:
+            os.close(fd)
+        return
+
+    archive = _open(path, archive_type)
+    if archive_type == "zip":
+        f = archive.open(locator)
+    else:
+        f = archive.extractfile(locator)
+    with f:
+        for block in iter(lambda: f.read(block_size), b''):
+            yield block
+
+
+def close_archives(path=None, current_thread=False):
+    """Close the archives opened by this process.
+
+    Parameters
+    ----------
+    path : str, optional
+        only close this archive (default: None, i.e. all archives)
+    current_thread : bool, optional
+        only close the archives opened by the current thread (and by
+        threads that have finished, e.g. the readers of `read_timeout`;
+        default: False)
+
+    """
+
+    pid = os.getpid()
+    ident = threading.current_thread().ident
+    alive = set(x.ident for x in threading.enumerate())
+    for key in list(_open_archives):
+        if path is not None and key[0] != path:
+            continue
+        if current_thread and key[2] == pid and key[3] != ident and \
+                key[3] in alive:
+            continue
+        archive = _open_archives.pop(key, None)
+        if archive is not None:
+            archive.close()
+
+
+def _open(path, archive_type):
+    # archives are opened once per process and thread (a forked process
+    # must not use the inherited archives, which share the file offset)
+    key = (path, archive_type, os.getpid(), threading.current_thread().ident)
+    try:
+        return _open_archives[key]
+    except KeyError:
+        if archive_type == "zip":
+            archive = zipfile.ZipFile(path)
+        elif archive_type == "tar":
+            archive = tarfile.open(path, "r:")
+        else:
+            archive = tarfile.open(path, "r:*")
+        _open_archives[key] = archive
+        return archive
@@ -0,0 +1,128 @@
+"""Fingerprinting many data directories with one shared pool of workers.
+
+Starting an interpreter and a pool of workers per data directory dominates
+the runtime for many small data sets. `fingerprint_many` hashes all data
+directories with one pool: several directories are walked and generated
+concurrently (each by a thread of the main process) and their files are
+hashed by the shared workers. The result of each directory is returned as
+soon as it is finished.
+
+Example
+-------
+for result in fingerprint_many(["dataset_1", "dataset_2"]):
+    print(result["path"], result["dif"])
+
+"""
+
+
+import time
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+from .dif import DataIntegrityFingerprint, _init_worker
+
+
+# number of data directories that are generated concurrently
+CONCURRENT_ROOTS = 4
+
+
+def fingerprint_many(roots, execution="processes", workers=None,
+                     concurrent_roots=None, rate_limiter=None, **kwargs):
+    """Calculate the DIFs of many data directories.
+
+    Parameters
+    ----------
+    roots : iterable of str
+        the paths to the data directories (or archives); an iterator is
+        consumed lazily
+    execution : str, optional
+        "processes", "threads" or "serial" (default: "processes")
+    workers : int, optional
+        the number of workers of the shared pool (default: number of CPUs)
+    concurrent_roots : int, optional
+        the number of data directories generated concurrently (default:
+        `CONCURRENT_ROOTS`)
+    rate_limiter : throttle.RateLimiter, optional
+        limits the bytes and files read per second by all workers
+    **kwargs
+        further arguments of `DataIntegrityFingerprint` (e.g.
+        `hash_algorithm` or `exclude`)
+
+    Yields
+    ------
+    result : dict
+        the `path`, the `dif`, the `hash_algorithm`, the number of `files`
+        and `bytes`, the `started` time (seconds since the epoch) and the
+        `elapsed` time of generating in seconds of each data directory (in
+        the order in which they are finished) and the `file_errors`, i.e.
+        the files that could not be read (see `on_error`); if a data
+        directory cannot be fingerprinted (or none of its files could be
+        read), the `path` and the `error`
+
+    """
+
+    if execution not in ("serial", "threads", "processes"):
+        raise ValueError("{0} is not a supported execution mode.".format(
+            execution))
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if concurrent_roots is None:
+        concurrent_roots = CONCURRENT_ROOTS
+    if execution == "processes":
+        # the rate limiter is shared memory and has to be inherited
+        pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                    initargs=(rate_limiter,))
+    elif execution == "threads":
+        pool = ThreadPool(workers)
+    else:
+        pool = None
+
+    running = set()
+
+    def generate(root):
+        started = time.time()
+        try:
+            dif = DataIntegrityFingerprint(
+                root, execution=execution, workers=workers, pool=pool,
+                rate_limiter=rate_limiter, **kwargs)
+            running.add(dif)
+            try:
+                dif.generate()
+            finally:
+                running.discard(dif)
+            stats = dif.stats
+            # an empty hash list would be generated again by `dif.dif`
+            hashed = stats.get("files", 0) - stats.get("errors", 0)
+            checksum = dif.dif if hashed > 0 else None
+        except Exception as err:
+            error = type(err).__name__
+            if str(err):
+                error += ": {0}".format(err)
+            return {"path": root, "error": error}
+        if checksum is None and stats.get("errors"):
+            return {"path": root, "error": "No file could be read",
+                    "file_errors": dif.errors}
+        return {"path": root, "dif": checksum,
+                "hash_algorithm": dif.hash_algorithm,
+                "files": stats.get("files"), "bytes": stats.get("bytes"),
+                "started": started, "elapsed": stats.get("elapsed"),
+                "file_errors": dif.errors}
+
+    drivers = ThreadPool(concurrent_roots)
+    completed = False
+    try:
+        for result in drivers.imap_unordered(generate, roots):
+            yield result
+        completed = True
+    finally:
+        if not completed:
+            for dif in list(running):
+                dif.cancel()
+        drivers.terminate()
+        drivers.join()
+        if pool is not None:
+            if completed:
+                pool.close()
+            else:
+                pool.terminate()
+            pool.join()
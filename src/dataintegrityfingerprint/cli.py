@@ -8,6 +8,8 @@ Invoke with `python3 -m dataintegrityfingerprint` or
 
 import os
 import sys
+import json
+import time
 import argparse
 
 from . import DataIntegrityFingerprint
@@ -32,8 +34,27 @@ Version: v{0}""".format(__version__),
 Oliver Lindemann <oliver@expyriment.org>
 Florian Krause <florian@expyriment.org""")
 
-    parser.add_argument("PATH", nargs='?', default=None,
-                        help="the path to the data directory")
+    parser.add_argument("PATH", nargs='*', default=None,
+                        help="the path to the data directory (or to a " +
+                             "tar or zip archive of the data, or an " +
+                             "s3://BUCKET/PATH URL); several PATHs " +
+                             "require --batch")
+    parser.add_argument("-b", "--batch", dest="batch", action="store_true",
+                        help="fingerprint each PATH with one shared pool " +
+                             "of workers and print a JSON line per PATH " +
+                             "(dif, files, bytes, timings) as soon as it " +
+                             "is finished",
+                        default=False)
+    parser.add_argument("--roots-file", metavar="FILE", type=str,
+                        help="with --batch, read further PATHs from FILE " +
+                             "(one per line, - for stdin)",
+                        default=None)
+    parser.add_argument("--endpoint-url", metavar="URL", type=str,
+                        help="the URL of the S3-compatible API of s3:// " +
+                             "PATHs (default=AWS_ENDPOINT_URL or AWS S3); " +
+                             "credentials are read from AWS_ACCESS_KEY_ID " +
+                             "and AWS_SECRET_ACCESS_KEY",
+                        default=None)
     parser.add_argument("-f", "--from-checksums-file",
                         dest="fromchecksumsfile", action="store_true",
                         help="Calculate dif from checksums file. " +
@@ -51,6 +72,10 @@ Florian Krause <florian@expyriment.org""")
                         action="store_true",
                         help="print dif only",
                         default=False)
+    parser.add_argument("-u", "--duplicates", dest="duplicates",
+                        action="store_true",
+                        help="print groups of files with identical content",
+                        default=False)
     parser.add_argument("-G", "--gui", dest="gui",
                         action="store_true",
                         help="open graphical user interface",
@@ -63,14 +88,154 @@ Florian Krause <florian@expyriment.org""")
                         dest="savechecksumsfile", action="store_true",
                         help="save checksums to file",
                         default=False)
+    parser.add_argument("--extended", dest="extended", action="store_true",
+                        help="with -s, also save size and modification " +
+                             "time of each file for quick checks",
+                        default=False)
+    parser.add_argument("-q", "--quick-check", metavar="CHECKSUMSFILE",
+                        type=str,
+                        help="compare size and modification time of files " +
+                             "to an extended CHECKSUMSFILE (without " +
+                             "hashing) and list files to be rehashed",
+                        default=None)
+    parser.add_argument("--audit", metavar="CHECKSUMSFILE", type=str,
+                        help="rehash a random sample of the files in " +
+                             "CHECKSUMSFILE and report the mismatch rate",
+                        default=None)
+    parser.add_argument("--sample", metavar="N", type=float,
+                        help="the number of files to audit, or the " +
+                             "fraction of files if smaller than 1 " +
+                             "(default=1000)",
+                        default=None)
+    parser.add_argument("--seed", metavar="SEED", type=int,
+                        help="the seed of the audit sample " +
+                             "(default=random)",
+                        default=None)
+    parser.add_argument("--size-weighted", dest="size_weighted",
+                        action="store_true",
+                        help="sample files proportional to their size",
+                        default=False)
+    parser.add_argument("--save-index", dest="save_index",
+                        action="store_true",
+                        help="save checksums to a manifest index for fast " +
+                             "comparisons and lookups",
+                        default=False)
+    parser.add_argument("--export", metavar="FORMAT", type=str,
+                        choices=DataIntegrityFingerprint.MANIFEST_FORMATS,
+                        help="export checksums to a manifest in FORMAT: " +
+                             ", ".join(
+                                 DataIntegrityFingerprint.MANIFEST_FORMATS),
+                        default=None)
+    parser.add_argument("--checksums-format", metavar="FORMAT", type=str,
+                        choices=DataIntegrityFingerprint.MANIFEST_FORMATS,
+                        help="format of the checksums file given by -f or " +
+                             "-d (default=dif)",
+                        default="dif")
     parser.add_argument("-d", "--diff-checksums-file", metavar="CHECKSUMSFILE",
                         type=str,
                         help="Calculate differences of checksums to " +
                              "CHECKSUMSFILE")
+    parser.add_argument("-i", "--include", metavar="PATTERN",
+                        action="append",
+                        help="only hash files matching PATTERN (glob, or " +
+                             "regular expression if prefixed with 're:'; " +
+                             "can be given multiple times)",
+                        default=None)
+    parser.add_argument("-x", "--exclude", metavar="PATTERN",
+                        action="append",
+                        help="skip files and directories matching PATTERN " +
+                             "(can be given multiple times)",
+                        default=None)
+    parser.add_argument("--ignore-file", metavar="IGNOREFILE", type=str,
+                        help="read exclude patterns from IGNOREFILE " +
+                             "(relative to PATH, e.g. {0})".format(
+                                 DataIntegrityFingerprint.IGNORE_FILENAME),
+                        default=None)
     parser.add_argument("-n", "--no-multi-processing", dest="nomultiprocess",
                         action="store_true",
                         help="switch of multi processing",
                         default="")
+    parser.add_argument("-e", "--execution", metavar="MODE", type=str,
+                        choices=DataIntegrityFingerprint.EXECUTION_MODES,
+                        help="execution mode: " +
+                             ", ".join(
+                                 DataIntegrityFingerprint.EXECUTION_MODES) +
+                             " (default=auto)",
+                        default=None)
+    parser.add_argument("-j", "--workers", metavar="N", type=int,
+                        help="the number of threads or processes " +
+                             "(default=chosen automatically)",
+                        default=None)
+    parser.add_argument("--io-mode", metavar="IOMODE", type=str,
+                        choices=DataIntegrityFingerprint.IO_MODES,
+                        help="I/O mode: " +
+                             ", ".join(DataIntegrityFingerprint.IO_MODES) +
+                             " (default=buffered; nocache and direct do " +
+                             "not pollute the page cache)",
+                        default="buffered")
+    parser.add_argument("--per-device", metavar="N", type=int,
+                        help="read at most N files concurrently from each " +
+                             "device (default=unlimited)",
+                        default=None)
+    parser.add_argument("--read-order", metavar="ORDER", type=str,
+                        choices=DataIntegrityFingerprint.READ_ORDERS,
+                        help="order of reads on each device: " +
+                             ", ".join(DataIntegrityFingerprint.READ_ORDERS) +
+                             " (default=walk; inode and extent speed up " +
+                             "spinning disks)",
+                        default="walk")
+    parser.add_argument("--max-mb-per-second", metavar="MB", type=float,
+                        help="limit reading to MB megabytes per second " +
+                             "(default=unlimited)",
+                        default=None)
+    parser.add_argument("--max-files-per-second", metavar="N", type=float,
+                        help="limit reading to N files per second " +
+                             "(default=unlimited)",
+                        default=None)
+    parser.add_argument("--on-error", metavar="POLICY", type=str,
+                        help="what to do with files that cannot be read: " +
+                             "'fail' (default), 'skip' (leave them out of " +
+                             "the dif, report them and exit with status " +
+                             "2) or 'retry' (retry with backoff, then skip " +
+                             "them)",
+                        choices=DataIntegrityFingerprint.ERROR_POLICIES,
+                        default="fail")
+    parser.add_argument("--retries", metavar="N", type=int,
+                        help="the number of retries with --on-error retry " +
+                             "(default=3)",
+                        default=3)
+    parser.add_argument("--read-timeout", metavar="SECONDS", type=float,
+                        help="treat reads that take longer than SECONDS " +
+                             "per block as errors, e.g. on hung network " +
+                             "mounts (default=unlimited)",
+                        default=None)
+    parser.add_argument("--memory-budget", metavar="MB", type=float,
+                        help="sort the hash list externally using at " +
+                             "most about MB megabytes of memory (prints " +
+                             "the dif or saves the checksums with -s)",
+                        default=None)
+    parser.add_argument("--metrics-port", metavar="PORT", type=int,
+                        help="serve Prometheus metrics of the generation " +
+                             "at http://127.0.0.1:PORT/metrics",
+                        default=None)
+    parser.add_argument("--metrics-file", metavar="FILE", type=str,
+                        help="write Prometheus metrics of the generation " +
+                             "to FILE every 15 seconds (e.g. for the " +
+                             "textfile collector of the node exporter)",
+                        default=None)
+    parser.add_argument("-v", "--verbose", dest="verbose",
+                        action="store_true",
+                        help="print execution plan and statistics",
+                        default=False)
+    parser.add_argument("-w", "--watch", dest="watch",
+                        action="store_true",
+                        help="watch the data directory and print the dif " +
+                             "whenever files change (rewrites the " +
+                             "checksums file, if -s is given)",
+                        default=False)
+    parser.add_argument("--interval", metavar="SECONDS", type=float,
+                        help="the watch interval in seconds (default=1.0)",
+                        default=1.0)
     parser.add_argument("-p", "--progress", dest="progressbar",
                         action="store_true",
                         help="show progressbar",
@@ -97,19 +262,97 @@ Florian Krause <florian@expyriment.org""")
 
     if args['gui']:
         from .gui import start_gui
-        start_gui(data_dir=args["PATH"], hash_algorithm=args["algorithm"])
+        start_gui(data_dir=args["PATH"][0] if args["PATH"] else None,
+                  hash_algorithm=args["algorithm"])
         sys.exit()
 
-    if args["PATH"] is None:
+    rate_limiter = None
+    if args['max_mb_per_second'] or args['max_files_per_second']:
+        from .throttle import RateLimiter
+        rate_limiter = RateLimiter(
+            bytes_per_second=(args['max_mb_per_second'] or 0) * 1e6,
+            files_per_second=args['max_files_per_second'])
+
+    if args['batch'] or args['roots_file']:
+        sys.exit(batch(args, rate_limiter))
+
+    if not args["PATH"]:
         print("Use -G to launch the GUI or -h for details about command line interface")
         sys.exit()
+    if len(args["PATH"]) > 1:
+        parser.error("several PATHs require --batch")
+
+    data, storage = args["PATH"][0], None
+    if data.startswith("s3://"):
+        from .storage import from_url
+        storage, data = from_url(data, endpoint_url=args['endpoint_url'])
+
+    metrics = None
+    if args['metrics_port'] is not None or args['metrics_file']:
+        metrics = start_metrics(args)
 
     dif = DataIntegrityFingerprint(
-        data=args["PATH"],
+        data=data,
         from_checksums_file=args['fromchecksumsfile'],
         hash_algorithm=args["algorithm"],
         multiprocessing=not(args['nomultiprocess']),
-        allow_non_cryptographic_algorithms=args['noncrypto'])
+        allow_non_cryptographic_algorithms=args['noncrypto'],
+        execution=args['execution'],
+        workers=args['workers'],
+        include=args['include'],
+        exclude=args['exclude'],
+        ignore_file=args['ignore_file'],
+        io_mode=args['io_mode'],
+        max_workers_per_device=args['per_device'],
+        read_order=args['read_order'],
+        rate_limiter=rate_limiter,
+        checksums_format=args['checksums_format'],
+        record_stats=args['extended'],
+        storage=storage,
+        metrics=metrics,
+        on_error=args['on_error'],
+        retries=args['retries'],
+        read_timeout=args['read_timeout'])
+
+    if args['watch']:
+        watch(dif, args)
+        sys.exit()
+
+    if args['quick_check']:
+        candidates = dif.quick_check(args['quick_check'])
+        for prefix, key in (("M ", "modified"), ("- ", "missing"),
+                            ("+ ", "new")):
+            for path in candidates[key]:
+                print(prefix + path)
+        sys.exit()
+
+    if args['audit']:
+        report = dif.audit(args['audit'], sample_size=args['sample'],
+                           seed=args['seed'],
+                           weighted=args['size_weighted'],
+                           checksums_format=args['checksums_format'])
+        print_audit(report)
+        sys.exit()
+
+    if args['memory_budget']:
+        outfile = None
+        if args['savechecksumsfile']:
+            extension = "".join(
+                x for x in dif.hash_algorithm.lower() if x.isalnum())
+            outfile = os.path.split(dif.data)[-1] + ".{0}".format(extension)
+        master_hash = dif.generate_external(
+            outfile, memory_budget=args['memory_budget'] * 1e6,
+            progress=progress if args['progressbar'] else None)
+        if args['progressbar']:
+            print("")
+        if outfile is not None:
+            print("Checksums have been written to '{0}'.".format(outfile))
+        else:
+            print(master_hash)
+        status = print_errors(dif)
+        if args['verbose']:
+            print_stats(dif.stats)
+        sys.exit(status)
 
     if not args['fromchecksumsfile'] and args['progressbar']:
         dif.generate(progress=progress)
@@ -125,16 +368,28 @@ Florian Krause <florian@expyriment.org""")
             answer = input(
                 "'{0}' already exists! Overwrite? [y/N]: ".format(outfile))
         if answer == "y":
-            dif.save_checksums()
+            dif.save_checksums(outfile, extended=args['extended'])
             print("Checksums have been written to '{0}'.".format(outfile))
         else:
             print("Checksums have NOT been written.")
 
+    elif args['save_index']:
+        outfile = dif.save_index()
+        print("Manifest index has been written to '{0}'.".format(outfile))
+
+    elif args['export']:
+        outfile = dif.export_manifest(manifest_format=args['export'])
+        print("Manifest has been written to '{0}'.".format(outfile))
+
     elif args['diff_checksums_file']:
-        diff = dif.diff_checksums(args['diff_checksums_file'])
+        diff = dif.diff_checksums(args['diff_checksums_file'],
+                                  checksums_format=args['checksums_format'])
         if diff != "":
             print(diff)
 
+    elif args['duplicates']:
+        print("\n\n".join("\n".join(x) for x in dif.duplicates()))
+
     elif args['difonly']:
         print(dif)
     elif args['checksums']:
@@ -147,3 +402,158 @@ Florian Krause <florian@expyriment.org""")
         print("Algorithm: {0}".format(dif.hash_algorithm))
         print("")
         print("DIF [{}]: {}".format(dif.hash_algorithm, dif))
+
+    status = print_errors(dif)
+    if args['verbose']:
+        print_stats(dif.stats)
+    sys.exit(status)
+
+
+def batch(args, rate_limiter=None):
+    """Print a JSON line with the DIF of each PATH.
+
+    Returns
+    -------
+    status : int
+        the exit status (1, if any PATH could not be fingerprinted; 2, if
+        files have been skipped)
+
+    """
+
+    from .batch import fingerprint_many
+
+    def roots():
+        for path in args["PATH"]:
+            yield path
+        if args['roots_file'] is not None:
+            f = sys.stdin if args['roots_file'] == "-" else \
+                open(args['roots_file'], encoding="utf-8")
+            with f:
+                for line in f:
+                    if line.strip():
+                        yield line.rstrip("\r\n")
+
+    execution = args['execution']
+    if execution in (None, "auto"):
+        execution = "serial" if args['nomultiprocess'] else "processes"
+
+    status = 0
+    for result in fingerprint_many(
+            roots(), execution=execution, workers=args['workers'],
+            rate_limiter=rate_limiter,
+            hash_algorithm=args["algorithm"],
+            allow_non_cryptographic_algorithms=args['noncrypto'],
+            include=args['include'], exclude=args['exclude'],
+            ignore_file=args['ignore_file'], io_mode=args['io_mode'],
+            on_error=args['on_error'], retries=args['retries'],
+            read_timeout=args['read_timeout']):
+        if "error" in result:
+            status = 1
+        elif result.get("file_errors") and status == 0:
+            status = 2
+        print(json.dumps(result, ensure_ascii=False))
+        sys.stdout.flush()
+    return status
+
+
+def start_metrics(args):
+    """Start exporting metrics (until the program exits)."""
+
+    import atexit
+    from .metrics import Metrics, MetricsServer, TextfileExporter
+
+    metrics = Metrics()
+    if args['metrics_port'] is not None:
+        server = MetricsServer(metrics, port=args['metrics_port'])
+        server.start()
+        atexit.register(server.stop)
+    if args['metrics_file']:
+        exporter = TextfileExporter(metrics, args['metrics_file'])
+        exporter.start()
+        atexit.register(exporter.stop)
+    return metrics
+
+
+def watch(dif, args):
+    """Print the DIF whenever the data changes."""
+
+    from .watch import Watcher
+
+    if args['fromchecksumsfile']:
+        print("Watch mode requires a data directory.")
+        return
+
+    checksums_file = None
+    if args['savechecksumsfile']:
+        extension = "".join(
+            x for x in dif.hash_algorithm.lower() if x.isalnum())
+        checksums_file = os.path.split(dif.data)[-1] + ".{0}".format(
+            extension)
+
+    def callback(dif):
+        print("{0} DIF [{1}]: {2}".format(time.strftime("%Y-%m-%d %H:%M:%S"),
+                                         dif.hash_algorithm, dif))
+        sys.stdout.flush()
+
+    watcher = Watcher(dif, checksums_file=checksums_file,
+                      interval=args['interval'])
+    try:
+        watcher.run(callback=callback)
+    except KeyboardInterrupt:
+        pass
+
+
+def print_audit(report):
+    """Print the report of an audit."""
+
+    for path in report["mismatches"]:
+        print("M " + path)
+    for path in report["missing"]:
+        print("- " + path)
+    for error in report["errors"]:
+        print("E {0}: {1}".format(error["path"], error["error"]))
+    print("Seed: {0}".format(report["seed"]))
+    print("Sampled: {0} of {1} files ({2} bytes)".format(
+        report["sampled"], report["population"], report["bytes"]))
+    print("Mismatches: {0}".format(len(report["mismatches"]) +
+                                   len(report["missing"]) +
+                                   len(report["errors"])))
+    print("Mismatch rate: {0:.6f} ({1:.0%} confidence interval: " \
+          "{2:.6f} to {3:.6f})".format(report["rate"], report["confidence"],
+                                       report["lower"], report["upper"]))
+
+
+def print_errors(dif):
+    """Print the files that could not be read to stderr.
+
+    Returns
+    -------
+    status : int
+        the exit status (2, if files have been skipped)
+
+    """
+
+    for error in dif.errors:
+        sys.stderr.write("E {0}: {1}\n".format(error["path"], error["error"]))
+    return 2 if dif.errors else 0
+
+
+def print_stats(stats):
+    """Print the statistics of a DIF generation to stderr."""
+
+    if "execution" in stats:
+        sys.stderr.write("Execution: {0} ({1} worker{2})\n".format(
+            stats["execution"], stats["workers"],
+            "s" if stats["workers"] != 1 else ""))
+    if "devices" in stats:
+        sys.stderr.write("Devices: {0}\n".format(stats["devices"]))
+    if "io_mode" in stats:
+        sys.stderr.write("I/O mode: {0}\n".format(stats["io_mode"]))
+    if "files" in stats:
+        sys.stderr.write("Files: {0}\n".format(stats["files"]))
+    if stats.get("bytes") is not None:
+        sys.stderr.write("Bytes: {0}\n".format(stats["bytes"]))
+    if stats.get("errors"):
+        sys.stderr.write("Errors: {0}\n".format(stats["errors"]))
+    if "elapsed" in stats:
+        sys.stderr.write("Elapsed: {0:.3f} s\n".format(stats["elapsed"]))
@@ -6,10 +6,30 @@ Import as `dataintegrityfingerprint`.
 
 
 import os
+import math
+import time
+import zlib
+import random
+import itertools
 import codecs
+import functools
+import tarfile
+import zipfile
+import threading
+import http.client
 import multiprocessing
+from multiprocessing.pool import ThreadPool
 
 from .openssl_hash_algorithm import OpenSSLHashAlgorithm
+from .path_filter import PathFilter, read_ignore_file
+from . import file_reader
+from . import archive_reader
+from . import digest_buffer
+from . import external_sort
+from . import manifest_formats
+from . import manifest_index
+from .path_store import HashList
+from .scheduler import DeviceScheduler, READ_ORDERS
 from .zlib_hash_algorithm import ZlibHashAlgorithm
 
 
@@ -27,16 +47,30 @@ class DataIntegrityFingerprint:
     CRYPTOGRAPHIC_ALGORITHMS = OpenSSLHashAlgorithm.SUPPORTED_ALGORITHMS
     NON_CRYPTOGRAPHIC_ALGORITHMS = ZlibHashAlgorithm.SUPPORTED_ALGORITHMS
     CHECKSUM_FILENAME_SEPARATOR = "  "
+    EXECUTION_MODES = ["auto", "serial", "threads", "processes"]
+    IGNORE_FILENAME = ".difignore"
+    IO_MODES = file_reader.IO_MODES
+    READ_ORDERS = READ_ORDERS
+    ERROR_POLICIES = ["fail", "skip", "retry"]
+    MANIFEST_FORMATS = manifest_formats.FORMATS
+    EXTENDED_MANIFEST_EXTENSION = ".jsonl"
 
     def __init__(self, data, from_checksums_file=False,
                  hash_algorithm="SHA-256", multiprocessing=True,
-                 allow_non_cryptographic_algorithms=False):
+                 allow_non_cryptographic_algorithms=False,
+                 execution=None, workers=None, include=None, exclude=None,
+                 ignore_file=None, io_mode="buffered",
+                 max_workers_per_device=None, read_order="walk",
+                 rate_limiter=None, checksums_format="dif",
+                 record_stats=False, storage=None, pool=None, metrics=None,
+                 on_error="fail", retries=3, read_timeout=None):
         """Create a DataIntegrityFingerprint object.
 
         Parameters
         ----------
         data : str
-            the path to the data
+            the path to the data (a directory, or a tar or zip archive,
+            which is read without extraction; see `archive_reader` module)
         from_checksums_file : bool
             data argument is a checksums file
         hash_algorithm : str
@@ -47,6 +81,76 @@ class DataIntegrityFingerprint:
         allow_non_cryptographic_algorithms : bool
             set True only, if you need non cryptographic algorithms (see
             notes!)
+        execution : str
+            one of `DataIntegrityFingerprint.EXECUTION_MODES` (optional,
+            default: "auto" if multiprocessing is True, otherwise "serial")
+            "auto" chooses serial, threaded or process execution based on
+            the number and the total size of the files
+            (processes write the digests into shared memory, see
+            `digest_buffer` module)
+        workers : int
+            the number of threads or processes (optional, default: chosen
+            automatically)
+        include : list of str
+            only hash files matching one of these rules (optional, see
+            `path_filter` module)
+        exclude : list of str
+            skip files and directories matching one of these rules
+            (optional, see `path_filter` module)
+        ignore_file : str
+            file with further exclude rules (optional, e.g.
+            `DataIntegrityFingerprint.IGNORE_FILENAME`); a relative path is
+            relative to the data directory
+        io_mode : str
+            one of `DataIntegrityFingerprint.IO_MODES` (optional, default:
+            "buffered"); "nocache" and "direct" avoid polluting the page
+            cache (see `file_reader` module)
+        max_workers_per_device : int
+            the maximum number of files that are read concurrently from one
+            device (optional, default: unlimited)
+        read_order : str
+            one of `DataIntegrityFingerprint.READ_ORDERS` (optional,
+            default: "walk"); "inode" and "extent" order the reads on each
+            device by inode number or physical offset (see `scheduler`
+            module), which speeds up reading from spinning disks
+        rate_limiter : throttle.RateLimiter
+            limits the bytes and files read per second by all workers
+            (optional, default: unlimited); the limits can be changed while
+            generating
+        checksums_format : str
+            the format of the checksums file, one of
+            `DataIntegrityFingerprint.MANIFEST_FORMATS` (optional, default:
+            "dif"; see `manifest_formats` module)
+        record_stats : bool
+            record size and modification time of the files while walking
+            the data directory (optional, default: False), so that they
+            describe the hashed state in an extended checksums file (see
+            `save_checksums`)
+        storage : storage.Storage
+            read the data from a storage backend (optional, e.g. an
+            `storage.S3Storage`); `data` is then the path of the data
+            directory within the storage ("" for all files)
+        pool : multiprocessing.Pool or ThreadPool
+            a pool of workers shared with other objects (optional, see
+            `batch` module); the execution mode follows the type of the
+            pool, which is not closed after generating (cancelling does
+            not terminate it, either)
+        metrics : metrics.Metrics
+            updated while generating, e.g. to be exported for monitoring
+            (optional, see `metrics` module)
+        on_error : str
+            one of `DataIntegrityFingerprint.ERROR_POLICIES` (optional,
+            default: "fail"); "fail" raises the error of a file that cannot
+            be read, "skip" leaves it out of the hash list and records it
+            in `errors`, "retry" retries it with exponential backoff before
+            skipping it
+        retries : int
+            the number of retries with `on_error` "retry" (optional,
+            default: 3)
+        read_timeout : float
+            the maximum time in seconds to wait for each block of a file
+            (optional, default: None, i.e. unlimited); a read that takes
+            longer fails with a `TimeoutError`, e.g. on hung network mounts
 
         Note
         ----
@@ -57,16 +161,71 @@ class DataIntegrityFingerprint:
 
         """
 
-        if not from_checksums_file:
-            assert os.path.isdir(data)
+        self._archive_type = None
+        self._storage = storage
+        if storage is not None:
+            self._prefix = data.strip("/")
+        elif not from_checksums_file:
+            self._archive_type = archive_reader.archive_type(data)
+            assert os.path.isdir(data) or self._archive_type is not None, \
+                "{0} is neither a directory nor an archive".format(data)
 
         h = new_hash_instance(hash_algorithm,
                               allow_non_cryptographic_algorithms)
         self._hash_algorithm = h.hash_algorithm
-        self._data = os.path.abspath(data)
+        if storage is not None:
+            self._data = storage.url(self._prefix)
+        else:
+            self._data = os.path.abspath(data)
         self._file_count = None
-        self._hash_list = []
+        self._total_bytes = None
+        self._hard_links = {}
+        self._large_files = set()
+        self._hash_list = HashList()
+        self._stats = {}
         self._multiprocessing = multiprocessing
+        if execution is None:
+            execution = "auto" if multiprocessing else "serial"
+        if execution not in self.EXECUTION_MODES:
+            raise ValueError("{0} is not a supported execution mode.".format(
+                execution))
+        self._execution = execution
+        self._workers = workers
+        self._pool = pool
+        self._metrics = metrics
+        if on_error not in self.ERROR_POLICIES:
+            raise ValueError("{0} is not a supported error policy.".format(
+                on_error))
+        self._on_error = on_error
+        self._retries = retries if on_error == "retry" else 0
+        self._read_timeout = read_timeout
+        self._errors = []
+        if io_mode not in self.IO_MODES:
+            raise ValueError("{0} is not a supported I/O mode.".format(
+                io_mode))
+        self._io_mode = io_mode
+        if read_order not in self.READ_ORDERS:
+            raise ValueError("{0} is not a supported read order.".format(
+                read_order))
+        self._read_order = read_order
+        self._max_workers_per_device = max_workers_per_device
+        self._file_ids = {}
+        self._members = {}
+        self._rate_limiter = rate_limiter
+        if checksums_format not in self.MANIFEST_FORMATS:
+            raise ValueError("{0} is not a supported manifest format.".format(
+                checksums_format))
+        self._checksums_format = checksums_format
+        self._record_stats = record_stats
+        self._file_stats = {}
+        self._cancelled = threading.Event()
+        exclude = list(exclude or [])
+        if ignore_file is not None:
+            if not os.path.isabs(ignore_file) and not from_checksums_file \
+                    and storage is None:
+                ignore_file = os.path.join(self._data, ignore_file)
+            exclude.extend(read_ignore_file(ignore_file))
+        self._path_filter = PathFilter(include=include, exclude=exclude)
         self._allow_non_cryptographic_algorithms = \
             allow_non_cryptographic_algorithms
 
@@ -84,13 +243,133 @@ class DataIntegrityFingerprint:
         """
 
         rtn = []
-        if os.path.isdir(self._data):
-            for dir_, _, files in os.walk(self._data, followlinks=True):
+        total_bytes = 0
+        hard_links = {}
+        large_files = set()
+        file_ids = {}
+        file_stats = {}
+        schedule = self._uses_scheduler()
+        if self._storage is not None:
+            rtn = self._get_objects()
+            total_bytes = sum(x[0] for x in self._members.values())
+            large_files = set(x for x in rtn if self._members[x][0] >
+                              file_reader.BLOCK_SIZE)
+        elif self._archive_type is not None:
+            rtn = self._get_members()
+            total_bytes = sum(x[0] for x in self._members.values())
+            large_files = set(x for x in rtn if self._members[x][0] >
+                              file_reader.BLOCK_SIZE)
+        elif os.path.isdir(self._data):
+            for dir_, files in self._walk(self._data):
                 for filename in files:
-                    rtn.append(os.path.join(dir_, filename))
+                    path = os.path.join(dir_, filename)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        pass
+                    else:
+                        total_bytes += st.st_size
+                        if st.st_size > file_reader.BLOCK_SIZE:
+                            large_files.add(path)
+                        if st.st_nlink > 1:
+                            hard_links[path] = (st.st_dev, st.st_ino)
+                        if schedule:
+                            file_ids[path] = (st.st_dev, st.st_ino)
+                        if self._record_stats:
+                            rel = os.path.relpath(path, self._data).replace(
+                                os.path.sep, "/")
+                            file_stats[rel] = (st.st_size, st.st_mtime_ns)
+                    rtn.append(path)
         self._file_count = len(rtn)
+        self._total_bytes = total_bytes
+        self._hard_links = hard_links
+        self._large_files = large_files
+        self._file_ids = file_ids
+        self._file_stats = file_stats
         return rtn
 
+    def _get_members(self):
+        """Get the files in an archive (in the order of the archive).
+
+        Files are identified by the path they would have after extraction
+        (relative to the data).
+
+        """
+
+        members = {}
+        for rel, member in archive_reader.list_members(
+                self._data, self._archive_type).items():
+            if self._path_filter and not self._is_included(rel):
+                continue
+            members[rel] = member
+        self._members = members
+        return list(members)
+
+    def _get_objects(self):
+        """Get the files in the storage (in the order of the listing).
+
+        Files are identified by their path relative to the data directory
+        within the storage.
+
+        """
+
+        members = {}
+        prefix = self._prefix + "/" if self._prefix else ""
+        for rel, size in self._storage.list(self._prefix):
+            if self._path_filter and not self._is_included(rel):
+                continue
+            members[rel] = (size, (prefix + rel, size))
+        self._members = members
+        return list(members)
+
+    def _relative_path(self, path):
+        # the path of a file relative to the data directory
+        if self._storage is not None or self._archive_type is not None:
+            return path
+        return _relative_paths([path], self._data)[0]
+
+    def _uses_scheduler(self):
+        if self._archive_type is not None or self._storage is not None:
+            return False
+        return self._max_workers_per_device is not None or \
+            self._read_order != "walk"
+
+    def _walk(self, top):
+        """Walk a directory of the data and apply the path filter.
+
+        Excluded directories are pruned and thus never listed.
+
+        Yields
+        ------
+        dir_ : str
+            the directory
+        files : list of str
+            the names of the included files in the directory
+
+        """
+
+        path_filter = self._path_filter
+        for dir_, dirs, files in os.walk(top, followlinks=True):
+            if not path_filter:
+                yield dir_, files
+                continue
+            rel_dir = os.path.relpath(dir_, self._data).replace(
+                os.path.sep, "/")
+            rel_dir = "" if rel_dir == "." else rel_dir + "/"
+            dirs[:] = [x for x in dirs
+                       if path_filter.include_directory(rel_dir + x)]
+            yield dir_, [x for x in files
+                         if path_filter.include_file(rel_dir + x)]
+
+    def _is_included(self, rel_path, is_dir=False):
+        parts = rel_path.split("/")
+        for i in range(1, len(parts)):
+            if not self._path_filter.include_directory("/".join(parts[:i])):
+                return False
+        if is_dir:
+            return self._path_filter.include_directory(rel_path)
+        return self._path_filter.include_file(rel_path)
+
     @ property
     def hash_algorithm(self):
         return self._hash_algorithm
@@ -101,17 +380,25 @@ class DataIntegrityFingerprint:
 
     @property
     def file_hash_list(self):
+        """The `(checksum, path)` tuples sorted by checksum and path (a
+        `path_store.HashList`)."""
+
         if len(self._hash_list) < 1:
             self.generate()
         return self._hash_list
 
     @property
     def checksums(self):
+        separator = self.CHECKSUM_FILENAME_SEPARATOR
+        # joined in chunks (without a list of all lines)
+        entries = self.file_hash_list.by_path()
         rtn = ""
-        for h, fl in sorted(self.file_hash_list, key=lambda x: x[1]):
-            rtn += u"{0}{1}{2}\n".format(h, self.CHECKSUM_FILENAME_SEPARATOR,
-                                         fl)
-        return rtn
+        while True:
+            chunk = "".join(u"{0}{1}{2}\n".format(h, separator, fl)
+                            for h, fl in itertools.islice(entries, 4096))
+            if not chunk:
+                return rtn
+            rtn += chunk
 
     @property
     def dif(self):
@@ -120,8 +407,15 @@ class DataIntegrityFingerprint:
 
         hasher = new_hash_instance(self._hash_algorithm,
                                    self.allow_non_cryptographic_algorithms)
-        concat = "".join(["".join(x) for x in self.file_hash_list])
-        hasher.update(concat.encode("utf-8"))
+        # the concatenation is hashed in chunks (without creating it)
+        chunk = []
+        for h, fl in self.file_hash_list:
+            chunk.append(h)
+            chunk.append(fl)
+            if len(chunk) >= 8192:
+                hasher.update("".join(chunk).encode("utf-8"))
+                chunk = []
+        hasher.update("".join(chunk).encode("utf-8"))
         return hasher.checksum
 
     @property
@@ -138,9 +432,121 @@ class DataIntegrityFingerprint:
     def allow_non_cryptographic_algorithms(self):
         return self._allow_non_cryptographic_algorithms
 
-    def generate(self, progress=None):
+    @property
+    def io_mode(self):
+        return self._io_mode
+
+    @property
+    def max_workers_per_device(self):
+        return self._max_workers_per_device
+
+    @property
+    def read_order(self):
+        return self._read_order
+
+    @property
+    def checksums_format(self):
+        return self._checksums_format
+
+    @property
+    def record_stats(self):
+        return self._record_stats
+
+    @property
+    def rate_limiter(self):
+        return self._rate_limiter
+
+    @property
+    def path_filter(self):
+        return self._path_filter
+
+    @property
+    def execution(self):
+        return self._execution
+
+    @property
+    def workers(self):
+        return self._workers
+
+    @property
+    def on_error(self):
+        return self._on_error
+
+    @property
+    def errors(self):
+        """Files of the last call of `generate()` that could not be read.
+
+        A list of dictionaries with the relative `path`, the `error` and the
+        number of `attempts` for each file that has been skipped (see
+        `on_error`).
+
+        """
+
+        return list(self._errors)
+
+    @property
+    def stats(self):
+        """Statistics of the last call of `generate()`.
+
+        A dictionary with the number of `files`, the total number of
+        `bytes`, the `execution` mode and number of `workers` that has been
+        used, the `io_mode`, the number of files not read because they are
+        `hard_links` to other files, the number of tasks (`batches`) or
+        `devices` (if scheduled per device), and the `elapsed` time in
+        seconds. While generating, `files_done` and `bytes_done` are
+        updated; `errors` is the number of files that could not be read
+        and `cancelled` indicates whether generation has been cancelled.
+
+        """
+
+        return dict(self._stats)
+
+    def plan_execution(self):
+        """Get the execution plan for hashing the data.
+
+        Returns
+        -------
+        execution : str
+            "serial", "threads" or "processes"
+        workers : int
+            the number of threads or processes
+
+        """
+
+        if self._file_count is None or self._total_bytes is None:
+            self.get_files()
+        return self._plan(self._file_count, self._total_bytes)
+
+    def _plan(self, file_count, total_bytes):
+        if self._archive_type == "compressed_tar":
+            return "serial", 1  # can only be read sequentially
+        if self._pool is not None:
+            execution = "threads" if isinstance(self._pool, ThreadPool) \
+                else "processes"
+            return execution, self._workers or self._pool._processes
+        if self._execution == "auto" and self._storage is not None and \
+                self._storage.PARALLEL_READS is not None:
+            # latency bound: many concurrent requests
+            execution = "threads"
+            workers = self._workers or max(1, min(
+                self._storage.PARALLEL_READS, file_count))
+        elif self._execution == "auto":
+            execution, workers = plan_execution(file_count, total_bytes)
+            if self._workers is not None and execution != "serial":
+                workers = self._workers
+        elif self._execution == "serial":
+            execution, workers = "serial", 1
+        else:
+            execution = self._execution
+            workers = self._workers or multiprocessing.cpu_count()
+        return execution, workers
+
+    def generate(self, progress=None, result=None):
         """Generate hash list to get Data Integrity Fingerprint.
 
+        Generation can be cancelled from another thread with `cancel()`.
+        The hash list then contains the files that have been hashed so far.
+
         Parameters
         ----------
         progress: function, optional
@@ -149,46 +555,613 @@ class DataIntegrityFingerprint:
                 count  -- the current count
                 total  -- the total count
                 status -- a string describing the status
+        result: function, optional
+            a callback function that takes the checksum and the relative
+            path of each file as soon as it has been hashed
+
+        Returns
+        -------
+        completed : bool
+            False, if generation has been cancelled
 
         """
 
-        hash_list = []
+        hash_list = HashList()
+        start = time.time()
 
-        if os.path.isfile(self._data):
+        is_checksums_file = os.path.isfile(self._data) and \
+            self._archive_type is None
+        if is_checksums_file and self._checksums_format != "dif":
+            hash_list.extend(manifest_formats.read_manifest(
+                self._data, self._checksums_format))
+            self._stats = {"files": len(hash_list), "bytes": None,
+                           "execution": "serial", "workers": 1}
+        elif is_checksums_file:
             # from  checksum file
             with codecs.open(self._data, encoding="utf-8") as f:
                 for line in f:
                     h, fl = line.split(self.CHECKSUM_FILENAME_SEPARATOR,
                                        maxsplit=1)
-                    hash_list.append((h, fl.strip()))
+                    hash_list.append(h, fl.strip())
+            self._stats = {"files": len(hash_list), "bytes": None,
+                           "execution": "serial", "workers": 1}
+        else:
+            for entry in self._hash_data(progress):
+                hash_list.append(*entry)
+                if result is not None:
+                    result(*entry)
+
+        hash_list.sort()
+        self._hash_list = hash_list
+        self._stats["elapsed"] = time.time() - start
+        return not self._stats.get("cancelled", False)
+
+    def generate_external(self, filename=None, memory_budget=None,
+                          tmp_dir=None, progress=None):
+        """Generate the DIF (and save the checksums) with bounded memory.
+
+        Unlike `generate()`, the hash list is not kept in memory: it is
+        sorted externally (see `external_sort` module) and merged in a
+        single streaming pass that feeds the DIF hasher (checksum and path
+        order) and the checksums file (path order).
+
+        Parameters
+        ----------
+        filename : str, optional
+            the name of the checksums file to save (default: None, i.e. do
+            not save the checksums)
+        memory_budget : int, optional
+            the approximate maximum memory of the hash list in bytes
+            (default: `external_sort.MEMORY_BUDGET`)
+        tmp_dir : str, optional
+            the directory of temporary files (default: system default)
+        progress: function, optional
+            a callback function for a progress reporting (see `generate()`)
+
+        Returns
+        -------
+        dif : str
+            the Data Integrity Fingerprint (None, if there are no files or
+            generation has been cancelled)
+
+        """
+
+        start = time.time()
+        if memory_budget is None:
+            memory_budget = external_sort.MEMORY_BUDGET
+        if os.path.isfile(self._data) and self._archive_type is None:
+            entries = manifest_formats.read_manifest(self._data,
+                                                     self._checksums_format)
+            self._stats = {"files": None, "bytes": None,
+                           "execution": "serial", "workers": 1}
+        else:
+            entries = self._hash_data(progress)
+        # the sorter of checksums files is only needed, if one is saved
+        by_hash = external_sort.ExternalSorter(
+            external_sort.hash_order,
+            memory_budget / 2 if filename else memory_budget, tmp_dir)
+        by_path = external_sort.ExternalSorter(
+            external_sort.path_order, memory_budget / 2, tmp_dir)
+        with by_hash, by_path:
+            for entry in entries:
+                by_hash.add(entry)
+                if filename is not None:
+                    by_path.add(entry)
+            self._stats["files"] = len(by_hash)
+            self._stats["runs"] = by_hash.runs + by_path.runs
+            if self._stats.get("cancelled") or len(by_hash) == 0:
+                self._stats["elapsed"] = time.time() - start
+                return None
+            hasher = new_hash_instance(self._hash_algorithm,
+                                       self.allow_non_cryptographic_algorithms)
+            for checksum, path in by_hash:
+                hasher.update((checksum + path).encode("utf-8"))
+            if filename is not None:
+                manifest_formats.write_manifest(filename, by_path)
+        self._stats["elapsed"] = time.time() - start
+        return hasher.checksum
+
+    def _hash_data(self, progress=None):
+        """Hash the files of the data directory.
+
+        Yields
+        ------
+        entry : tuple
+            `(checksum, path)` with paths relative to the data directory
+            (in the order in which the files have been hashed)
+
+        """
+
+        files = self.get_files()
+        execution, workers = self.plan_execution()
+        files, links = self._group_hard_links(files)
+        self._stats = {"files": self._file_count,
+                       "bytes": self._total_bytes,
+                       "execution": execution, "workers": workers,
+                       "io_mode": self._io_mode,
+                       "hard_links": sum(len(x) for x in links.values()),
+                       "files_done": 0, "bytes_done": 0,
+                       "errors": 0, "cancelled": False}
+        self._errors = []
+        error_policy = (self._on_error != "fail", self._retries,
+                        self._read_timeout)
+        batches = {}
+        buffer = None
+        if execution == "processes" and digest_buffer.AVAILABLE and files:
+            # workers write digests into shared memory instead of returning
+            # them, file IDs are the positions of the files in the batches
+            buffer = digest_buffer.DigestBuffer(
+                len(files), new_hash_instance(self._hash_algorithm,
+                                              True).digest_size)
+
+        def out(first_id):
+            # where a worker writes the digests of a batch
+            if buffer is None:
+                return None
+            return buffer.name, first_id, buffer.digest_size
+        if self._uses_scheduler():
+            scheduler = DeviceScheduler(
+                files, self._file_ids,
+                max_per_device=self._max_workers_per_device,
+                read_order=self._read_order)
+            self._stats["devices"] = len(scheduler.devices)
+
+            def scheduled_tasks():
+                # one file per task, handed out by the scheduler
+                for batch_id, (path, prefetch) in enumerate(scheduler):
+                    if self._cancelled.is_set():
+                        return
+                    batches[batch_id] = [path]
+                    yield (batch_id, [path], self._hash_algorithm,
+                           self._io_mode, prefetch, self._data, error_policy,
+                           out(batch_id))
+
+            first_ids = range(len(files))  # one file per batch
+            func_args = scheduled_tasks()
+        elif self._archive_type is not None or self._storage is not None:
+            scheduler = None
+            if self._archive_type == "compressed_tar":
+                batch_list = [files] if files else []  # in archive order
+            else:
+                batch_list = self._batch_files(files, workers)
+            batches.update(enumerate(batch_list))
+            self._stats["batches"] = len(batch_list)
+            if self._storage is not None:
+                source = self._storage
+            else:
+                source = (self._data, self._archive_type)
+            first_ids = _first_ids(batch_list)
+            func_args = [(batch_id, [self._members[x][1] for x in batch],
+                          self._hash_algorithm, source, error_policy,
+                          out(first_ids[batch_id]))
+                         for batch_id, batch in enumerate(batch_list)]
         else:
-            files = self.get_files()
-            func_args = zip(files, [self._hash_algorithm] * len(files))
-            if self.multiprocessing:
-                pool = multiprocessing.Pool()
-                imap = pool.imap_unordered
+            scheduler = None
+            batch_list = self._batch_files(files, workers)
+            batches.update(enumerate(batch_list))
+            self._stats["batches"] = len(batch_list)
+            # prefetch the file that will be read after the current ones
+            prefetch = [x[0] for x in batch_list[workers:]] + \
+                [None] * min(workers, len(batch_list))
+            first_ids = _first_ids(batch_list)
+            func_args = zip(range(len(batch_list)), batch_list,
+                            [self._hash_algorithm] * len(batch_list),
+                            [self._io_mode] * len(batch_list), prefetch,
+                            [self._data] * len(batch_list),
+                            [error_policy] * len(batch_list),
+                            [out(x) for x in first_ids])
+        if self._storage is not None:
+            func = _hash_objects
+        elif self._archive_type is not None:
+            func = _hash_members
+        else:
+            func = _hash_batch
+        if self._archive_type is not None:
+            # opened for listing, not to be inherited by forked workers
+            archive_reader.close_archives(self._data)
+        pool, imap, func = self._create_pool(execution, workers, func)
+
+        if self._metrics is not None:
+            self._metrics.start(len(files), self._total_bytes,
+                                self._stats.get("batches", len(files)),
+                                workers)
+        results = imap(func, func_args)
+        if pool is not None:
+            results = _poll_results(results, self._cancelled)
+        counter = 0
+        completed = False
+        try:
+            for batch_id, digests, rel_paths, n_bytes, errors in results:
+                if self._cancelled.is_set():
+                    break
+                batch = batches.pop(batch_id)
+                if digests is None:  # in shared memory
+                    digests = buffer.digests(first_ids[batch_id], len(batch))
+                    for i, _, _ in errors:
+                        digests[i] = None
+                if rel_paths is None:
+                    if self._archive_type is None and self._storage is None:
+                        rel_paths = _relative_paths(batch, self._data)
+                    else:  # archive members or objects
+                        rel_paths = batch
+                n_errors = len(self._errors)
+                for i, message, attempts in errors:
+                    self._errors.append({"path": rel_paths[i],
+                                         "error": message,
+                                         "attempts": attempts})
+                    # the hard links of the file are left out as well
+                    for fl in links.get(batch[i], ()):
+                        self._errors.append({"path": self._relative_path(fl),
+                                             "error": message,
+                                             "attempts": attempts})
+                n_errors = len(self._errors) - n_errors
+                # hex conversion in bulk, paths made relative by the workers
+                checksums = _hex_checksums(digests, self._hash_algorithm)
+                for path, rel, checksum in zip(batch, rel_paths, checksums):
+                    counter += 1
+                    if scheduler is not None:
+                        scheduler.done(path)
+                    if progress is not None:
+                        progress(counter, len(files),
+                                 "{0}/{1}".format(counter, len(files)))
+                    if checksum is None:  # skipped
+                        continue
+                    yield checksum, rel
+                    for fl in links.get(path, ()):
+                        yield checksum, self._relative_path(fl)
+                self._stats["files_done"] = counter
+                self._stats["bytes_done"] += n_bytes
+                self._stats["errors"] += n_errors
+                if self._metrics is not None:
+                    self._metrics.update(len(digests) - len(errors), n_bytes)
+                    if errors:
+                        self._metrics.error(n_errors)
             else:
-                imap = map
+                completed = not self._cancelled.is_set()
+        finally:
+            if not completed:
+                self._stats["cancelled"] = self._cancelled.is_set()
+                if scheduler is not None:
+                    scheduler.cancel()
+            if pool is not None and pool is not self._pool:
+                if completed:
+                    pool.close()
+                else:
+                    pool.terminate()
+                pool.join()
+            if self._archive_type is not None:
+                archive_reader.close_archives(self._data)
+            if self._storage is not None:
+                self._storage.close()
+            if buffer is not None:
+                buffer.close()
+            if self._metrics is not None:
+                self._metrics.finish()
+            self._cancelled.clear()
+
+    def cancel(self):
+        """Cancel a running `generate()` (e.g. from another thread).
 
-            for counter, rtn in enumerate(imap(_hash_file_content, func_args)):
-                if progress is not None:
-                    progress(counter + 1, len(files),
-                             "{0}/{1}".format(counter + 1, len(files)))
-                fl = os.path.relpath(rtn[1], self.data).replace(os.path.sep,"/")
-                hash_list.append((rtn[0], fl))
+        Processes are terminated; threads stop after the current block.
+
+        """
 
-            if self.multiprocessing:
-                pool.close()
+        self._cancelled.set()
 
-        self._hash_list = sorted(hash_list, key=lambda x: x[0] + x[1])
+    def _create_pool(self, execution, workers, func=None):
+        """Create a pool of workers for hashing batches.
+
+        A shared pool (see `__init__`) is used instead of creating one.
+
+        Returns
+        -------
+        pool : Pool, ThreadPool or None
+            the pool (None for serial execution)
+        imap : function
+            the (unordered) map function of the pool
+        func : function
+            the function to map over tasks for `_hash_batch` (or another
+            task function with the same arguments and results)
+
+        """
+
+        if func is None:
+            func = _hash_batch
+        if self._pool is not None and execution != "serial":
+            pool = self._pool
+            imap = pool.imap_unordered
+            if execution == "processes":
+                return pool, imap, func
+        elif execution == "processes":
+            # the rate limiter is shared memory and has to be inherited
+            pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                        initargs=(self._rate_limiter,))
+            return pool, pool.imap_unordered, func
+        elif execution == "threads":
+            pool = ThreadPool(workers)
+            imap = pool.imap_unordered
+        else:
+            pool = None
+            imap = map
+        # threads cannot be terminated and check for cancellation instead
+        return pool, imap, functools.partial(func,
+                                             rate_limiter=self._rate_limiter,
+                                             cancelled=self._cancelled)
+
+    def _batch_files(self, files, workers, large_files=None):
+        """Split files into batches for the workers.
+
+        Small files (that can be read with a single read) are batched to
+        reduce the overhead per file; large files are hashed one by one and
+        first, for a better load balancing.
+
+        Returns
+        -------
+        batches : list of lists
+
+        """
+
+        if large_files is None:
+            large_files = self._large_files
+        small = [x for x in files if x not in large_files]
+        rtn = [[x] for x in files if x in large_files]
+        size = max(1, min(BATCH_SIZE, len(small) // (workers * 4)))
+        rtn.extend(small[i:i + size] for i in range(0, len(small), size))
+        return rtn
+
+    def _group_hard_links(self, files):
+        """Hash files that are hard links to the same inode only once.
+
+        Returns
+        -------
+        files : list
+            the files to hash
+        links : dict
+            the other paths of the same inode for each file to hash
+
+        """
+
+        if not self._hard_links:
+            return files, {}
+        first = {}
+        links = {}
+        rtn = []
+        for path in files:
+            inode = self._hard_links.get(path)
+            if inode is None:
+                rtn.append(path)
+            elif inode in first:
+                links.setdefault(first[inode], []).append(path)
+            else:
+                first[inode] = path
+                rtn.append(path)
+        return rtn, links
+
+    def duplicates(self):
+        """Find files with identical content.
+
+        Returns
+        -------
+        duplicates : list of lists
+            groups of relative paths of files that have the same checksum
+
+        """
 
-    def save_checksums(self, filename=None):
+        # equal checksums are not necessarily adjacent in the hash list,
+        # which is sorted by `checksum + path` (e.g. CRC-32 checksums of
+        # different length)
+        groups = {}
+        for h, fl in self.file_hash_list:
+            groups.setdefault(h, []).append(fl)
+        return [x for x in groups.values() if len(x) > 1]
+
+    def rehash(self, files):
+        """Rehash some files and update the hash list incrementally.
+
+        If the DIF has not been generated yet, it is generated (i.e. all
+        files are hashed).
+
+        Parameters
+        ----------
+        files : list of str
+            the paths of created, modified or deleted files or directories
+            (paths that do not exist anymore are removed from the hash list)
+
+        """
+
+        if len(self._hash_list) < 1:
+            # nothing to update (like `file_hash_list`)
+            self.generate()
+            return
+        hash_dict = dict((fl, h) for h, fl in self._hash_list)
+        to_hash = []
+        for path in files:
+            path = os.path.abspath(path)
+            rel = os.path.relpath(path, self.data).replace(os.path.sep, "/")
+            if rel == "." or rel.startswith("../"):
+                continue
+            if os.path.isdir(path):
+                if self._is_included(rel, is_dir=True):
+                    for dir_, filenames in self._walk(path):
+                        to_hash.extend(os.path.join(dir_, x)
+                                       for x in filenames)
+            elif os.path.isfile(path):
+                if self._is_included(rel):
+                    to_hash.append(path)
+            else:
+                hash_dict.pop(rel, None)
+                prefix = rel + "/"
+                for fl in [x for x in hash_dict if x.startswith(prefix)]:
+                    del hash_dict[fl]
+
+        for path in to_hash:
+            try:
+                h, _ = _hash_file_content((path, self._hash_algorithm,
+                                           self._io_mode),
+                                          rate_limiter=self._rate_limiter)
+            except OSError:  # vanished in the meantime
+                h = None
+            fl = os.path.relpath(path, self.data).replace(os.path.sep, "/")
+            if h is None:
+                hash_dict.pop(fl, None)
+            else:
+                hash_dict[fl] = h
+
+        self._hash_list = HashList((h, fl) for fl, h in hash_dict.items())
+        self._hash_list.sort()
+        self._file_count = len(self._hash_list)
+        self._total_bytes = None
+
+    def audit(self, filename, sample_size=None, seed=None, weighted=False,
+              confidence=0.95, checksums_format="dif"):
+        """Rehash a random sample of the files in a checksums file.
+
+        Only the sampled files are read (in parallel, according to the
+        execution mode), which allows to regularly check large data for
+        silent corruption at a fraction of the I/O of `generate()`.
+
+        Parameters
+        ----------
+        filename : str
+            the name of the checksums file of the data
+        sample_size : int or float, optional
+            the number of files to sample, or the fraction of files, if
+            smaller than 1 (default: `AUDIT_SAMPLE_SIZE`)
+        seed : int, optional
+            the seed of the random sample (default: random); the same seed
+            and checksums file result in the same sample
+        weighted : bool, optional
+            sample files with a probability proportional to their size, so
+            that the mismatch rate estimates the affected fraction of the
+            data rather than of the files (default: False)
+        confidence : float, optional
+            the confidence level of the bounds of the mismatch rate
+            (default: 0.95)
+        checksums_format : str, optional
+            the format of the checksums file (default: "dif")
+
+        Returns
+        -------
+        report : dict
+            the `seed`, the number of files in the checksums file
+            (`population`), the number of `sampled` files and their total
+            `bytes`, the relative paths of `mismatches` and `missing` files,
+            the `errors` of files that could not be read (like `errors`,
+            independent of `on_error`), the mismatch `rate` (missing and
+            unreadable files count as mismatches) and its `lower` and `upper`
+            bound (Wilson score interval) at the given `confidence`, and the
+            `elapsed` time in seconds
+
+        """
+
+        start = time.time()
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        if sample_size is None:
+            sample_size = AUDIT_SAMPLE_SIZE
+        other = DataIntegrityFingerprint(
+            filename, from_checksums_file=True,
+            hash_algorithm=self._hash_algorithm,
+            allow_non_cryptographic_algorithms=\
+                self.allow_non_cryptographic_algorithms,
+            checksums_format=checksums_format)
+        # independent of the order of the checksums file
+        entries = list(other.file_hash_list.by_path())
+        if 0 < sample_size < 1:
+            sample_size = int(math.ceil(sample_size * len(entries)))
+        sample_size = min(int(sample_size), len(entries))
+
+        paths = [os.path.join(self.data, *x[1].split("/")) for x in entries]
+        sizes = {}
+        if weighted:
+            for path in paths:
+                try:
+                    sizes[path] = os.stat(path).st_size
+                except OSError:
+                    sizes[path] = 0
+        rnd = random.Random(seed)
+        if weighted:
+            # weighted sampling without replacement (Efraimidis & Spirakis)
+            # with the logarithm of the keys `u ** (1 / size)`, which are
+            # rounded to 1.0 for large sizes
+            keys = [math.log(1.0 - rnd.random()) / max(sizes[x], 1)
+                    for x in paths]
+            sample = sorted(range(len(paths)), key=lambda i: keys[i],
+                            reverse=True)[:sample_size]
+        else:
+            sample = rnd.sample(range(len(paths)), sample_size)
+
+        expected = {}
+        missing = []
+        large_files = set()
+        total_bytes = 0
+        for i in sample:
+            path = paths[i]
+            try:
+                st = os.stat(path)
+            except OSError:
+                missing.append(entries[i][1])
+                continue
+            expected[path] = entries[i]
+            total_bytes += st.st_size
+            if st.st_size > file_reader.BLOCK_SIZE:
+                large_files.add(path)
+
+        mismatches = []
+        errors = []
+        files = sorted(expected)
+        if files:
+            execution, workers = self._plan(len(files), total_bytes)
+            batch_list = self._batch_files(files, workers, large_files)
+            pool, imap, func = self._create_pool(execution, workers)
+            # an unreadable file is a finding of the audit (also with
+            # on_error "fail")
+            error_policy = (True, self._retries, self._read_timeout)
+            func_args = [(batch_id, batch, self._hash_algorithm,
+                          self._io_mode, None, self._data, error_policy, None)
+                         for batch_id, batch in enumerate(batch_list)]
+            try:
+                for batch_id, digests, _, _, batch_errors in imap(func,
+                                                                  func_args):
+                    batch = batch_list[batch_id]
+                    for i, message, attempts in batch_errors:
+                        errors.append({"path": expected[batch[i]][1],
+                                       "error": message,
+                                       "attempts": attempts})
+                    checksums = _hex_checksums(digests, self._hash_algorithm)
+                    for path, checksum in zip(batch, checksums):
+                        if checksum is None:  # unreadable
+                            continue
+                        elif checksum != expected[path][0]:
+                            mismatches.append(expected[path][1])
+            finally:
+                if pool is not None and pool is not self._pool:
+                    pool.close()
+                    pool.join()
+
+        failures = len(mismatches) + len(missing) + len(errors)
+        lower, upper = _wilson_interval(failures, sample_size, confidence)
+        return {"seed": seed, "population": len(entries),
+                "sampled": sample_size, "bytes": total_bytes,
+                "mismatches": sorted(mismatches), "missing": sorted(missing),
+                "errors": sorted(errors, key=lambda x: x["path"]),
+                "rate": failures / sample_size if sample_size else 0.0,
+                "lower": lower, "upper": upper, "confidence": confidence,
+                "elapsed": time.time() - start}
+
+    def save_checksums(self, filename=None, extended=False):
         """Save the checksums to a file.
 
         Parameters
         ----------
         filename : str, optional
             the name of the file to save checksums to
+        extended : bool, optional
+            additionally save an extended checksums file with size and
+            modification time of each file (JSON Lines) next to the
+            checksums file (filename +
+            `DataIntegrityFingerprint.EXTENDED_MANIFEST_EXTENSION`), which
+            can be used for a `quick_check` (default: False)
 
         Returns
         -------
@@ -205,15 +1178,131 @@ class DataIntegrityFingerprint:
             with codecs.open(filename, 'w', "utf-8") as f:
                 f.write(self.checksums)
 
+            if extended:
+                manifest_formats.write_manifest(
+                    filename + self.EXTENDED_MANIFEST_EXTENSION,
+                    self.file_hash_list.by_path(),
+                    manifest_format="jsonl",
+                    hash_algorithm=self._hash_algorithm, data=self.data,
+                    file_stats=self._file_stats)
+
             return True
 
-    def diff_checksums(self, filename):
+    def quick_check(self, filename):
+        """Compare size and modification time of files to an extended
+        checksums file without hashing.
+
+        Parameters
+        ----------
+        filename : str
+            the name of the extended checksums file (or of the checksums file
+            next to it)
+
+        Returns
+        -------
+        candidates : dict
+            relative paths of files that are `modified` (size or
+            modification time differ), `missing` or `new` and have to be
+            rehashed
+
+        """
+
+        if not filename.endswith(self.EXTENDED_MANIFEST_EXTENSION) and \
+                os.path.isfile(filename + self.EXTENDED_MANIFEST_EXTENSION):
+            filename = filename + self.EXTENDED_MANIFEST_EXTENSION
+        expected = {}
+        for record in manifest_formats.read_jsonl(filename):
+            expected[record["path"]] = (record["size"], record["mtime_ns"])
+
+        rtn = {"modified": [], "missing": [], "new": []}
+        for path in self.get_files():
+            rel = os.path.relpath(path, self._data).replace(os.path.sep, "/")
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            meta = expected.pop(rel, None)
+            if meta is None:
+                rtn["new"].append(rel)
+            elif meta != (st.st_size, st.st_mtime_ns):
+                rtn["modified"].append(rel)
+        rtn["missing"].extend(expected)
+        for paths in rtn.values():
+            paths.sort()
+        return rtn
+
+    def save_index(self, filename=None):
+        """Save the checksums to a manifest index.
+
+        The index can be memory-mapped and allows comparing DIFs and
+        looking up single files without parsing the checksums (see
+        `manifest_index` module).
+
+        Parameters
+        ----------
+        filename : str, optional
+            the name of the index file (default: name of the checksums file
+            + `manifest_index.INDEX_EXTENSION`)
+
+        Returns
+        -------
+        filename : str
+            the name of the index file
+
+        """
+
+        if filename is None:
+            filename = manifest_formats.default_filename(
+                self.data, self._hash_algorithm, "dif") + \
+                manifest_index.INDEX_EXTENSION
+        manifest_index.write_index(
+            filename, sorted(self.file_hash_list,
+                             key=lambda x: x[1].encode("utf-8",
+                                                       "surrogateescape")),
+            self.dif, self._hash_algorithm)
+        return filename
+
+    def export_manifest(self, filename=None, manifest_format="coreutils"):
+        """Export the checksums to a manifest in a standard format.
+
+        The manifest is written entry by entry (see `manifest_formats`
+        module).
+
+        Parameters
+        ----------
+        filename : str, optional
+            the name of the manifest file (default: depends on format, e.g.
+            "manifest-sha256.txt" for BagIt)
+        manifest_format : str, optional
+            one of `DataIntegrityFingerprint.MANIFEST_FORMATS` (default:
+            "coreutils")
+
+        Returns
+        -------
+        filename : str
+            the name of the manifest file
+
+        """
+
+        if filename is None:
+            filename = manifest_formats.default_filename(
+                self.data, self._hash_algorithm, manifest_format)
+        data = self.data if os.path.isdir(self.data) else None
+        manifest_formats.write_manifest(
+            filename, self.file_hash_list.by_path(),
+            manifest_format=manifest_format,
+            hash_algorithm=self._hash_algorithm, data=data)
+        return filename
+
+    def diff_checksums(self, filename, checksums_format="dif"):
         """Calculate differences of checksums to checksums file.
 
         Parameters
         ----------
         filename : str
             the name of the checksums file
+        checksums_format : str, optional
+            the format of the checksums file (default: "dif")
 
         Returns
         -------
@@ -229,7 +1318,8 @@ class DataIntegrityFingerprint:
             filename, from_checksums_file=True,
             hash_algorithm=self._hash_algorithm,
             allow_non_cryptographic_algorithms=\
-                self.allow_non_cryptographic_algorithms)
+                self.allow_non_cryptographic_algorithms,
+            checksums_format=checksums_format)
         checksums_other = other.checksums.split("\n")
         sub = ["- " + x for x in list(set(checksums_other) - set(checksums))]
         add = ["+ " + x for x in list(set(checksums) - set(checksums_other))]
@@ -241,9 +1331,12 @@ def new_hash_instance(hash_algorithm,
                       support_non_cryptographic_algorithms=False):
     """Return a new instance of a hash object (similar to hashlib.new()).
 
-    Each HashAlgorithm object has the methods `update` and the
-    properties `hash_algorithm` (according the DIF naming convention),
-    `checksum`
+    Each HashAlgorithm object has the methods `update`, `copy` and `digest`
+    and the properties `hash_algorithm` (according the DIF naming
+    convention), `checksum`
+
+    Algorithm names are resolved only once; afterwards, new instances are
+    copies of a cached prototype.
 
     Parameters
     ----------
@@ -260,25 +1353,308 @@ def new_hash_instance(hash_algorithm,
 
     """
 
+    key = (hash_algorithm, support_non_cryptographic_algorithms)
+    try:
+        prototype = _hash_prototypes[key]
+    except KeyError:
+        prototype = _resolve_hash_algorithm(*key)
+        _hash_prototypes[key] = prototype
+    if prototype is not None:
+        return prototype.copy()
+
+
+# registry of resolved algorithms: (name, non-cryptographic) -> prototype
+_hash_prototypes = {}
+
+
+def _resolve_hash_algorithm(hash_algorithm,
+                            support_non_cryptographic_algorithms):
     if support_non_cryptographic_algorithms:
         try:
             return ZlibHashAlgorithm(hash_algorithm)
-        except Exception:
+        except (ValueError, AttributeError):
             pass
 
     try:
         return OpenSSLHashAlgorithm(hash_algorithm)
-    except Exception:
-        pass
+    except (ValueError, AttributeError):
+        return None
+
+
+# Maximum number of small files per task
+BATCH_SIZE = 256
+
+# errors of reading a file (that are skipped or retried, see `on_error`)
+READ_ERRORS = (OSError, EOFError, zlib.error, tarfile.TarError,
+               zipfile.BadZipFile, http.client.HTTPException)
+RETRY_DELAY = 0.5  # first delay in seconds; doubled with each retry
+
+# Default number of files rehashed by `DataIntegrityFingerprint.audit()`
+AUDIT_SAMPLE_SIZE = 1000
+
+# Cost model for `plan_execution()` (rough estimates in seconds)
+PER_FILE_COST = 50e-6  # opening a file and creating a hasher
+PER_BYTE_COST = 2e-9  # hashing one byte (i.e. ~500 MB/s per core)
+IPC_COST = 30e-6  # sending a result from a worker process
+THREAD_STARTUP_COST = 1e-3
+PROCESS_STARTUP_COST = 50e-3
+
+
+def plan_execution(file_count, total_bytes, cpu_count=None):
+    """Choose how to hash a number of files based on a simple cost model.
+
+    Small inputs are hashed serially, since starting a pool costs more than
+    it saves. Threads only parallelize the hashing of large blocks (the GIL
+    is released), whereas processes also parallelize the per-file overhead
+    but have higher startup and communication costs.
+
+    Parameters
+    ----------
+    file_count : int
+        the number of files
+    total_bytes : int
+        the total size of all files
+    cpu_count : int, optional
+        the number of available CPU cores (default: all)
+
+    Returns
+    -------
+    execution : str
+        "serial", "threads" or "processes"
+    workers : int
+        the number of threads or processes
+
+    """
+
+    if cpu_count is None:
+        cpu_count = multiprocessing.cpu_count()
+    max_workers = max(1, min(cpu_count, file_count))
+    file_costs = file_count * PER_FILE_COST
+    byte_costs = total_bytes * PER_BYTE_COST
+
+    def optimal_workers(parallel_costs, startup_costs):
+        # minimizes parallel_costs / n + n * startup_costs
+        n = int(math.sqrt(parallel_costs / startup_costs))
+        return max(1, min(max_workers, n))
 
+    plans = [("serial", 1, file_costs + byte_costs)]
+    if max_workers > 1:
+        n = optimal_workers(byte_costs, THREAD_STARTUP_COST)
+        plans.append(("threads", n, file_costs + byte_costs / n +
+                      n * THREAD_STARTUP_COST))
+        n = optimal_workers(file_costs + byte_costs, PROCESS_STARTUP_COST)
+        plans.append(("processes", n, (file_costs + byte_costs) / n +
+                      file_count * IPC_COST + n * PROCESS_STARTUP_COST))
+    execution, workers, _ = min(plans, key=lambda x: x[2])
+    return execution, workers
 
-def _hash_file_content(args):
-    # args = (filename, hash_algorithm)
+
+def _normal_quantile(p):
+    # inverse of the standard normal CDF by bisection
+    lower, upper = -10.0, 10.0
+    for _ in range(100):
+        middle = (lower + upper) / 2
+        if (1 + math.erf(middle / math.sqrt(2))) / 2 < p:
+            lower = middle
+        else:
+            upper = middle
+    return (lower + upper) / 2
+
+
+def _wilson_interval(failures, n, confidence):
+    # Wilson score interval of a binomial proportion
+    if n == 0:
+        return 0.0, 1.0
+    z = _normal_quantile(1 - (1 - confidence) / 2)
+    p = failures / n
+    denominator = 1 + z ** 2 / n
+    centre = (p + z ** 2 / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / \
+        denominator
+    lower = centre - margin if failures > 0 else 0.0
+    upper = centre + margin if failures < n else 1.0
+    return max(0.0, lower), min(1.0, upper)
+
+
+def _poll_results(results, cancelled, interval=0.1):
+    # iterate over the results of a pool and stop early, if cancelled
+    while True:
+        try:
+            yield results.next(interval)
+        except multiprocessing.TimeoutError:
+            if cancelled.is_set():
+                return
+        except StopIteration:
+            return
+
+
+_worker_rate_limiter = None
+
+
+def _init_worker(rate_limiter):
+    # initializer of worker processes
+    global _worker_rate_limiter
+    _worker_rate_limiter = rate_limiter
+
+
+def _first_ids(batches):
+    # the file ID of the first file of each batch (files are numbered in the
+    # order of the batches)
+    return [0] + list(itertools.accumulate(len(x) for x in batches))[:-1]
+
+
+def _hex_checksums(digests, hash_algorithm):
+    # converts the raw digests of a batch to checksums (see `checksum` of the
+    # hash algorithms) with a single hex conversion; None (cancelled) stays
+    if None in digests:
+        return [None if x is None else _hex_checksums([x], hash_algorithm)[0]
+                for x in digests]
+    if not digests:
+        return []
+    width = 2 * len(digests[0])
+    concat = b"".join(digests).hex()
+    rtn = [concat[i:i + width] for i in range(0, len(concat), width)]
+    if hash_algorithm in ZlibHashAlgorithm.SUPPORTED_ALGORITHMS:
+        rtn = [x.lstrip("0") or "0" for x in rtn]  # not zero-padded
+    return rtn
+
+
+def _relative_paths(filenames, root):
+    # paths of files below root relative to root (with "/" as separator)
+    start = len(os.path.join(root, ""))
+    if os.path.sep == "/":
+        return [x[start:] for x in filenames]
+    return [x[start:].replace(os.path.sep, "/") for x in filenames]
+
+
+def _hash_file(filename, hash_algorithm, io_mode, rate_limiter,
+               cancelled=None):
+    # returns (digest, n_bytes); digest is None, if cancelled
+    return _hash_blocks(file_reader.read_blocks(filename, io_mode),
+                        hash_algorithm, rate_limiter, cancelled)
+
+
+def _hash_blocks(blocks, hash_algorithm, rate_limiter, cancelled=None):
+    hasher = new_hash_instance(hash_algorithm, True)
+    n_bytes = 0
+    if rate_limiter is not None:
+        rate_limiter.acquire(n_files=1)
+    for block in blocks:
+        if cancelled is not None and cancelled.is_set():
+            return None, n_bytes
+        if rate_limiter is not None:
+            rate_limiter.acquire(n_bytes=len(block))
+        hasher.update(block)
+        n_bytes += len(block)
+    return hasher.digest(), n_bytes
+
+
+def _hash_batch(args, rate_limiter=None, cancelled=None):
+    # args = (batch_id, filenames, hash_algorithm, io_mode, prefetch_filename,
+    #         root, error_policy, out)
     # helper function for multi threading of file hashing
-    hasher = new_hash_instance(hash_algorithm=args[1],
-                               support_non_cryptographic_algorithms=True)
-    with open(args[0], 'rb') as f:
-        for block in iter(lambda: f.read(64 * 1024), b''):
-            hasher.update(block)
+    # returns (batch_id, digests, paths relative to root, n_bytes, errors);
+    # digests and paths are None, if written to out (see `_store_digests`)
+    batch_id, filenames, hash_algorithm, io_mode, prefetch, root, \
+        error_policy, out = args
+    if prefetch is not None and io_mode != "buffered":
+        file_reader.advise_willneed(prefetch, io_mode)
+    digests, total, errors = _hash_items(
+        filenames, lambda x: file_reader.read_blocks(x, io_mode),
+        hash_algorithm, error_policy, rate_limiter, cancelled)
+    if out is not None:
+        _store_digests(digests, out)
+        return batch_id, None, None, total, errors
+    return batch_id, digests, _relative_paths(filenames, root), total, errors
+
+
+def _hash_members(args, rate_limiter=None, cancelled=None):
+    # args = (batch_id, locators, hash_algorithm, (archive, archive_type),
+    #         error_policy, out)
+    # helper function for hashing members of an archive
+    # returns (batch_id, digests, None, n_bytes, errors)
+    batch_id, locators, hash_algorithm, (archive, archive_type), \
+        error_policy, out = args
+    try:
+        digests, total, errors = _hash_items(
+            locators,
+            lambda x: archive_reader.read_member(archive, archive_type, x),
+            hash_algorithm, error_policy, rate_limiter, cancelled)
+    finally:
+        # workers of a shared pool hash the archives of many roots
+        archive_reader.close_archives(archive, current_thread=True)
+    return batch_id, _store_digests(digests, out), None, total, errors
+
+
+def _hash_objects(args, rate_limiter=None, cancelled=None):
+    # args = (batch_id, [(path, size), ...], hash_algorithm, storage,
+    #         error_policy, out)
+    # helper function for hashing files of a storage backend
+    # returns (batch_id, digests, None, n_bytes, errors)
+    batch_id, objects, hash_algorithm, storage, error_policy, out = args
+    digests, total, errors = _hash_items(
+        objects, lambda x: storage.read_blocks(*x),
+        hash_algorithm, error_policy, rate_limiter, cancelled)
+    return batch_id, _store_digests(digests, out), None, total, errors
+
+
+def _store_digests(digests, out):
+    # out = None or (name, first file ID, digest size) of a DigestBuffer
+    # returns the digests or None, if written to the DigestBuffer
+    if out is None:
+        return digests
+    digest_buffer.write_digests(out[0], out[1], out[2], digests)
+    return None
+
+
+def _hash_items(items, read, hash_algorithm, error_policy, rate_limiter,
+                cancelled):
+    # hashes the blocks returned by read(item) for each item
+    # error_policy = (skip, retries, read_timeout); errors are raised, if
+    # not skip; otherwise digest is None and (index, message, attempts) is
+    # added to the errors
+    # returns (digests, n_bytes, errors)
+    if rate_limiter is None:
+        rate_limiter = _worker_rate_limiter
+    if rate_limiter is not None and rate_limiter.unlimited:
+        rate_limiter = None
+    skip, retries, read_timeout = error_policy
+    digests = []
+    total = 0
+    errors = []
+    for i, item in enumerate(items):
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                blocks = read(item)
+                if read_timeout is not None:
+                    blocks = file_reader.read_with_timeout(blocks,
+                                                           read_timeout)
+                digest, n_bytes = _hash_blocks(blocks, hash_algorithm,
+                                               rate_limiter, cancelled)
+                break
+            except READ_ERRORS as err:
+                if not skip:
+                    raise
+                if attempts <= retries and not (cancelled is not None and
+                                                 cancelled.is_set()):
+                    time.sleep(RETRY_DELAY * 2 ** (attempts - 1))
+                    continue
+                errors.append((i, "{0}: {1}".format(type(err).__name__, err),
+                               attempts))
+                digest, n_bytes = None, 0
+                break
+        digests.append(digest)
+        total += n_bytes
+    return digests, total, errors
+
 
-    return hasher.checksum, args[0]
+def _hash_file_content(args, rate_limiter=None):
+    # args = (filename, hash_algorithm[, io_mode])
+    # helper function for hashing a single file
+    if rate_limiter is not None and rate_limiter.unlimited:
+        rate_limiter = None
+    io_mode = args[2] if len(args) > 2 else "buffered"
+    digest = _hash_file(args[0], args[1], io_mode, rate_limiter)[0]
+    return _hex_checksums([digest], args[1])[0], args[0]
@@ -0,0 +1,121 @@
+"""Transport of digests from worker processes via shared memory.
+
+Results of worker processes are pickled and sent through a pipe to the main
+process. For millions of files, this keeps the main process busy. With a
+`DigestBuffer`, workers write the raw digests (of fixed width) directly into
+shared memory at the position of each file (its file ID) and only return
+the number of bytes and the errors of a task.
+
+A worker attaches to the buffer only while writing the digests of a task,
+so that long-lived workers do not keep the memory of finished generations
+(which have unlinked their buffers) mapped.
+
+Shared memory requires Python 3.8 or later (`AVAILABLE`); otherwise, the
+digests are returned with the results.
+
+"""
+
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+AVAILABLE = shared_memory is not None
+
+
+class DigestBuffer(object):
+    """Digests of fixed width indexed by file ID in shared memory."""
+
+    def __init__(self, n_digests, digest_size):
+        """Create a DigestBuffer.
+
+        Parameters
+        ----------
+        n_digests : int
+            the number of digests (i.e. files)
+        digest_size : int
+            the size of each digest in bytes
+
+        """
+
+        if not AVAILABLE:
+            raise RuntimeError("Shared memory requires Python 3.8 or later.")
+        self._digest_size = digest_size
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=max(1, n_digests * digest_size))
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def digest_size(self):
+        return self._digest_size
+
+    def digests(self, start, n):
+        """Get digests.
+
+        Parameters
+        ----------
+        start : int
+            the file ID of the first digest
+        n : int
+            the number of digests
+
+        Returns
+        -------
+        digests : list of bytes
+
+        """
+
+        size = self._digest_size
+        data = bytes(self._shm.buf[start * size:(start + n) * size])
+        return [data[i:i + size] for i in range(0, n * size, size)]
+
+    def close(self):
+        """Release the shared memory."""
+
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_digests(name, start, digest_size, digests):
+    """Write digests into a DigestBuffer (e.g. in a worker process).
+
+    Parameters
+    ----------
+    name : str
+        the name of the buffer (see `DigestBuffer.name`)
+    start : int
+        the file ID of the first digest
+    digest_size : int
+        the size of each digest in bytes
+    digests : list of bytes
+        the digests; None (unreadable files) are not written
+
+    """
+
+    try:
+        # not tracked, the buffer is unlinked by its creator
+        shm = shared_memory.SharedMemory(name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = shared_memory.SharedMemory(name)
+    try:
+        buf = shm.buf
+        position = start * digest_size
+        for digest in digests:
+            if digest is not None:
+                buf[position:position + digest_size] = digest
+            position += digest_size
+        del buf
+    finally:
+        shm.close()
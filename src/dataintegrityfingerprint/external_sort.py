@@ -0,0 +1,198 @@
+"""Memory-bounded external sorting of hash lists.
+
+A hash list of `(checksum, path)` tuples that does not fit into memory is
+sorted in runs: entries are collected until the memory budget is reached,
+then the sorted run is spilled to a temporary file. Iterating over the
+sorter merges the runs (and the entries still in memory) in a streaming
+pass. At most `MAX_FAN_IN` runs are merged at once: if there are more, runs
+are first merged into longer runs in further passes. Run files are only
+open while they are merged and their read buffers are taken from the
+memory budget, so that neither the number of open files nor the memory
+grows with the number of runs.
+
+"""
+
+
+import os
+import heapq
+import shutil
+import struct
+import tempfile
+
+
+# Default memory budget of a sorter in bytes
+MEMORY_BUDGET = 256 * 1024 * 1024
+
+# Estimated memory of an entry in addition to the characters (tuple and two
+# str objects)
+ENTRY_OVERHEAD = 200
+
+# Maximum number of runs merged at once
+MAX_FAN_IN = 64
+
+# Length prefix of an entry in a run file: length of checksum and of path
+_LENGTHS = struct.Struct("<HI")
+_MIN_RUN_BUFFER = 8192
+_MAX_RUN_BUFFER = 1024 * 1024
+
+
+def hash_order(entry):
+    """Sort key of the DIF (checksum followed by path)."""
+
+    return entry[0] + entry[1]
+
+
+def path_order(entry):
+    """Sort key of checksums files (path)."""
+
+    return entry[1]
+
+
+class ExternalSorter(object):
+    """Sort `(checksum, path)` tuples with a bounded amount of memory.
+
+    Example
+    -------
+    sorter = ExternalSorter(key=hash_order, memory_budget=64e6)
+    for entry in entries:
+        sorter.add(entry)
+    for checksum, path in sorter:
+        ...
+    sorter.close()
+
+    """
+
+    def __init__(self, key=hash_order, memory_budget=None, tmp_dir=None):
+        """Create an ExternalSorter.
+
+        Parameters
+        ----------
+        key : function, optional
+            the sort key of an entry (default: `hash_order`)
+        memory_budget : int, optional
+            the approximate maximum memory of the entries kept in memory in
+            bytes (default: `MEMORY_BUDGET`)
+        tmp_dir : str, optional
+            the directory of the temporary run files (default: system
+            default)
+
+        """
+
+        self._key = key
+        self._memory_budget = int(memory_budget or MEMORY_BUDGET)
+        self._tmp_dir = tmp_dir
+        self._entries = []
+        self._memory = 0
+        self._run_dir = None
+        self._runs = []  # filenames
+        self._spilled = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def runs(self):
+        """The number of runs spilled to temporary files."""
+
+        return self._spilled
+
+    def add(self, entry):
+        """Add an entry.
+
+        Parameters
+        ----------
+        entry : tuple
+            `(checksum, path)`
+
+        """
+
+        self._entries.append(entry)
+        self._memory += len(entry[0]) + len(entry[1]) + ENTRY_OVERHEAD
+        self._count += 1
+        if self._memory >= self._memory_budget:
+            self._spill()
+
+    def extend(self, entries):
+        """Add several entries."""
+
+        for entry in entries:
+            self.add(entry)
+
+    def _spill(self):
+        self._entries.sort(key=self._key)
+        self._runs.append(self._write_run(self._entries))
+        self._spilled += 1
+        self._entries = []
+        self._memory = 0
+
+    def _write_run(self, entries):
+        # writes sorted entries to a new run file and returns its name
+        if self._run_dir is None:
+            self._run_dir = tempfile.mkdtemp(prefix="dif_sort_",
+                                             dir=self._tmp_dir)
+        fd, filename = tempfile.mkstemp(dir=self._run_dir)
+        pack = _LENGTHS.pack
+        with os.fdopen(fd, "wb", self._buffer_size(1)) as f:
+            for checksum, path in entries:
+                checksum = checksum.encode("utf-8")
+                path = path.encode("utf-8", "surrogateescape")
+                f.write(pack(len(checksum), len(path)))
+                f.write(checksum)
+                f.write(path)
+        return filename
+
+    def _buffer_size(self, n_files):
+        # the buffer of each of n_files open run files; half of the budget
+        # is left for the entries in memory
+        return max(_MIN_RUN_BUFFER, min(
+            _MAX_RUN_BUFFER, self._memory_budget // (2 * (n_files + 1))))
+
+    def __iter__(self):
+        self._entries.sort(key=self._key)
+        if not self._runs:
+            return iter(self._entries)
+        while len(self._runs) > MAX_FAN_IN:
+            # a further pass: the oldest runs are merged into a new run
+            runs = self._runs[:MAX_FAN_IN]
+            buffer_size = self._buffer_size(len(runs))
+            merged = self._write_run(heapq.merge(
+                *[_read_run(x, buffer_size) for x in runs], key=self._key))
+            for filename in runs:
+                os.remove(filename)
+            self._runs = self._runs[MAX_FAN_IN:] + [merged]
+        buffer_size = self._buffer_size(len(self._runs))
+        return heapq.merge(*([_read_run(x, buffer_size) for x in self._runs] +
+                             [iter(self._entries)]), key=self._key)
+
+    def close(self):
+        """Remove the temporary run files and all entries."""
+
+        if self._run_dir is not None:
+            shutil.rmtree(self._run_dir, ignore_errors=True)
+            self._run_dir = None
+        self._runs = []
+        self._entries = []
+        self._memory = 0
+        self._count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _read_run(filename, buffer_size):
+    # yields the entries of a run file
+    size = _LENGTHS.size
+    unpack = _LENGTHS.unpack
+    with open(filename, "rb", buffer_size) as f:
+        while True:
+            lengths = f.read(size)
+            if not lengths:
+                return
+            n_checksum, n_path = unpack(lengths)
+            checksum = f.read(n_checksum).decode("utf-8")
+            path = f.read(n_path).decode("utf-8", "surrogateescape")
+            yield checksum, path
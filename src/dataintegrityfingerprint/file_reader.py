@@ -0,0 +1,217 @@
+"""Reading file content for hashing.
+
+This module provides different I/O modes for reading files:
+
+* "buffered" -- regular buffered reads (default)
+* "nocache"  -- reads with `posix_fadvise` hints, so that the read data is
+                dropped from the page cache and does not evict data of other
+                applications
+* "direct"   -- unbuffered, aligned reads with `O_DIRECT` (bypasses the page
+                cache completely; falls back to "nocache", if the file system
+                does not support it)
+
+On platforms without `posix_fadvise` (e.g. Windows, macOS), all modes fall
+back to "buffered".
+
+"""
+
+
+import os
+import mmap
+import queue
+import threading
+
+
+IO_MODES = ["buffered", "nocache", "direct"]
+BLOCK_SIZE = 64 * 1024
+DIRECT_BLOCK_SIZE = 1024 * 1024  # multiple of the page size
+DROP_INTERVAL = 8 * 1024 * 1024
+READAHEAD_SIZE = 4 * 1024 * 1024
+
+_HAS_FADVISE = hasattr(os, "posix_fadvise")
+_HAS_DIRECT = _HAS_FADVISE and hasattr(os, "O_DIRECT") and \
+    hasattr(os, "readv")
+
+
+def read_blocks(filename, io_mode="buffered"):
+    """Read a file block by block.
+
+    Parameters
+    ----------
+    filename : str
+        the name of the file
+    io_mode : str, optional
+        one of `IO_MODES` (default: "buffered")
+
+    Yields
+    ------
+    block : bytes or memoryview
+        the next block of the file (a memoryview is only valid until the next
+        block is read)
+
+    """
+
+    if io_mode == "direct" and _HAS_DIRECT:
+        try:
+            fd = os.open(filename, os.O_RDONLY | os.O_DIRECT)
+        except OSError:  # e.g. not supported by the file system (tmpfs)
+            pass
+        else:
+            try:
+                for block in _read_direct(fd):
+                    yield block
+            finally:
+                os.close(fd)
+            return
+
+    if io_mode in ("nocache", "direct") and _HAS_FADVISE:
+        fd = os.open(filename, os.O_RDONLY)
+        try:
+            for block in _read_nocache(fd):
+                yield block
+        finally:
+            os.close(fd)
+        return
+
+    # unbuffered file descriptor, so that a small file costs only an open,
+    # one read of its content, one read signalling the end and a close
+    fd = os.open(filename, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        for block in iter(lambda: os.read(fd, BLOCK_SIZE), b''):
+            yield block
+    finally:
+        os.close(fd)
+
+
+def _read_nocache(fd):
+    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    offset = 0
+    dropped = 0
+    while True:
+        block = os.read(fd, BLOCK_SIZE)
+        if not block:
+            break
+        offset += len(block)
+        yield block
+        if offset - dropped >= DROP_INTERVAL:
+            os.posix_fadvise(fd, dropped, offset - dropped,
+                             os.POSIX_FADV_DONTNEED)
+            dropped = offset
+    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def _read_direct(fd):
+    # anonymous memory maps are page aligned as required by O_DIRECT
+    buffer = mmap.mmap(-1, DIRECT_BLOCK_SIZE)
+    view = memoryview(buffer)
+    try:
+        while True:
+            n = os.readv(fd, [buffer])
+            if n == 0:
+                break
+            block = view[:n]
+            try:
+                yield block
+            finally:
+                block.release()
+            if n % mmap.PAGESIZE:  # unaligned short read only at end of file
+                break
+    finally:
+        view.release()
+        buffer.close()
+
+
+def advise_willneed(filename, io_mode="buffered"):
+    """Hint the kernel to start reading the beginning of a file.
+
+    Used to prefetch files that are next in the queue. Does nothing in
+    "direct" mode or if `posix_fadvise` is not available.
+
+    Parameters
+    ----------
+    filename : str
+        the name of the file
+    io_mode : str, optional
+        one of `IO_MODES` (default: "buffered")
+
+    """
+
+    if not _HAS_FADVISE or io_mode == "direct":
+        return
+    try:
+        fd = os.open(filename, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, READAHEAD_SIZE, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def read_with_timeout(blocks, timeout):
+    """Read blocks and give up, if a block takes too long.
+
+    The blocks are read by a background thread. A read that hangs (e.g. on
+    an unresponsive network file system) cannot be interrupted; it is
+    abandoned and its thread ends when the read returns.
+
+    Parameters
+    ----------
+    blocks : iterator
+        the blocks (e.g. of `read_blocks`)
+    timeout : float
+        the maximum time in seconds to wait for each block
+
+    Yields
+    ------
+    block : bytes
+
+    Raises
+    ------
+    TimeoutError
+        if a block has not been read within the timeout
+
+    """
+
+    results = queue.Queue(maxsize=2)
+    abandoned = threading.Event()
+
+    def put(item):
+        # gives up, if the reader has been abandoned
+        while not abandoned.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for block in blocks:
+                if not put((True, bytes(block))):  # memoryviews are reused
+                    return
+            put((True, None))
+        except BaseException as err:
+            put((False, err))
+        finally:
+            if hasattr(blocks, "close"):
+                blocks.close()
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            try:
+                ok, value = results.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError("No data read within {0} s".format(
+                    timeout))
+            if not ok:
+                raise value
+            if value is None:
+                return
+            yield value
+    finally:
+        abandoned.set()
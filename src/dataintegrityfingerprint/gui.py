@@ -7,6 +7,8 @@ Invoke with `python3 -m dataintegrityfingerprint.gui` or
 
 
 import os
+import time
+import queue
 import platform
 import multiprocessing
 from threading import Thread
@@ -19,8 +21,21 @@ from . import __version__
 from .dif import DataIntegrityFingerprint as DIF
 from .dif import new_hash_instance
 
+
+# Interval of polling messages from the worker thread (in ms)
+POLL_INTERVAL = 100
+# Maximum number of checksums added to the list per poll
+MAX_RESULTS_PER_POLL = 5000
+
+
 class App(ttk.Frame):
-    """The main GUI application."""
+    """The main GUI application.
+
+    Long running tasks run in a worker thread, which never touches the
+    widgets; it puts messages into a queue that is polled from the Tk main
+    loop with `after()`.
+
+    """
 
     def __init__(self, master, *args, **kwargs):
         """Initialize the GUI application."""
@@ -36,6 +51,10 @@ Oliver Lindemann <oliver@expyriment.org>
 Florian Krause <florian@expyriment.org>
 """.format(__version__)
         self.dif = None
+        self.queue = queue.Queue()
+        self.generating = False
+        self.opening = False
+        self.start_time = None
         self.create_widgets()
         self.dir_button.focus()
 
@@ -56,13 +75,9 @@ Florian Krause <florian@expyriment.org>
         self.file_menu = tk.Menu(self.menubar)
         self.menubar.add_cascade(menu=self.file_menu, label="File")
         self.file_menu.add_command(label="Open checksums",
-                                   command=lambda: Thread(
-                                       target=self.open_checksums,
-                                       daemon=True).start(),
+                                   command=self.open_checksums,
                                    accelerator="{0}-O".format(modifier))
-        self.master.bind("<{0}-o>".format(modifier),
-                         lambda event: Thread(target=self.open_checksums,
-                                              daemon=True).start())
+        self.master.bind("<{0}-o>".format(modifier), self.open_checksums)
         self.file_menu.add_command(label="Save checksums",
                                    command=self.save_checksums,
                                    accelerator="{0}-S".format(modifier))
@@ -140,9 +155,7 @@ Florian Krause <florian@expyriment.org>
         self.dir_button.grid(row=0, column=2)
         self.generate_button = ttk.Button(
             self.frame1, text="Generate DIF",
-            command=lambda: Thread(target=self.generate_dif,
-                                   daemon=True).start(),
-            state=tk.DISABLED)
+            command=self.generate_or_cancel, state=tk.DISABLED)
         self.generate_button.grid(row=0, column=3)
 
         self.progressbar = ttk.Progressbar(self.master)
@@ -210,25 +223,33 @@ Florian Krause <florian@expyriment.org>
             self.statusbar["text"] = "Ready"
             self.unblock_gui(enable_save_checksums=False)
 
+    @property
+    def busy(self):
+        """Whether checksums are being generated or opened."""
+
+        return self.generating or self.opening
+
     def set_dif_label(self, *args):
         self.dif_label.config(text="DIF [{0}]:".format(
             self.algorithm_var.get()))
 
     def block_gui(self):
-        """Block GUI from user entry."""
+        """Block GUI from user entry (except for cancelling)."""
 
+        self.dir_button["state"] = tk.DISABLED
         self.file_menu.entryconfig("Open checksums", state=tk.DISABLED)
         self.file_menu.entryconfig("Save checksums", state=tk.DISABLED)
+        self.edit_menu.entryconfig("Diff checksums", state=tk.DISABLED)
         self.options_menu.entryconfig("Hash algorithm", state=tk.DISABLED)
         self.options_menu.entryconfig("Progress updating", state=tk.DISABLED)
         self.options_menu.entryconfig("Multi-core processing",
                                       state=tk.DISABLED)
         self.help_menu.entryconfig("About", state=tk.DISABLED)
-        self.progressbar.grab_set()
 
     def unblock_gui(self, enable_save_checksums=True):
         """Unblock GUI from user entry."""
 
+        self.dir_button["state"] = tk.NORMAL
         self.file_menu.entryconfig("Open checksums", state=tk.NORMAL)
         if enable_save_checksums:
             self.file_menu.entryconfig("Save checksums", state=tk.NORMAL)
@@ -239,20 +260,27 @@ Florian Krause <florian@expyriment.org>
         self.options_menu.entryconfig("Multi-core processing",
                                       state=tk.NORMAL)
         self.help_menu.entryconfig("About", state=tk.NORMAL)
-        self.progressbar.grab_release()
 
-    def generate_dif(self, *args):
-        """Generate DIF from data directory"""
+    def generate_or_cancel(self, *args):
+        """Generate DIF or cancel the running generation."""
 
-        def _progress(count, total, status=''):
-            """Progress callback function"""
+        if self.generating:
+            self.cancel_dif()
+        elif not self.busy:
+            self.generate_dif()
 
-            percents = int(100.0 * count / float(total))
-            self.progressbar["value"] = percents
-            self.statusbar["text"] = \
-                "Generating DIF...{0}% ({1})".format(percents, status)
+    def generate_dif(self, *args):
+        """Generate DIF from data directory (in a worker thread)."""
 
         self.block_gui()
+        self.generating = True
+        self.generate_button["text"] = "Cancel"
+        self.progressbar["value"] = 0
+        self.checksum_list["state"] = tk.NORMAL
+        self.checksum_list.delete(1.0, tk.END)
+        self.checksum_list["state"] = tk.DISABLED
+        self.dif_var.set("")
+        self.copy_button["state"] = tk.DISABLED
         self.statusbar["text"] = "Generating DIF..."
         if self.multiprocess_var.get() == 1:
             multiprocessing = True
@@ -262,25 +290,125 @@ Florian Krause <florian@expyriment.org>
                        hash_algorithm=self.algorithm_var.get(),
                        multiprocessing=multiprocessing)
         if self.update_var.get() == 1:
-            progress = _progress
+            result = lambda checksum, path: self.queue.put(
+                ("result", u"{0}{1}{2}".format(
+                    checksum, DIF.CHECKSUM_FILENAME_SEPARATOR, path)))
         else:
-            progress = None
-        self.dif.generate(progress=progress)
-        self.progressbar["value"] = 100
+            result = None
+        self.start_time = time.time()
+        Thread(target=self._generate, args=(self.dif, result),
+               daemon=True).start()
+        self.after(POLL_INTERVAL, self.poll_queue)
+
+    def _generate(self, dif, result):
+        # runs in the worker thread
+        try:
+            completed = dif.generate(result=result)
+        except Exception as e:
+            self.queue.put(("error", str(e)))
+        else:
+            self.queue.put(("done", completed))
+
+    def cancel_dif(self, *args):
+        """Cancel the generation of the DIF."""
+
+        if self.dif is not None:
+            self.generate_button["state"] = tk.DISABLED
+            self.statusbar["text"] = "Cancelling..."
+            self.dif.cancel()
+
+    def poll_queue(self):
+        """Process the messages of the worker thread."""
+
+        lines = []
+        finished = None
+        try:
+            while len(lines) < MAX_RESULTS_PER_POLL:
+                message = self.queue.get_nowait()
+                if message[0] == "result":
+                    lines.append(message[1])
+                else:
+                    finished = message
+                    break
+        except queue.Empty:
+            pass
+        if lines:
+            self.checksum_list["state"] = tk.NORMAL
+            self.checksum_list.insert(tk.END, "\n".join(lines) + "\n")
+            self.checksum_list["state"] = tk.DISABLED
+        if finished is None:
+            if self.generating:
+                self.show_progress()
+            self.after(POLL_INTERVAL, self.poll_queue)
+        elif finished[0] == "error":
+            self.finish_generation()
+            self.statusbar["text"] = "Error"
+            messagebox.showerror("Error", finished[1])
+        else:
+            self.finish_generation(completed=finished[1])
+
+    def show_progress(self):
+        """Show progress, throughput and estimated time remaining."""
+
+        stats = self.dif.stats
+        if "files_done" not in stats:  # still collecting files
+            return
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        files, total_files = stats["files_done"], stats["files"]
+        done, total = stats["bytes_done"], stats["bytes"]
+        bytes_per_second = done / elapsed
+        if total:
+            fraction = done / float(total)
+        elif total_files:
+            fraction = files / float(total_files)
+        else:
+            fraction = 0
+        eta = "--:--:--"
+        if bytes_per_second > 0 and total:
+            eta = time.strftime("%H:%M:%S", time.gmtime(
+                (total - done) / bytes_per_second))
+        self.progressbar["value"] = int(100 * fraction)
+        self.statusbar["text"] = \
+            "Generating DIF...{0}% ({1}/{2} files, {3:.1f} MB/s, " \
+            "{4:.0f} files/s, ETA {5})".format(
+                int(100 * fraction), files, total_files,
+                bytes_per_second / 1e6, files / elapsed, eta)
+
+    def finish_generation(self, completed=False):
+        """Show the (partial) result of a generation."""
+
+        self.generating = False
+        self.generate_button["text"] = "Generate DIF"
+        self.generate_button["state"] = tk.NORMAL
+        # nothing hashed: reading the (empty) hash list would generate again
+        hash_list = self.dif.file_hash_list \
+            if self.dif.stats.get("files_done") else []
+        # list sorted by path, also if the results were added unsorted
         self.checksum_list["state"] = tk.NORMAL
         self.checksum_list.delete(1.0, tk.END)
-        self.checksum_list.insert(1.0, self.dif.checksums.strip("\n"))
+        self.checksum_list.insert(1.0, "\n".join(
+            u"{0}{1}{2}".format(h, DIF.CHECKSUM_FILENAME_SEPARATOR, fl)
+            for h, fl in sorted(hash_list, key=lambda x: x[1])))
         self.checksum_list["state"] = tk.DISABLED
-        self.dif_var.set(self.dif.dif)
-        self.set_dif_label()
-        self.copy_button["state"] = tk.NORMAL
-        self.copy_button.focus()
-        self.statusbar["text"] = "Done"
-        self.unblock_gui()
+        if completed:
+            self.progressbar["value"] = 100
+            self.dif_var.set(self.dif.dif if len(hash_list) else "")
+            self.set_dif_label()
+            self.copy_button["state"] = tk.NORMAL
+            self.copy_button.focus()
+            self.statusbar["text"] = "Done ({0:.1f} s)".format(
+                self.dif.stats["elapsed"])
+        else:
+            self.statusbar["text"] = "Cancelled after {0} of {1} files " \
+                "(partial checksums can be saved)".format(
+                    len(hash_list), self.dif.stats.get("files", 0))
+        self.unblock_gui(enable_save_checksums=len(hash_list) > 0)
 
     def open_checksums(self, *args):
-        """Open checksums file."""
+        """Open checksums file (e.g. also partial results)."""
 
+        if self.busy:  # also via the keyboard shortcut
+            return
         allowed_extensions = ""
         for algorithm in DIF.CRYPTOGRAPHIC_ALGORITHMS:
             extension = "".join(x for x in algorithm.lower() if x.isalnum())
@@ -288,47 +416,66 @@ Florian Krause <florian@expyriment.org>
         filetypes = [("Checksums files", allowed_extensions.strip())]
         filename = filedialog.askopenfilename(filetypes=filetypes)
         if os.path.exists(filename):
-            try:
-                self.block_gui()
-                old_status = self.statusbar["text"]
-                old_progress_mode = self.progressbar["mode"]
-                old_progress_value = self.progressbar["value"]
-                self.progressbar["mode"] = "indeterminate"
-                self.progressbar["value"] = 0
-                self.progressbar.start()
-                self.statusbar["text"] = "Opening checksums..."
-                algorithm = os.path.splitext(filename)[-1].strip(".")
-                self.dif = DIF(filename, from_checksums_file=True,
-                               hash_algorithm=self.algorithm_var.get())
-                master_hash = self.dif.dif
-                checksums = self.dif.checksums.strip("\n")
-                self.dir_var.set("")
-                self.generate_button["state"] = tk.DISABLED
-                self.progressbar.stop()
-                self.progressbar["mode"] = "determinate"
-                self.progressbar["value"] = 100
-                self.checksum_list["state"] = tk.NORMAL
-                self.checksum_list.delete(1.0, tk.END)
-                self.checksum_list.insert(1.0, checksums)
-                self.checksum_list["state"] = tk.DISABLED
-                self.set_dif_label()
-                self.dif_var.set(master_hash)
-                self.copy_button["state"] = tk.NORMAL
-                self.copy_button.focus()
-                self.statusbar["text"] = filename
-                self.unblock_gui()
-            except Exception:
-                self.progressbar.stop()
-                self.progressbar["mode"] = old_progress_mode
-                self.progressbar["value"] = old_progress_value
-                self.statusbar["text"] = old_status
-                self.unblock_gui()
-                messagebox.showerror("Error", "Not a valid checksums file")
-                self.unblock_gui()
+            self.opening = True
+            self.block_gui()
+            self.old_status = (self.statusbar["text"],
+                               self.progressbar["value"])
+            self.progressbar["mode"] = "indeterminate"
+            self.progressbar["value"] = 0
+            self.progressbar.start()
+            self.statusbar["text"] = "Opening checksums..."
+            Thread(target=self._open_checksums,
+                   args=(filename, self.algorithm_var.get()),
+                   daemon=True).start()
+            self.after(POLL_INTERVAL, self.poll_open_checksums)
+
+    def _open_checksums(self, filename, algorithm):
+        # runs in the worker thread
+        try:
+            dif = DIF(filename, from_checksums_file=True,
+                      hash_algorithm=algorithm)
+            self.queue.put(("opened", filename, dif, dif.dif,
+                            dif.checksums.strip("\n")))
+        except Exception:
+            self.queue.put(("error", filename))
+
+    def poll_open_checksums(self):
+        """Show the opened checksums file, once it has been read."""
+
+        try:
+            message = self.queue.get_nowait()
+        except queue.Empty:
+            self.after(POLL_INTERVAL, self.poll_open_checksums)
+            return
+        self.opening = False
+        self.progressbar.stop()
+        self.progressbar["mode"] = "determinate"
+        if message[0] == "error":
+            self.statusbar["text"], self.progressbar["value"] = \
+                self.old_status
+            self.unblock_gui()
+            messagebox.showerror("Error", "Not a valid checksums file")
+            return
+        _, filename, self.dif, master_hash, checksums = message
+        self.dir_var.set("")
+        self.generate_button["state"] = tk.DISABLED
+        self.progressbar["value"] = 100
+        self.checksum_list["state"] = tk.NORMAL
+        self.checksum_list.delete(1.0, tk.END)
+        self.checksum_list.insert(1.0, checksums)
+        self.checksum_list["state"] = tk.DISABLED
+        self.set_dif_label()
+        self.dif_var.set(master_hash)
+        self.copy_button["state"] = tk.NORMAL
+        self.copy_button.focus()
+        self.statusbar["text"] = filename
+        self.unblock_gui()
 
     def save_checksums(self, *args):
         """Save checksums file."""
 
+        if self.busy:  # also via the keyboard shortcut
+            return
         if self.checksum_list.get(1.0, tk.END).strip("\n") != "":
             algorithm = self.algorithm_var.get()
             extension = "".join(x for x in algorithm.lower() if x.isalnum())
@@ -345,6 +492,8 @@ Florian Krause <florian@expyriment.org>
     def diff_checksums(self, *args):
         """Calculate difference of checksums to checksums file."""
 
+        if self.busy or self.dif is None:
+            return
         allowed_extensions = ""
         for algorithm in DIF.CRYPTOGRAPHIC_ALGORITHMS:
             extension = "".join(x for x in algorithm.lower() if x.isalnum())
@@ -0,0 +1,254 @@
+"""Manifest formats.
+
+This module provides streaming writers and readers for checksums files
+(manifests) in standard formats, so that they can be used by other tools:
+
+* "dif"       -- the DIF checksums file (`checksum  path`)
+* "bagit"     -- BagIt payload manifest (`manifest-<algorithm>.txt`), paths
+                 are prefixed with "data/" and CR, LF and % are
+                 percent-encoded (RFC 8493)
+* "coreutils" -- GNU coreutils format as read by `sha256sum -c` etc.,
+                 paths containing backslashes or newlines are escaped
+* "jsonl"     -- JSON Lines with one object per file containing `path`,
+                 `checksum`, `algorithm`, `size` and `mtime_ns`
+
+Writers consume an iterable of `(checksum, path)` tuples and write line by
+line; readers are generators. Memory usage is thus independent of the number
+of entries.
+
+"""
+
+
+import os
+import json
+import functools
+
+from .openssl_hash_algorithm import OpenSSLHashAlgorithm
+
+
+FORMATS = ["dif", "bagit", "coreutils", "jsonl"]
+
+_DIF_SEPARATOR = "  "
+_BAGIT_PAYLOAD_DIR = "data/"
+
+
+def algorithm_name(hash_algorithm):
+    """Get the lower case (hashlib) name of a hash algorithm.
+
+    Parameters
+    ----------
+    hash_algorithm : str
+        the hash algorithm according to the DIF naming convention
+
+    Returns
+    -------
+    name : str
+        e.g. "sha256" for "SHA-256" or "crc32" for "CRC-32"
+
+    """
+
+    return OpenSSLHashAlgorithm.HASHLIB_NAMES.get(
+        hash_algorithm, hash_algorithm.lower().replace("-", ""))
+
+
+def default_filename(data, hash_algorithm, manifest_format):
+    """Get the default filename of a manifest.
+
+    Parameters
+    ----------
+    data : str
+        the path to the data directory
+    hash_algorithm : str
+        the hash algorithm
+    manifest_format : str
+        one of `FORMATS`
+
+    Returns
+    -------
+    filename : str
+
+    """
+
+    name = algorithm_name(hash_algorithm)
+    data = os.path.split(os.path.abspath(data))[-1]
+    if manifest_format == "bagit":
+        return "manifest-{0}.txt".format(name)
+    elif manifest_format == "coreutils":
+        return "{0}.{1}sum".format(data, name)
+    elif manifest_format == "jsonl":
+        return "{0}.{1}.jsonl".format(data, name.replace("_", ""))
+    return "{0}.{1}".format(data, name.replace("_", ""))
+
+
+def write_manifest(filename, entries, manifest_format="dif",
+                   hash_algorithm=None, data=None, file_stats=None):
+    """Write a manifest.
+
+    Parameters
+    ----------
+    filename : str
+        the name of the manifest file
+    entries : iterable
+        `(checksum, path)` tuples with paths relative to the data directory
+    manifest_format : str, optional
+        one of `FORMATS` (default: "dif")
+    hash_algorithm : str, optional
+        the hash algorithm (required for "jsonl")
+    data : str, optional
+        the data directory to read size and modification time of the files
+        from (used by "jsonl" only)
+    file_stats : dict, optional
+        `(size, mtime_ns)` for each path, which is used instead of reading
+        them from the data directory (used by "jsonl" only)
+
+    Returns
+    -------
+    count : int
+        the number of written entries
+
+    """
+
+    if manifest_format not in FORMATS:
+        raise ValueError("{0} is not a supported manifest format.".format(
+            manifest_format))
+    format_line = {"dif": _format_dif,
+                   "bagit": _format_bagit,
+                   "coreutils": _format_coreutils,
+                   "jsonl": _format_jsonl}[manifest_format]
+    if manifest_format == "jsonl":
+        format_line = functools.partial(format_line,
+                                        file_stats=file_stats or {})
+    count = 0
+    # no newline translation; lines only end at "\n"
+    with open(filename, "w", encoding="utf-8", newline="\n") as f:
+        for checksum, path in entries:
+            f.write(format_line(checksum, path, hash_algorithm, data))
+            count += 1
+    return count
+
+
+def read_manifest(filename, manifest_format="dif"):
+    """Read a manifest.
+
+    Parameters
+    ----------
+    filename : str
+        the name of the manifest file
+    manifest_format : str, optional
+        one of `FORMATS` (default: "dif")
+
+    Yields
+    ------
+    entry : tuple
+        `(checksum, path)` with paths relative to the data directory
+
+    """
+
+    if manifest_format == "jsonl":
+        for record in read_jsonl(filename):
+            yield record["checksum"], record["path"]
+        return
+    if manifest_format not in FORMATS:
+        raise ValueError("{0} is not a supported manifest format.".format(
+            manifest_format))
+    parse_line = {"dif": _parse_dif,
+                  "bagit": _parse_bagit,
+                  "coreutils": _parse_coreutils}[manifest_format]
+    with open(filename, encoding="utf-8", newline="\n") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if line:
+                yield parse_line(line)
+
+
+def read_jsonl(filename):
+    """Read all fields of a JSON Lines manifest.
+
+    Parameters
+    ----------
+    filename : str
+        the name of the manifest file
+
+    Yields
+    ------
+    record : dict
+        with the keys `path`, `checksum`, `algorithm`, `size` and
+        `mtime_ns`
+
+    """
+
+    with open(filename, encoding="utf-8", newline="\n") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _format_dif(checksum, path, hash_algorithm, data):
+    return u"{0}{1}{2}\n".format(checksum, _DIF_SEPARATOR, path)
+
+
+def _parse_dif(line):
+    checksum, path = line.split(_DIF_SEPARATOR, 1)
+    return checksum, path.strip()
+
+
+def _format_bagit(checksum, path, hash_algorithm, data):
+    path = path.replace("%", "%25").replace("\r", "%0D").replace("\n", "%0A")
+    return u"{0}  {1}{2}\n".format(checksum, _BAGIT_PAYLOAD_DIR, path)
+
+
+def _parse_bagit(line):
+    checksum, path = line.split(None, 1)
+    path = path.lstrip()
+    if path.startswith(_BAGIT_PAYLOAD_DIR):
+        path = path[len(_BAGIT_PAYLOAD_DIR):]
+    path = path.replace("%0A", "\n").replace("%0a", "\n")
+    path = path.replace("%0D", "\r").replace("%0d", "\r")
+    return checksum, path.replace("%25", "%")
+
+
+def _format_coreutils(checksum, path, hash_algorithm, data):
+    if "\\" in path or "\n" in path or "\r" in path:
+        path = path.replace("\\", "\\\\").replace("\n", "\\n")
+        path = path.replace("\r", "\\r")
+        return u"\\{0}  {1}\n".format(checksum, path)
+    return u"{0}  {1}\n".format(checksum, path)
+
+
+def _parse_coreutils(line):
+    escaped = line.startswith("\\")
+    if escaped:
+        line = line[1:]
+    checksum, path = line.split(" ", 1)
+    if path.startswith((" ", "*")):  # text or binary mode indicator
+        path = path[1:]
+    if escaped:
+        chars = []
+        i = 0
+        while i < len(path):
+            if path[i] == "\\" and i + 1 < len(path):
+                chars.append({"n": "\n", "r": "\r"}.get(path[i + 1],
+                                                        path[i + 1]))
+                i += 2
+            else:
+                chars.append(path[i])
+                i += 1
+        path = "".join(chars)
+    return checksum, path
+
+
+def _format_jsonl(checksum, path, hash_algorithm, data, file_stats):
+    size = mtime_ns = None
+    if path in file_stats:
+        size, mtime_ns = file_stats[path]
+    elif data is not None:
+        try:
+            st = os.stat(os.path.join(data, path))
+        except OSError:
+            pass
+        else:
+            size = st.st_size
+            mtime_ns = st.st_mtime_ns
+    return json.dumps({"path": path, "checksum": checksum,
+                       "algorithm": hash_algorithm, "size": size,
+                       "mtime_ns": mtime_ns}, ensure_ascii=False) + "\n"
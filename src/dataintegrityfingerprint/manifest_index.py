@@ -0,0 +1,294 @@
+"""Manifest index.
+
+A manifest index is a binary checksums file that can be memory-mapped. Its
+header contains the hash algorithm, the DIF and the number of entries, so
+that two manifests can be compared in O(1) by their DIFs without reading
+the entries. The entries are sorted by path and located via a table of
+offsets, so that the checksum of a single file is looked up in O(log n).
+
+File layout (little endian):
+
+* header: magic, format version, hash algorithm, DIF, entry count and the
+  offset of the offset table
+* records: `(length of checksum, length of path, checksum, path)` for each
+  entry, sorted by the UTF-8 encoded path
+* offset table: the offset of each record (uint64)
+
+"""
+
+
+import os
+import sys
+import mmap
+import array
+import struct
+import bisect
+
+
+INDEX_EXTENSION = ".difidx"
+
+_MAGIC = b"DIFIDX\x00\x00"
+_VERSION = 1
+# magic, version, algorithm, dif, count, offset table
+_HEADER = struct.Struct("<8sH32s128sQQ")
+_RECORD = struct.Struct("<HI")
+_OFFSET = struct.Struct("<Q")
+
+
+def write_index(filename, entries, dif, hash_algorithm):
+    """Write a manifest index.
+
+    Parameters
+    ----------
+    filename : str
+        the name of the index file
+    entries : iterable
+        `(checksum, path)` tuples sorted by path
+    dif : str
+        the DIF of the entries
+    hash_algorithm : str
+        the hash algorithm
+
+    Returns
+    -------
+    count : int
+        the number of written entries
+
+    """
+
+    offsets = array.array("Q")
+    last = None
+    with open(filename, "wb") as f:
+        f.write(b"\x00" * _HEADER.size)  # written at the end
+        position = _HEADER.size
+        for checksum, path in entries:
+            path = path.encode("utf-8", "surrogateescape")
+            if last is not None and path <= last:
+                raise ValueError("Entries are not sorted by path: " +
+                                 "{0}".format(path.decode("utf-8",
+                                                          "replace")))
+            last = path
+            checksum = checksum.encode("ascii")
+            offsets.append(position)
+            f.write(_RECORD.pack(len(checksum), len(path)))
+            f.write(checksum)
+            f.write(path)
+            position += _RECORD.size + len(checksum) + len(path)
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        f.write(offsets.tobytes())
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, _VERSION,
+                             hash_algorithm.encode("ascii"),
+                             (dif or "").encode("ascii"), len(offsets),
+                             position))
+    return len(offsets)
+
+
+class ManifestIndex(object):
+    """A memory-mapped manifest index.
+
+    Example
+    -------
+    with ManifestIndex("dataset.sha256.difidx") as index:
+        if index == ManifestIndex("old.sha256.difidx"):
+            ...  # identical DIF
+        checksum = index.lookup("subdir/file.txt")
+
+    """
+
+    def __init__(self, filename):
+        """Open a ManifestIndex.
+
+        Parameters
+        ----------
+        filename : str
+            the name of the index file
+
+        """
+
+        self._filename = filename
+        with open(filename, "rb") as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size or \
+                    header[:len(_MAGIC)] != _MAGIC:
+                raise ValueError("{0} is not a manifest index.".format(
+                    filename))
+            (_, version, hash_algorithm, dif, self._count,
+             self._table) = _HEADER.unpack(header)
+            if version != _VERSION:
+                raise ValueError(
+                    "Unsupported manifest index version {0}.".format(version))
+            self._hash_algorithm = hash_algorithm.rstrip(b"\x00").decode(
+                "ascii")
+            self._dif = dif.rstrip(b"\x00").decode("ascii") or None
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @property
+    def hash_algorithm(self):
+        return self._hash_algorithm
+
+    @property
+    def dif(self):
+        return self._dif
+
+    def __len__(self):
+        return self._count
+
+    def __eq__(self, other):
+        """Compare the DIFs (and hash algorithms) of two indexes."""
+
+        if not isinstance(other, ManifestIndex):
+            return NotImplemented
+        return self._dif is not None and self._dif == other._dif and \
+            self._hash_algorithm == other._hash_algorithm
+
+    def __ne__(self, other):
+        rtn = self.__eq__(other)
+        return rtn if rtn is NotImplemented else not rtn
+
+    __hash__ = None
+
+    def _offset(self, i):
+        return _OFFSET.unpack_from(self._mmap,
+                                   self._table + i * _OFFSET.size)[0]
+
+    def _record(self, i):
+        # returns (checksum, path) as bytes
+        offset = self._offset(i)
+        n_checksum, n_path = _RECORD.unpack_from(self._mmap, offset)
+        start = offset + _RECORD.size
+        return (self._mmap[start:start + n_checksum],
+                self._mmap[start + n_checksum:start + n_checksum + n_path])
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("index out of range")
+        checksum, path = self._record(i)
+        return (checksum.decode("ascii"),
+                path.decode("utf-8", "surrogateescape"))
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def lookup(self, path):
+        """Look up the checksum of a file (binary search).
+
+        Parameters
+        ----------
+        path : str
+            the path relative to the data directory
+
+        Returns
+        -------
+        checksum : str or None
+            the checksum (None, if the path is not in the index)
+
+        """
+
+        key = path.encode("utf-8", "surrogateescape")
+        i = bisect.bisect_left(_Paths(self), key)
+        if i < self._count:
+            checksum, found = self._record(i)
+            if found == key:
+                return checksum.decode("ascii")
+        return None
+
+    def __contains__(self, path):
+        return self.lookup(path) is not None
+
+    def verify(self, data, path):
+        """Verify a single file against the index.
+
+        Parameters
+        ----------
+        data : str
+            the data directory
+        path : str
+            the path relative to the data directory
+
+        Returns
+        -------
+        ok : bool or None
+            whether the file has the checksum of the index (None, if the
+            path is not in the index)
+
+        """
+
+        from .dif import _hash_file_content
+
+        checksum = self.lookup(path)
+        if checksum is None:
+            return None
+        filename = os.path.join(data, *path.split("/"))
+        try:
+            actual, _ = _hash_file_content((filename, self._hash_algorithm))
+        except OSError:
+            return False
+        return actual == checksum
+
+    def diff(self, other):
+        """Compare the entries to another index (merging by path).
+
+        Parameters
+        ----------
+        other : ManifestIndex
+
+        Yields
+        ------
+        difference : tuple
+            `("-", checksum, path)` for entries only in `other` and
+            `("+", checksum, path)` for entries only in this index (a
+            changed checksum results in both)
+
+        """
+
+        if self == other:
+            return
+        i = j = 0
+        while i < self._count or j < other._count:
+            mine = self._record(i) if i < self._count else None
+            theirs = other._record(j) if j < other._count else None
+            if theirs is None or (mine is not None and mine[1] < theirs[1]):
+                yield ("+",) + self[i]
+                i += 1
+            elif mine is None or theirs[1] < mine[1]:
+                yield ("-",) + other[j]
+                j += 1
+            else:
+                if mine[0] != theirs[0]:
+                    yield ("-",) + other[j]
+                    yield ("+",) + self[i]
+                i += 1
+                j += 1
+
+    def close(self):
+        """Close the memory map."""
+
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _Paths(object):
+    # sequence view of the encoded paths for `bisect`
+
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, i):
+        return self._index._record(i)[1]
@@ -0,0 +1,398 @@
+"""Metrics of DIF generation for monitoring (Prometheus/OpenMetrics).
+
+A `Metrics` object is updated by `DataIntegrityFingerprint.generate()` once
+per finished task (a batch of files), i.e. with negligible overhead, and can
+be exported while generating:
+
+* `MetricsServer`    -- an HTTP endpoint (e.g. http://127.0.0.1:9464/metrics)
+                        to be scraped by Prometheus
+* `TextfileExporter` -- a file that is rewritten periodically, e.g. for the
+                        textfile collector of the Prometheus node exporter
+
+Exported metrics:
+
+    dif_files_hashed_total                    files hashed (counter)
+    dif_bytes_hashed_total                    bytes hashed (counter)
+    dif_errors_total                          files that could not be hashed
+    dif_files, dif_bytes                      files and bytes to hash
+    dif_throughput_bytes_per_second           recent throughput
+    dif_throughput_files_per_second
+    dif_queue_depth                           tasks waiting for a worker
+    dif_workers                               number of workers
+    dif_workers_busy                          workers with a task
+    dif_worker_utilization_estimate           busy workers / workers
+    dif_running                               1 while generating
+    dif_last_progress_timestamp_seconds       time of the last finished task
+
+Queue depth and busy workers are estimated from the number of unfinished
+tasks (workers are assumed to be busy, while tasks are outstanding), since
+the workers themselves are not instrumented; waits for I/O within a task
+count as busy.
+
+Example
+-------
+metrics = Metrics()
+with MetricsServer(metrics, port=9464):
+    DataIntegrityFingerprint("/data", metrics=metrics).generate()
+
+"""
+
+
+import os
+import time
+import threading
+import collections
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+
+# time window of the throughput in seconds
+THROUGHPUT_WINDOW = 10.0
+
+_CONTENT_TYPES = {
+    False: "text/plain; version=0.0.4; charset=utf-8",
+    True: "application/openmetrics-text; version=1.0.0; charset=utf-8"}
+
+
+class Metrics(object):
+    """Metrics of DIF generation."""
+
+    def __init__(self, labels=None):
+        """Create Metrics.
+
+        Parameters
+        ----------
+        labels : dict, optional
+            labels added to all metrics (e.g. `{"node": "storage-03"}`)
+
+        """
+
+        self._labels = dict(labels or {})
+        self._lock = threading.Lock()
+        self.files_hashed = 0
+        self.bytes_hashed = 0
+        self.errors = 0
+        self.files = 0
+        self.bytes = 0
+        self.tasks = 0
+        self.tasks_done = 0
+        self.workers = 0
+        self.running = False
+        self.last_progress = None
+        self._samples = collections.deque()  # (time, files, bytes)
+
+    def start(self, files, n_bytes, tasks, workers):
+        """Start a generation.
+
+        Parameters
+        ----------
+        files : int
+            the number of files to hash
+        n_bytes : int
+            the number of bytes to hash (None, if unknown)
+        tasks : int
+            the number of tasks handed to the workers
+        workers : int
+            the number of workers
+
+        """
+
+        with self._lock:
+            self.files = files
+            self.bytes = n_bytes or 0
+            self.tasks = tasks
+            self.tasks_done = 0
+            self.workers = workers
+            self.running = True
+            self.last_progress = time.time()
+            self._samples.clear()
+            self._samples.append((self.last_progress, self.files_hashed,
+                                  self.bytes_hashed))
+
+    def update(self, files, n_bytes, tasks=1):
+        """Count a finished task.
+
+        Parameters
+        ----------
+        files : int
+            the number of files hashed by the task
+        n_bytes : int
+            the number of bytes hashed by the task
+        tasks : int, optional
+            the number of tasks (default: 1)
+
+        """
+
+        now = time.time()
+        with self._lock:
+            self.files_hashed += files
+            self.bytes_hashed += n_bytes
+            self.tasks_done += tasks
+            self.last_progress = now
+            samples = self._samples
+            samples.append((now, self.files_hashed, self.bytes_hashed))
+            while len(samples) > 2 and \
+                    samples[1][0] < now - THROUGHPUT_WINDOW:
+                samples.popleft()
+
+    def error(self, n=1):
+        """Count files that could not be hashed."""
+
+        with self._lock:
+            self.errors += n
+
+    def finish(self):
+        """Finish a generation."""
+
+        with self._lock:
+            self.running = False
+            self.tasks_done = self.tasks
+
+    def snapshot(self):
+        """Get the current values of all metrics.
+
+        Returns
+        -------
+        values : dict
+            metric name (without `dif_` prefix and `_total` suffix) -> value
+
+        """
+
+        now = time.time()
+        with self._lock:
+            outstanding = max(0, self.tasks - self.tasks_done) \
+                if self.running else 0
+            busy = min(self.workers, outstanding)
+            files_per_second = bytes_per_second = 0.0
+            if self.running and self._samples:
+                # over the window until now, so that stalls show up as 0
+                t, files, n_bytes = self._samples[0]
+                if now - t > 0:
+                    files_per_second = (self.files_hashed - files) / (now - t)
+                    bytes_per_second = (self.bytes_hashed - n_bytes) / \
+                        (now - t)
+            return collections.OrderedDict([
+                ("files_hashed", self.files_hashed),
+                ("bytes_hashed", self.bytes_hashed),
+                ("errors", self.errors),
+                ("files", self.files),
+                ("bytes", self.bytes),
+                ("throughput_bytes_per_second", bytes_per_second),
+                ("throughput_files_per_second", files_per_second),
+                ("queue_depth", max(0, outstanding - busy)),
+                ("workers", self.workers),
+                ("workers_busy", busy),
+                ("worker_utilization_estimate",
+                 busy / self.workers if self.workers else 0.0),
+                ("running", int(self.running)),
+                ("last_progress_timestamp_seconds",
+                 self.last_progress or 0.0)])
+
+    def render(self, openmetrics=False):
+        """Get the metrics in the Prometheus text format.
+
+        Parameters
+        ----------
+        openmetrics : bool, optional
+            use the OpenMetrics text format (default: False, i.e. the
+            Prometheus text format 0.0.4)
+
+        Returns
+        -------
+        text : str
+
+        """
+
+        labels = ",".join('{0}="{1}"'.format(k, _escape(v))
+                          for k, v in sorted(self._labels.items()))
+        if labels:
+            labels = "{" + labels + "}"
+        lines = []
+        for name, value in self.snapshot().items():
+            metric_type, description = _METRICS[name]
+            family = "dif_" + name
+            sample = family + "_total" if metric_type == "counter" \
+                else family
+            if not openmetrics:
+                family = sample
+            lines.append("# HELP {0} {1}".format(family, description))
+            lines.append("# TYPE {0} {1}".format(family, metric_type))
+            lines.append("{0}{1} {2}".format(sample, labels, value))
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+_METRICS = {
+    "files_hashed": ("counter", "Files hashed."),
+    "bytes_hashed": ("counter", "Bytes hashed."),
+    "errors": ("counter", "Files that could not be hashed."),
+    "files": ("gauge", "Files to hash."),
+    "bytes": ("gauge", "Bytes to hash."),
+    "throughput_bytes_per_second": (
+        "gauge", "Bytes hashed per second (recent)."),
+    "throughput_files_per_second": (
+        "gauge", "Files hashed per second (recent)."),
+    "queue_depth": ("gauge", "Tasks waiting for a worker (estimated)."),
+    "workers": ("gauge", "Number of workers."),
+    "workers_busy": ("gauge", "Workers with a task (estimated)."),
+    "worker_utilization_estimate": (
+        "gauge", "Fraction of busy workers (estimated from the unfinished "
+                 "tasks)."),
+    "running": ("gauge", "Whether a DIF is being generated."),
+    "last_progress_timestamp_seconds": (
+        "gauge", "Time of the last finished task."),
+}
+
+
+def _create_temporary_file(directory, prefix):
+    # like tempfile.mkstemp(), but readable by collectors of other users:
+    # created with the permissions of open(), i.e. 0666 minus the umask
+    # (which is applied by the OS and cannot be read without changing it)
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    while True:
+        path = os.path.join(directory, prefix + os.urandom(6).hex())
+        try:
+            return os.open(path, flags, 0o666), path
+        except FileExistsError:
+            continue
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace(
+        '"', '\\"')
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MetricsServer(object):
+    """An HTTP endpoint serving metrics (at any path, e.g. /metrics)."""
+
+    def __init__(self, metrics, port=9464, host="127.0.0.1"):
+        """Create a MetricsServer.
+
+        Parameters
+        ----------
+        metrics : Metrics
+            the metrics to serve
+        port : int, optional
+            the port (default: 9464; 0 for a free port)
+        host : str, optional
+            the address to listen on (default: "127.0.0.1", i.e. local
+            access only)
+
+        """
+
+        handler = type("Handler", (_Handler,), {"metrics": metrics})
+        self._httpd = _ThreadingHTTPServer((host, port), handler)
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._httpd.server_port
+
+    def start(self):
+        """Start serving in a background thread."""
+
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    metrics = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        openmetrics = "application/openmetrics-text" in \
+            self.headers.get("Accept", "")
+        body = self.metrics.render(openmetrics).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", _CONTENT_TYPES[openmetrics])
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TextfileExporter(object):
+    """Periodically writes metrics to a file (Prometheus text format)."""
+
+    def __init__(self, metrics, filename, interval=15.0):
+        """Create a TextfileExporter.
+
+        Parameters
+        ----------
+        metrics : Metrics
+            the metrics to write
+        filename : str
+            the file (e.g. in the directory of the textfile collector,
+            ending with ".prom")
+        interval : float, optional
+            the interval in seconds (default: 15.0)
+
+        """
+
+        self._metrics = metrics
+        self._filename = os.path.abspath(filename)
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def write(self):
+        """Write the metrics (atomically, i.e. never partially)."""
+
+        fd, tmp = _create_temporary_file(os.path.dirname(self._filename),
+                                         ".dif_metrics_")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self._metrics.render())
+            os.replace(tmp, self._filename)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def start(self):
+        """Start writing in a background thread."""
+
+        def run():
+            while not self._stopped.wait(self._interval):
+                self.write()
+
+        self._stopped.clear()
+        self.write()
+        self._thread = threading.Thread(target=run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop writing (after writing the final values)."""
+
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.write()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
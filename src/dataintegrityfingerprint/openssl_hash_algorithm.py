@@ -3,8 +3,8 @@
 This module provides a wrapper for OpenSSL hash functions to have a unique
 interface for all types of algorithms.
 
-Each hash algorithm object has the methods `update` and the properties
-`checksum` & `hash_algorithm`
+Each hash algorithm object has the methods `update`, `copy` & `digest` and
+the properties `checksum` & `hash_algorithm`
 
 """
 
@@ -15,6 +15,8 @@ import hashlib
 class OpenSSLHashAlgorithm(object):
     """OpenSSL hash algorithm."""
 
+    __slots__ = ("hash_algorithm", "_hasher")
+
     # Currently supported algorithms
     SUPPORTED_ALGORITHMS = sorted(["MD5",
                                    "SHA-1",
@@ -27,6 +29,22 @@ class OpenSSLHashAlgorithm(object):
                                    "SHA3-384",
                                    "SHA3-512"])
 
+    # DIF names deviate from python's hashlib names
+    HASHLIB_NAMES = {"MD5": "md5",
+                     "SHA-1": "sha1",
+                     "SHA-224": "sha224",
+                     "SHA-256": "sha256",
+                     "SHA-384": "sha384",
+                     "SHA-512": "sha512",
+                     "SHA3-224": "sha3_224",
+                     "SHA3-256": "sha3_256",
+                     "SHA3-384": "sha3_384",
+                     "SHA3-512": "sha3_512"}
+
+    # normalized DIF and hashlib names -> DIF names
+    _ALIASES = dict([(x, x) for x in HASHLIB_NAMES] +
+                    [(y.upper().replace("_", "-"), x)
+                     for x, y in HASHLIB_NAMES.items()])
 
     def __init__(self, hash_algorithm):
         """Initialize a OpenSSLHashAlgorithm.
@@ -41,33 +59,19 @@ class OpenSSLHashAlgorithm(object):
 
         """
 
-        self.hash_algorithm = hash_algorithm.upper().replace("_", "-")
-        hashlib_name = self.hash_algorithm
-
-        # DIF names deviate from python's hashlib names
-        deviating_names = [("MD5", "md5"),
-                           ("SHA-1", "sha1"),
-                           ("SHA-224", "sha224"),
-                           ("SHA-256", "sha256"),
-                           ("SHA-384", "sha384"),
-                           ("SHA-512", "sha512"),
-                           ("SHA3-224", "sha3_224"),
-                           ("SHA3-256", "sha3_256"),
-                           ("SHA3-384", "sha3_384"),
-                           ("SHA3-512", "sha3_512")]
-        for dif_name, lib_name in deviating_names:
-            if self.hash_algorithm == dif_name or\
-                    self.hash_algorithm == lib_name.upper():
-                self.hash_algorithm = dif_name
-                hashlib_name = lib_name
-                break
-
+        name = hash_algorithm.upper().replace("_", "-")
+        self.hash_algorithm = self._ALIASES.get(name, name)
         if self.hash_algorithm not in self.SUPPORTED_ALGORITHMS:
             raise ValueError("{0} is not a supported hash algorithm.".format(
                 self.hash_algorithm))
 
-        self._hasher = hashlib.new(hashlib_name)
-
+        # named constructors are faster than hashlib.new()
+        lib_name = self.HASHLIB_NAMES[self.hash_algorithm]
+        constructor = getattr(hashlib, lib_name, None)
+        if constructor is not None:
+            self._hasher = constructor()
+        else:
+            self._hasher = hashlib.new(lib_name)
 
     def update(self, data):
         """Update the hash.
@@ -81,6 +85,19 @@ class OpenSSLHashAlgorithm(object):
 
         self._hasher.update(data)
 
+    def copy(self):
+        """Return a copy of the hash object."""
+
+        rtn = OpenSSLHashAlgorithm.__new__(OpenSSLHashAlgorithm)
+        rtn.hash_algorithm = self.hash_algorithm
+        rtn._hasher = self._hasher.copy()
+        return rtn
+
+    def digest(self):
+        """Return the raw digest of the data passed to `update` so far."""
+
+        return self._hasher.digest()
+
     @property
     def checksum(self):
         return self._hasher.hexdigest()
@@ -0,0 +1,145 @@
+"""Include and exclude rules for files and directories.
+
+Rules are glob patterns (see `fnmatch`) or, if prefixed with "re:", regular
+expressions. They are matched against paths relative to the data directory
+using "/" as separator:
+
+* A glob pattern without "/" matches the name of a file or directory at any
+  depth (e.g. "*.tmp", ".git").
+* A glob pattern with "/" matches the whole relative path (e.g.
+  "raw/*/cache"); a leading "/" is ignored.
+* A trailing "/" restricts a pattern to directories (e.g. "scratch/").
+* A regular expression is searched in the whole relative path (e.g.
+  "re:^sub-\\d+/tmp").
+
+Excluded directories are pruned during the walk, so their content is never
+listed. Include rules only apply to files.
+
+"""
+
+
+import re
+import codecs
+import fnmatch
+
+
+class _Rule(object):
+    """A single include or exclude rule."""
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.directories_only = False
+        if pattern.startswith("re:"):
+            self.match_name = False
+            self._regex = re.compile(pattern[3:])
+            self._match = self._regex.search
+        else:
+            if pattern.endswith("/"):
+                self.directories_only = True
+                pattern = pattern.rstrip("/")
+            self.match_name = "/" not in pattern
+            pattern = pattern.lstrip("/")
+            self._regex = re.compile(fnmatch.translate(pattern))
+            self._match = self._regex.match
+
+    def matches(self, rel_path, name):
+        if self.match_name:
+            return self._match(name) is not None
+        return self._match(rel_path) is not None
+
+
+class PathFilter(object):
+    """Include and exclude rules for files and directories."""
+
+    def __init__(self, include=None, exclude=None):
+        """Create a PathFilter.
+
+        Parameters
+        ----------
+        include : list of str, optional
+            if given, only files matching at least one of these rules are
+            included
+        exclude : list of str, optional
+            files and directories matching one of these rules are excluded
+
+        """
+
+        self._include = [_Rule(x) for x in include or []]
+        self._exclude = [_Rule(x) for x in exclude or []]
+
+    def __bool__(self):
+        return len(self._include) > 0 or len(self._exclude) > 0
+
+    @property
+    def include(self):
+        return [x.pattern for x in self._include]
+
+    @property
+    def exclude(self):
+        return [x.pattern for x in self._exclude]
+
+    def include_directory(self, rel_path):
+        """Check whether a directory should be walked.
+
+        Parameters
+        ----------
+        rel_path : str
+            the path of the directory relative to the data directory
+
+        Returns
+        -------
+        included : bool
+
+        """
+
+        name = rel_path.rsplit("/", 1)[-1]
+        return not any(x.matches(rel_path, name) for x in self._exclude)
+
+    def include_file(self, rel_path):
+        """Check whether a file should be hashed.
+
+        Parameters
+        ----------
+        rel_path : str
+            the path of the file relative to the data directory
+
+        Returns
+        -------
+        included : bool
+
+        """
+
+        name = rel_path.rsplit("/", 1)[-1]
+        if any(x.matches(rel_path, name) for x in self._exclude
+               if not x.directories_only):
+            return False
+        if self._include:
+            return any(x.matches(rel_path, name) for x in self._include
+                       if not x.directories_only)
+        return True
+
+
+def read_ignore_file(filename):
+    """Read exclude rules from an ignore file (e.g. ".difignore").
+
+    The file contains one rule per line. Empty lines and lines starting with
+    "#" are skipped.
+
+    Parameters
+    ----------
+    filename : str
+        the name of the ignore file
+
+    Returns
+    -------
+    rules : list of str
+
+    """
+
+    rtn = []
+    with codecs.open(filename, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\r\n").strip()
+            if line and not line.startswith("#"):
+                rtn.append(line)
+    return rtn
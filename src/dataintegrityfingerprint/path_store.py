@@ -0,0 +1,285 @@
+"""Compact in-memory storage of hash lists.
+
+Relative paths of large data sets share long prefixes (e.g.
+"subject_001/session_02/raw/"), and storing them as separate Python strings
+(plus a tuple per entry) costs a few hundred bytes per file. A `PathStore`
+stores each directory only once in a directory table and each path as the
+index of its directory and its file name, which is appended to a single
+buffer (terminated by a NUL byte, which cannot occur in file names). Full
+paths are created lazily when they are accessed.
+
+A `HashList` is the sorted list of `(checksum, path)` tuples of a DIF with
+the paths in a `PathStore`.
+
+"""
+
+
+import sys
+import operator
+import itertools
+from array import array
+
+
+# number of names decoded at once when iterating
+DECODE_CHUNK = 4096
+
+
+class PathStore(object):
+    """A prefix-compressed list of relative paths (with "/" as separator)."""
+
+    def __init__(self, paths=()):
+        """Create a PathStore.
+
+        Parameters
+        ----------
+        paths : iterable of str, optional
+            the initial paths
+
+        """
+
+        self._dir_ids = {}  # directory (with trailing "/") -> index
+        self._dirs = []
+        self._entry_dirs = array("L")
+        self._names = bytearray()
+        self._offsets = array("Q", [0])
+        self.extend(paths)
+
+    def append(self, path):
+        """Append a path."""
+
+        dir_, _, name = path.rpartition("/")
+        if dir_:
+            dir_ += "/"
+        try:
+            dir_id = self._dir_ids[dir_]
+        except KeyError:
+            dir_id = self._dir_ids[dir_] = len(self._dirs)
+            self._dirs.append(dir_)
+        self._entry_dirs.append(dir_id)
+        self._names += name.encode("utf-8", "surrogateescape") + b"\0"
+        self._offsets.append(len(self._names))
+
+    def extend(self, paths):
+        """Append several paths."""
+
+        for path in paths:
+            self.append(path)
+
+    def reordered(self, order):
+        """Get a PathStore with the paths in another order.
+
+        Parameters
+        ----------
+        order : iterable of int
+            the indices of the paths in the new order
+
+        """
+
+        rtn = PathStore()
+        rtn._dir_ids = dict(self._dir_ids)
+        rtn._dirs = list(self._dirs)
+        entry_dirs = self._entry_dirs
+        names = self._names
+        offsets = self._offsets
+        new_entry_dirs = rtn._entry_dirs
+        new_names = rtn._names
+        new_offsets = rtn._offsets
+        for i in order:
+            # without decoding the names
+            new_entry_dirs.append(entry_dirs[i])
+            new_names += names[offsets[i]:offsets[i + 1]]
+            new_offsets.append(len(new_names))
+        return rtn
+
+    @property
+    def directories(self):
+        """The number of distinct directories."""
+
+        return len(self._dirs)
+
+    def nbytes(self):
+        """Get the approximate memory used by the paths in bytes."""
+
+        return sys.getsizeof(self._names) + \
+            sys.getsizeof(self._entry_dirs) + \
+            sys.getsizeof(self._offsets) + \
+            sys.getsizeof(self._dir_ids) + sys.getsizeof(self._dirs) + \
+            sum(sys.getsizeof(x) for x in self._dirs)
+
+    def __len__(self):
+        return len(self._entry_dirs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("path index out of range")
+        return self._dirs[self._entry_dirs[index]] + \
+            self._names[self._offsets[index]:
+                        self._offsets[index + 1] - 1].decode("utf-8",
+                                                             "surrogateescape")
+
+    def take(self, indices):
+        """Iterate over the paths with the given indices.
+
+        Parameters
+        ----------
+        indices : iterable of int
+            the indices of the paths
+
+        """
+
+        dirs = self._dirs
+        names = self._names
+        offsets = self._offsets
+        entry_dirs = self._entry_dirs
+        indices = iter(indices)
+        while True:
+            chunk = list(itertools.islice(indices, DECODE_CHUNK))
+            if not chunk:
+                return
+            data = b"".join([names[offsets[i]:offsets[i + 1]]
+                             for i in chunk])
+            decoded = data[:-1].decode("utf-8", "surrogateescape").split("\0")
+            for path in map(operator.add,
+                            map(dirs.__getitem__,
+                                map(entry_dirs.__getitem__, chunk)),
+                            decoded):
+                yield path
+
+    def __iter__(self):
+        dirs = self._dirs
+        offsets = self._offsets
+        for start in range(0, len(self), DECODE_CHUNK):
+            end = min(start + DECODE_CHUNK, len(self))
+            # names are decoded in bulk and split at the NUL bytes
+            names = self._names[offsets[start]:offsets[end] - 1].decode(
+                "utf-8", "surrogateescape").split("\0")
+            for path in map(operator.add,
+                            map(dirs.__getitem__,
+                                self._entry_dirs[start:end]), names):
+                yield path
+
+
+class HashList(object):
+    """A list of `(checksum, path)` tuples with prefix-compressed paths.
+
+    Entries are appended in any order; `sort()` sorts them by checksum and
+    path, as required for calculating a DIF. Tuples are created lazily, when
+    the list is iterated or indexed.
+
+    After sorting, the entries are stored sorted by path and the order by
+    checksum is kept as a list of indices. Manifests (sorted by path) are
+    thus created by decoding the paths sequentially and in bulk.
+
+    """
+
+    def __init__(self, entries=()):
+        """Create a HashList.
+
+        Parameters
+        ----------
+        entries : iterable of tuples, optional
+            the initial `(checksum, path)` entries
+
+        """
+
+        self._checksums = []
+        self._paths = PathStore()
+        self._order = None  # indices of the entries in list order
+        self._sorted_by_path = True
+        self.extend(entries)
+
+    def append(self, checksum, path):
+        """Append an entry."""
+
+        if self._order is not None:
+            self._order.append(len(self._checksums))
+        self._checksums.append(checksum)
+        self._paths.append(path)
+        self._sorted_by_path = False
+
+    def extend(self, entries):
+        """Append several `(checksum, path)` entries."""
+
+        for checksum, path in entries:
+            self.append(checksum, path)
+
+    def sort(self):
+        """Sort the entries by checksum and path (in place)."""
+
+        n = len(self._checksums)
+        if not self._sorted_by_path:
+            paths = list(self._paths)  # decoded once for all comparisons
+            by_path = sorted(range(n), key=paths.__getitem__)
+            del paths
+            self._checksums = [self._checksums[i] for i in by_path]
+            self._paths = self._paths.reordered(by_path)
+            self._sorted_by_path = True
+        checksums = self._checksums
+        if len(set(map(len, checksums))) <= 1:
+            # checksums of equal length: sorting by checksum and then by
+            # path equals sorting by `checksum + path`; the sort is stable
+            # and the entries are sorted by path
+            order = sorted(range(n), key=checksums.__getitem__)
+        else:
+            paths = self._paths
+            order = sorted(range(n), key=lambda i: checksums[i] + paths[i])
+        self._order = array("L", order)
+
+    def by_path(self):
+        """Iterate over the entries sorted by path.
+
+        Returns
+        -------
+        entries : iterator
+            of `(checksum, path)` tuples
+
+        """
+
+        if self._sorted_by_path:
+            return zip(self._checksums, self._paths)
+        paths = list(self._paths)
+        order = sorted(range(len(paths)), key=paths.__getitem__)
+        return zip(map(self._checksums.__getitem__, order),
+                   map(paths.__getitem__, order))
+
+    @property
+    def paths(self):
+        """The paths (a `PathStore`, sorted by path after `sort()`)."""
+
+        return self._paths
+
+    def __len__(self):
+        return len(self._checksums)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if self._order is not None:
+            index = self._order[index]
+        return self._checksums[index], self._paths[index]
+
+    def __iter__(self):
+        if self._order is None:
+            return zip(self._checksums, self._paths)
+        return zip(map(self._checksums.__getitem__, self._order),
+                   self._paths.take(self._order))
+
+    def __eq__(self, other):
+        try:
+            return len(self) == len(other) and \
+                all(x == tuple(y) for x, y in zip(self, other))
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        rtn = self.__eq__(other)
+        return rtn if rtn is NotImplemented else not rtn
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "HashList({0!r})".format(list(self))
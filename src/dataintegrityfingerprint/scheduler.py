@@ -0,0 +1,175 @@
+"""I/O scheduling of files by device and physical layout.
+
+Files are grouped by the device they are stored on (`st_dev`). Each device
+has its own queue, optionally ordered by inode number or by the physical
+offset of the first extent (Linux FIEMAP), so that reads on spinning disks
+are close to sequential. The number of files that are read concurrently
+from one device can be limited, so that a pool of workers is distributed
+over all devices instead of oversubscribing a single one.
+
+"""
+
+
+import os
+import struct
+import threading
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+READ_ORDERS = ["walk", "inode", "extent"]
+
+# struct fiemap with room for one struct fiemap_extent (see linux/fiemap.h)
+_FIEMAP = struct.Struct("=QQLLLL")
+_FIEMAP_EXTENT = struct.Struct("=QQQQQLLLL")
+_FS_IOC_FIEMAP = 0xC020660B
+_FIEMAP_FLAG_SYNC = 0x00000001
+
+
+def physical_offset(filename):
+    """Get the physical offset of the first extent of a file.
+
+    Only supported on Linux file systems that implement FIEMAP.
+
+    Parameters
+    ----------
+    filename : str
+        the name of the file
+
+    Returns
+    -------
+    offset : int or None
+        the physical offset in bytes (None, if not available)
+
+    """
+
+    if fcntl is None:
+        return None
+    request = bytearray(_FIEMAP.size + _FIEMAP_EXTENT.size)
+    _FIEMAP.pack_into(request, 0, 0, 2 ** 64 - 1, _FIEMAP_FLAG_SYNC, 0, 1, 0)
+    try:
+        fd = os.open(filename, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        fcntl.ioctl(fd, _FS_IOC_FIEMAP, request)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+    mapped_extents = _FIEMAP.unpack_from(request, 0)[3]
+    if mapped_extents < 1:
+        return None
+    return _FIEMAP_EXTENT.unpack_from(request, _FIEMAP.size)[1]
+
+
+class DeviceScheduler(object):
+    """Hand out files device by device with limited concurrency.
+
+    Iterating over the scheduler yields `(filename, next_filename)` tuples,
+    where `next_filename` is the file that will be read next from the same
+    device (or None). The iteration blocks while all devices with pending
+    files have reached the concurrency limit, until `done()` is called for
+    a file. It is therefore meant to be consumed by the task handler of a
+    pool (or lazily by `map`).
+
+    """
+
+    def __init__(self, files, file_ids, max_per_device=None,
+                 read_order="walk"):
+        """Create a DeviceScheduler.
+
+        Parameters
+        ----------
+        files : list of str
+            the files to read
+        file_ids : dict
+            `(st_dev, st_ino)` for each file (files without id are treated
+            as being stored on an unknown device)
+        max_per_device : int, optional
+            the maximum number of files that are read concurrently from one
+            device (default: unlimited)
+        read_order : str, optional
+            one of `READ_ORDERS` (default: "walk")
+
+        """
+
+        if read_order not in READ_ORDERS:
+            raise ValueError("{0} is not a supported read order.".format(
+                read_order))
+        queues = {}
+        for filename in files:
+            device, inode = file_ids.get(filename, (None, 0))
+            queues.setdefault(device, []).append((inode, filename))
+
+        self._queues = []
+        self._device = {}
+        for device, queue in queues.items():
+            if read_order == "inode":
+                queue.sort()
+            elif read_order == "extent":
+                queue.sort(key=lambda x: (physical_offset(x[1]) or 0, x[0]))
+            self._queues.append((device, deque(x[1] for x in queue)))
+            for _, filename in queue:
+                self._device[filename] = device
+        self._max_per_device = max_per_device
+        self._in_flight = dict((x, 0) for x in queues)
+        self._next_queue = 0
+        self._condition = threading.Condition()
+
+    @property
+    def devices(self):
+        return [x[0] for x in self._queues]
+
+    def _pop(self):
+        # round robin over devices with free slots
+        n = len(self._queues)
+        for i in range(n):
+            device, queue = self._queues[(self._next_queue + i) % n]
+            if queue and (self._max_per_device is None or
+                          self._in_flight[device] < self._max_per_device):
+                self._next_queue = (self._next_queue + i + 1) % n
+                self._in_flight[device] += 1
+                filename = queue.popleft()
+                return filename, queue[0] if queue else None
+        return None
+
+    def __iter__(self):
+        while True:
+            with self._condition:
+                while True:
+                    if not any(queue for _, queue in self._queues):
+                        return
+                    task = self._pop()
+                    if task is not None:
+                        break
+                    self._condition.wait()
+            yield task
+
+    def cancel(self):
+        """Drop all pending files and end the iteration."""
+
+        with self._condition:
+            for _, queue in self._queues:
+                queue.clear()
+            self._condition.notify_all()
+
+    def done(self, filename):
+        """Mark a file as read.
+
+        Parameters
+        ----------
+        filename : str
+            the name of the file
+
+        """
+
+        with self._condition:
+            device = self._device.get(filename)
+            if device in self._in_flight and self._in_flight[device] > 0:
+                self._in_flight[device] -= 1
+            self._condition.notify_all()
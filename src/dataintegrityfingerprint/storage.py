@@ -0,0 +1,536 @@
+"""Storage backends.
+
+A storage backend lists, stats and reads the files of a data set, so that
+data that is not on a local file system can be hashed without staging it
+locally. Paths within a storage always use "/" as separator.
+
+* `LocalStorage` -- a directory of the local file system
+* `S3Storage`    -- a bucket of an S3-compatible object store (AWS S3,
+                    MinIO, Ceph, ...), accessed via its REST API with path
+                    style addressing and Signature Version 4
+
+`S3Storage` reuses one HTTP connection per thread and host (also across
+storage objects, e.g. the copies passed to worker processes) and reads large
+objects in chunks with concurrent ranged requests (prefetching), so that a
+single object is read at full network bandwidth. The connections to a host
+are closed, when the last storage object of the host is closed.
+
+"""
+
+
+import os
+import hmac
+import time
+import calendar
+import hashlib
+import datetime
+import threading
+import http.client
+import urllib.parse
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+
+from . import file_reader
+
+
+# persistent connections of this process: one per thread and host
+_local = threading.local()
+_connections = set()  # ((pid, scheme, host), connection)
+_users = {}  # (pid, scheme, host) -> number of storage objects
+_lock = threading.Lock()
+
+
+class Storage(object):
+    """Interface of storage backends.
+
+    Storage objects are passed to worker processes and must therefore be
+    picklable.
+
+    """
+
+    # number of workers for execution "auto" (None: planned by file count
+    # and size, see `dif.plan_execution`)
+    PARALLEL_READS = None
+
+    def list(self, prefix=""):
+        """List all files below a prefix.
+
+        Parameters
+        ----------
+        prefix : str, optional
+            the path of a directory (default: "", i.e. all files)
+
+        Yields
+        ------
+        file : tuple
+            `(path, size)` with the path relative to the prefix
+
+        """
+
+        raise NotImplementedError
+
+    def url(self, path=""):
+        """Get a URL (or local path) that identifies a path in the storage."""
+
+        raise NotImplementedError
+
+    def stat(self, path):
+        """Get the size and modification time of a file.
+
+        Returns
+        -------
+        stat : tuple
+            `(size, mtime)` with the modification time in seconds since the
+            epoch (or None, if not available)
+
+        """
+
+        raise NotImplementedError
+
+    def read_range(self, path, start, length):
+        """Read a range of a file.
+
+        Returns
+        -------
+        data : bytes
+
+        """
+
+        raise NotImplementedError
+
+    def read_blocks(self, path, size=None):
+        """Read a file block by block.
+
+        Parameters
+        ----------
+        path : str
+            the path of the file
+        size : int, optional
+            the size of the file, if known (e.g. from `list`)
+
+        Yields
+        ------
+        block : bytes
+
+        """
+
+        raise NotImplementedError
+
+    def close(self):
+        """Release connections and other resources."""
+
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class LocalStorage(Storage):
+    """A directory of the local file system."""
+
+    def __init__(self, root, io_mode="buffered"):
+        """Create a LocalStorage.
+
+        Parameters
+        ----------
+        root : str
+            the root directory
+        io_mode : str, optional
+            one of `file_reader.IO_MODES` (default: "buffered")
+
+        """
+
+        self._root = os.path.abspath(root)
+        self._io_mode = io_mode
+
+    @property
+    def root(self):
+        return self._root
+
+    def _path(self, path):
+        return os.path.join(self._root, *[x for x in path.split("/") if x])
+
+    def list(self, prefix=""):
+        top = self._path(prefix)
+        for dir_, _, files in os.walk(top, followlinks=True):
+            for filename in files:
+                path = os.path.join(dir_, filename)
+                try:
+                    size = os.stat(path).st_size
+                except OSError:
+                    continue
+                yield os.path.relpath(path, top).replace(os.path.sep,
+                                                         "/"), size
+
+    def url(self, path=""):
+        return self._path(path)
+
+    def stat(self, path):
+        st = os.stat(self._path(path))
+        return st.st_size, st.st_mtime
+
+    def read_range(self, path, start, length):
+        with open(self._path(path), "rb") as f:
+            f.seek(start)
+            return f.read(length)
+
+    def read_blocks(self, path, size=None):
+        return file_reader.read_blocks(self._path(path), self._io_mode)
+
+
+class S3Error(OSError):
+    """An error response of an S3-compatible API."""
+
+    pass
+
+
+class S3Storage(Storage):
+    """A bucket of an S3-compatible object store.
+
+    Example
+    -------
+    storage = S3Storage("https://s3.eu-central-1.amazonaws.com", "bucket",
+                        access_key="...", secret_key="...",
+                        region="eu-central-1")
+    dif = DataIntegrityFingerprint("datasets/2024", storage=storage)
+
+    """
+
+    PARALLEL_READS = 16
+
+    def __init__(self, endpoint_url, bucket, access_key=None,
+                 secret_key=None, session_token=None, region="us-east-1",
+                 chunk_size=8 * 1024 * 1024, prefetch=4, timeout=60):
+        """Create an S3Storage.
+
+        Parameters
+        ----------
+        endpoint_url : str
+            the URL of the API, e.g. "https://s3.amazonaws.com" or
+            "http://localhost:9000"
+        bucket : str
+            the name of the bucket
+        access_key : str, optional
+            the access key (default: None, i.e. anonymous requests)
+        secret_key : str, optional
+            the secret key
+        session_token : str, optional
+            the session token of temporary credentials
+        region : str, optional
+            the region used for signing requests (default: "us-east-1")
+        chunk_size : int, optional
+            the size of ranged requests of large objects (default: 8 MiB)
+        prefetch : int, optional
+            the number of chunks of an object that are requested
+            concurrently (default: 4)
+        timeout : float, optional
+            the timeout of requests in seconds (default: 60)
+
+        """
+
+        url = urllib.parse.urlsplit(endpoint_url)
+        if url.scheme not in ("http", "https"):
+            raise ValueError("{0} is not a supported endpoint URL.".format(
+                endpoint_url))
+        self._endpoint_url = endpoint_url
+        self._scheme = url.scheme
+        self._host = url.netloc
+        self._base_path = url.path.rstrip("/")
+        self._bucket = bucket
+        self._access_key = access_key
+        self._secret_key = secret_key
+        self._session_token = session_token
+        self._region = region
+        self._chunk_size = chunk_size
+        self._prefetch = prefetch
+        self._timeout = timeout
+        self._executors = None  # (pid, {thread: ThreadPoolExecutor})
+        self._user = None  # pid, if counted in the users of the connections
+
+    @property
+    def endpoint_url(self):
+        return self._endpoint_url
+
+    @property
+    def bucket(self):
+        return self._bucket
+
+    def list(self, prefix=""):
+        prefix = prefix.strip("/")
+        if prefix:
+            prefix += "/"
+        query = {"list-type": "2", "prefix": prefix}
+        while True:
+            response = self._request("GET", "", query)
+            root = ElementTree.fromstring(response)
+            for element in root:
+                if _tag(element) != "Contents":
+                    continue
+                fields = dict((_tag(x), x.text) for x in element)
+                key = fields["Key"]
+                if key.endswith("/"):  # directory marker
+                    continue
+                yield key[len(prefix):], int(fields.get("Size") or 0)
+            fields = dict((_tag(x), x.text) for x in root)
+            if fields.get("IsTruncated") != "true":
+                return
+            query["continuation-token"] = fields["NextContinuationToken"]
+
+    def url(self, path=""):
+        return "s3://{0}/{1}".format(self._bucket, path.strip("/")).rstrip(
+            "/")
+
+    def stat(self, path):
+        headers = self._request("HEAD", path, return_headers=True)
+        mtime = headers.get("last-modified")
+        if mtime is not None:
+            mtime = calendar.timegm(time.strptime(
+                mtime, "%a, %d %b %Y %H:%M:%S GMT"))
+        return int(headers.get("content-length", 0)), mtime
+
+    def read_range(self, path, start, length):
+        if length <= 0:
+            return b""
+        return self._request("GET", path, headers={
+            "Range": "bytes={0}-{1}".format(start, start + length - 1)})
+
+    def read_blocks(self, path, size=None):
+        if size is None:
+            size = self.stat(path)[0]
+        if size <= self._chunk_size:
+            yield self._request("GET", path)
+            return
+        # concurrent ranged requests, yielded in order
+        executor = self._ranged_executor()
+        starts = iter(range(0, size, self._chunk_size))
+        pending = []
+        try:
+            for start in starts:
+                pending.append(executor.submit(self.read_range, path, start,
+                                               self._chunk_size))
+                if len(pending) >= self._prefetch:
+                    break
+            while pending:
+                block = pending.pop(0).result()
+                for start in starts:
+                    pending.append(executor.submit(
+                        self.read_range, path, start, self._chunk_size))
+                    break
+                yield block
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        # the connections are shared with the other storage objects of the
+        # host (of this process) and closed by the last one
+        pid = os.getpid()
+        key = (pid, self._scheme, self._host)
+        last = False
+        with _lock:
+            executors, self._executors = self._executors, None
+            if self._user == pid:
+                _users[key] -= 1
+                if not _users[key]:
+                    del _users[key]
+                    last = True
+            self._user = None
+        if executors is not None and executors[0] == pid:
+            for executor in executors[1].values():
+                executor.shutdown(wait=True)
+        if last:
+            close_connections(self._scheme, self._host)
+
+    def _ranged_executor(self):
+        # a pool of `prefetch` threads per reading thread for the ranged
+        # requests of all objects, so that the connections of its threads
+        # are reused (idle threads are not reused by a larger pool before
+        # Python 3.8)
+        pid = os.getpid()
+        thread = threading.current_thread().ident
+        with _lock:
+            if self._executors is None or self._executors[0] != pid:
+                self._executors = (pid, {})
+            executors = self._executors[1]
+            if thread not in executors:
+                executors[thread] = ThreadPoolExecutor(self._prefetch)
+            return executors[thread]
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_executors"] = None  # threads are not copied
+        state["_user"] = None
+        return state
+
+    def _connection(self, reconnect=False):
+        # one persistent connection per thread and host
+        pid = os.getpid()
+        if self._user != pid:
+            with _lock:
+                if self._user != pid:
+                    key = (pid, self._scheme, self._host)
+                    _users[key] = _users.get(key, 0) + 1
+                    self._user = pid
+        if getattr(_local, "pid", None) != pid:
+            # not the connections inherited from a forking process
+            _local.pid = pid
+            _local.connections = {}
+        key = (self._scheme, self._host)
+        connection = _local.connections.get(key)
+        if connection is not None and reconnect:
+            connection.close()
+            connection = None
+        if connection is None:
+            if self._scheme == "https":
+                connection = http.client.HTTPSConnection(
+                    self._host, timeout=self._timeout)
+            else:
+                connection = http.client.HTTPConnection(
+                    self._host, timeout=self._timeout)
+            _local.connections[key] = connection
+        if connection.sock is None:
+            # (re)opened with the next request
+            with _lock:
+                _connections.add(((pid,) + key, connection))
+        return connection
+
+    def _request(self, method, key, query=None, headers=None,
+                 return_headers=False):
+        path = "{0}/{1}".format(self._base_path, self._bucket)
+        if key:
+            path += "/" + key.lstrip("/")
+        path = urllib.parse.quote(path, safe="/~")
+        query_string = "&".join(
+            "{0}={1}".format(urllib.parse.quote(k, safe="~"),
+                             urllib.parse.quote(v, safe="~"))
+            for k, v in sorted((query or {}).items()))
+        headers = dict(headers or {})
+        headers.update(self._sign(method, path, query_string))
+        url = path + ("?" + query_string if query_string else "")
+        for attempt in range(2):
+            # e.g. a kept-alive connection that has been closed by the server
+            # or a response that has been cut off (IncompleteRead)
+            connection = self._connection(reconnect=attempt > 0)
+            try:
+                connection.request(method, url, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError) as err:
+                if attempt > 0:
+                    connection.close()
+                    raise S3Error("{0} {1} failed: {2!r}".format(
+                        method, key or self._bucket, err))
+        if response.status >= 300:
+            raise S3Error("{0} {1} ({2}): {3}".format(
+                response.status, response.reason, key or self._bucket,
+                body[:200].decode("utf-8", "replace")))
+        if return_headers:
+            return dict((k.lower(), v) for k, v in response.getheaders())
+        return body
+
+    def _sign(self, method, path, query_string):
+        # AWS Signature Version 4 (unsigned payload)
+        now = datetime.datetime.utcnow()
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        headers = {"Host": self._host,
+                   "x-amz-date": amz_date,
+                   "x-amz-content-sha256": "UNSIGNED-PAYLOAD"}
+        if self._session_token:
+            headers["x-amz-security-token"] = self._session_token
+        if not self._access_key:
+            return headers
+        canonical_headers = sorted((k.lower(), v.strip())
+                                   for k, v in headers.items())
+        signed_headers = ";".join(k for k, _ in canonical_headers)
+        canonical_request = "\n".join([
+            method, path, query_string,
+            "".join("{0}:{1}\n".format(k, v) for k, v in canonical_headers),
+            signed_headers, "UNSIGNED-PAYLOAD"])
+        scope = "{0}/{1}/s3/aws4_request".format(now.strftime("%Y%m%d"),
+                                                 self._region)
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope,
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()])
+        key = ("AWS4" + self._secret_key).encode("utf-8")
+        for part in scope.split("/"):
+            key = hmac.new(key, part.encode("utf-8"), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode("utf-8"),
+                             hashlib.sha256).hexdigest()
+        headers["Authorization"] = \
+            "AWS4-HMAC-SHA256 Credential={0}/{1}, SignedHeaders={2}, " \
+            "Signature={3}".format(self._access_key, scope, signed_headers,
+                                   signature)
+        return headers
+
+
+def close_connections(scheme=None, host=None):
+    """Close the persistent connections of this process (of all threads).
+
+    The connections are reopened, if they are used again (e.g. by a storage
+    object that has not been closed).
+
+    Parameters
+    ----------
+    scheme : str, optional
+        only close connections with this scheme ("http" or "https")
+    host : str, optional
+        only close connections to this host (and port)
+
+    """
+
+    pid = os.getpid()
+    with _lock:
+        for key, connection in list(_connections):
+            if key[0] != pid:
+                # inherited from a forking process (used by the parent)
+                _connections.discard((key, connection))
+            elif scheme in (None, key[1]) and host in (None, key[2]):
+                connection.close()
+                _connections.discard((key, connection))
+
+
+def from_url(url, endpoint_url=None):
+    """Create a storage from a URL.
+
+    Credentials of "s3://" URLs are read from the environment variables
+    `AWS_ACCESS_KEY_ID`, `AWS_SECRET_ACCESS_KEY`, `AWS_SESSION_TOKEN` and
+    `AWS_DEFAULT_REGION` (like the AWS command line interface).
+
+    Parameters
+    ----------
+    url : str
+        e.g. "s3://bucket/path/to/data" (or a local path)
+    endpoint_url : str, optional
+        the URL of the S3-compatible API (default: environment variable
+        `AWS_ENDPOINT_URL` or "https://s3.amazonaws.com")
+
+    Returns
+    -------
+    storage : Storage
+    path : str
+        the path of the data within the storage
+
+    """
+
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme != "s3":
+        return LocalStorage(url), ""
+    if endpoint_url is None:
+        endpoint_url = os.environ.get("AWS_ENDPOINT_URL",
+                                      "https://s3.amazonaws.com")
+    storage = S3Storage(
+        endpoint_url, parsed.netloc,
+        access_key=os.environ.get("AWS_ACCESS_KEY_ID"),
+        secret_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
+        session_token=os.environ.get("AWS_SESSION_TOKEN"),
+        region=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"))
+    return storage, parsed.path.strip("/")
+
+
+def _tag(element):
+    # tag without XML namespace
+    return element.tag.rsplit("}", 1)[-1]
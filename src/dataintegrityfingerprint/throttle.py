@@ -0,0 +1,117 @@
+"""Bandwidth and IOPS throttling.
+
+This module provides a token bucket rate limiter for the number of bytes and
+files read per second. Its state lives in shared memory, so the limits apply
+to all threads and worker processes together and can be changed at any time
+(e.g. from another thread while a DIF is generated).
+
+"""
+
+
+import time
+import multiprocessing
+
+
+class RateLimiter(object):
+    """Token bucket rate limiter shared by all workers.
+
+    Example
+    -------
+    limiter = RateLimiter(bytes_per_second=50e6)
+    dif = DataIntegrityFingerprint("/data", rate_limiter=limiter)
+    Thread(target=dif.generate).start()
+    limiter.set_rates(bytes_per_second=200e6)  # e.g. after business hours
+
+    """
+
+    # indices in shared array
+    _BYTES_RATE, _FILES_RATE, _BYTES_TOKENS, _FILES_TOKENS, _LAST = range(5)
+
+    def __init__(self, bytes_per_second=None, files_per_second=None,
+                 burst=1.0):
+        """Create a RateLimiter.
+
+        Parameters
+        ----------
+        bytes_per_second : float, optional
+            the maximum number of bytes read per second (default: unlimited)
+        files_per_second : float, optional
+            the maximum number of files opened per second (default:
+            unlimited)
+        burst : float, optional
+            the size of the buckets in seconds, i.e. how long the workers
+            may read at full speed after a pause (default: 1.0)
+
+        """
+
+        self._lock = multiprocessing.Lock()
+        self._state = multiprocessing.RawArray("d", 5)
+        self._burst = burst
+        self.set_rates(bytes_per_second, files_per_second)
+
+    @property
+    def bytes_per_second(self):
+        return self._state[self._BYTES_RATE] or None
+
+    @property
+    def files_per_second(self):
+        return self._state[self._FILES_RATE] or None
+
+    @property
+    def unlimited(self):
+        return self._state[self._BYTES_RATE] <= 0 and \
+            self._state[self._FILES_RATE] <= 0
+
+    def set_rates(self, bytes_per_second=None, files_per_second=None):
+        """Change the rate limits (takes effect immediately).
+
+        Parameters
+        ----------
+        bytes_per_second : float, optional
+            the maximum number of bytes read per second (default: unlimited)
+        files_per_second : float, optional
+            the maximum number of files opened per second (default:
+            unlimited)
+
+        """
+
+        with self._lock:
+            self._state[self._BYTES_RATE] = bytes_per_second or 0
+            self._state[self._FILES_RATE] = files_per_second or 0
+            self._state[self._BYTES_TOKENS] = 0
+            self._state[self._FILES_TOKENS] = 0
+            self._state[self._LAST] = time.monotonic()
+
+    def acquire(self, n_bytes=0, n_files=0):
+        """Take tokens from the buckets and wait, if they are exhausted.
+
+        Parameters
+        ----------
+        n_bytes : int, optional
+            the number of bytes to be read
+        n_files : int, optional
+            the number of files to be opened
+
+        """
+
+        if self.unlimited:
+            return
+        wait = 0
+        state = self._state
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - state[self._LAST]
+            state[self._LAST] = now
+            for rate, tokens, n in ((self._BYTES_RATE, self._BYTES_TOKENS,
+                                     n_bytes),
+                                    (self._FILES_RATE, self._FILES_TOKENS,
+                                     n_files)):
+                if state[rate] <= 0:
+                    continue
+                # tokens can become negative (debt), which is waited for
+                state[tokens] = min(state[rate] * self._burst,
+                                    state[tokens] + elapsed * state[rate]) - n
+                if state[tokens] < 0:
+                    wait = max(wait, -state[tokens] / state[rate])
+        if wait > 0:
+            time.sleep(wait)
@@ -0,0 +1,281 @@
+"""Data Integrity Fingerprint (DIF) watch mode.
+
+This module keeps the DIF of a data directory up to date by tracking created,
+modified and deleted files and rehashing only those. On Linux, filesystem
+notifications (inotify) are used; on other platforms, or if inotify is not
+available, the data directory is polled.
+
+"""
+
+
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import threading
+
+
+# inotify constants (see inotify(7))
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | \
+    _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _InotifyMonitor(object):
+    """Change monitor based on Linux inotify."""
+
+    def __init__(self, dif):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or libc_name is None:
+            raise OSError("inotify is not available")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dif = dif
+        self._watches = {}
+        self._add_tree(dif.data)
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path),
+                                          _WATCH_MASK)
+        if wd >= 0:
+            self._watches[wd] = path
+
+    def _add_tree(self, path):
+        for dir_, _ in self._dif._walk(path):  # excluded directories pruned
+            self._add_watch(dir_)
+
+    def close(self):
+        os.close(self._fd)
+
+    def wait(self, timeout):
+        """Wait for changes.
+
+        Returns
+        -------
+        changes : set of str or None
+            the changed paths (None, if a full rescan is required)
+
+        """
+
+        changes = set()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return changes
+        try:
+            buffer = os.read(self._fd, 1024 * 1024)
+        except BlockingIOError:
+            return changes
+
+        pos = 0
+        while pos < len(buffer):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(buffer, pos)
+            pos += _EVENT_HEADER.size
+            name = os.fsdecode(buffer[pos:pos + length].rstrip(b"\0"))
+            pos += length
+            if mask & _IN_Q_OVERFLOW:
+                return None
+            if mask & _IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if not name:  # event on watched directory itself
+                if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF):
+                    changes.add(directory)
+                continue
+            path = os.path.join(directory, name)
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                # files might have been created before the watch was added
+                self._add_tree(path)
+            changes.add(path)
+        return changes
+
+
+class _PollingMonitor(object):
+    """Change monitor based on polling file metadata."""
+
+    def __init__(self, dif):
+        self._dif = dif
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        rtn = {}
+        for path in self._dif.get_files():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            rtn[path] = (st.st_size, st.st_mtime_ns, st.st_ino)
+        return rtn
+
+    def close(self):
+        pass
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        snapshot = self._scan()
+        changes = set(path for path, meta in snapshot.items()
+                      if self._snapshot.get(path) != meta)
+        changes.update(set(self._snapshot) - set(snapshot))
+        self._snapshot = snapshot
+        return changes
+
+
+class Watcher(object):
+    """Keep a DataIntegrityFingerprint up to date while the data changes.
+
+    Example
+    -------
+    dif = DataIntegrityFingerprint("~/acquisition")
+    watcher = Watcher(dif, checksums_file="acquisition.sha256")
+    watcher.run(callback=lambda dif: print(dif))
+
+    """
+
+    def __init__(self, dif, checksums_file=None, interval=1.0,
+                 use_inotify=True):
+        """Create a Watcher.
+
+        Parameters
+        ----------
+        dif : DataIntegrityFingerprint
+            the DataIntegrityFingerprint object of a data directory
+        checksums_file : str, optional
+            if given, the checksums file is rewritten after each update
+        interval : float, optional
+            the polling interval in seconds; with inotify, changes are
+            collected for this duration before the DIF is updated
+            (default: 1.0)
+        use_inotify : bool, optional
+            use filesystem notifications, if available (default: True)
+
+        """
+
+        if not os.path.isdir(dif.data):
+            raise ValueError("{0} is not a directory.".format(dif.data))
+        self._dif = dif
+        self._checksums_file = checksums_file
+        self._interval = interval
+        self._use_inotify = use_inotify
+        self._stop_event = threading.Event()
+        self._monitor = None
+
+    @property
+    def dif(self):
+        return self._dif
+
+    @property
+    def uses_inotify(self):
+        return isinstance(self._monitor, _InotifyMonitor)
+
+    def start(self):
+        """Start monitoring and generate the initial hash list."""
+
+        self._stop_event.clear()
+        self._monitor = None
+        if self._use_inotify:
+            try:
+                self._monitor = _InotifyMonitor(self._dif)
+            except (OSError, AttributeError):
+                pass
+        if self._monitor is None:
+            self._monitor = _PollingMonitor(self._dif)
+        self._dif.generate()
+        self._save()
+
+    def stop(self):
+        """Stop watching (can be called from another thread)."""
+
+        self._stop_event.set()
+
+    def close(self):
+        if self._monitor is not None:
+            self._monitor.close()
+            self._monitor = None
+
+    def update(self, timeout=None):
+        """Wait for changes and update the DIF.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            the maximum time to wait for changes (default: interval)
+
+        Returns
+        -------
+        changes : set of str
+            the changed paths (empty, if nothing has changed)
+
+        """
+
+        if self._monitor is None:
+            self.start()
+        if timeout is None:
+            timeout = self._interval
+        changes = self._monitor.wait(timeout)
+        if changes and isinstance(self._monitor, _InotifyMonitor):
+            # collect further changes of files that are still being written
+            deadline = time.time() + self._interval
+            while changes is not None and not self._stop_event.is_set():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                more = self._monitor.wait(remaining)
+                if more is None:
+                    changes = None
+                else:
+                    changes.update(more)
+
+        if changes is None:  # event queue overflow
+            self._dif.generate()
+            changes = set([self._dif.data])
+        elif changes:
+            self._dif.rehash(sorted(changes))
+        if changes:
+            self._save()
+        return changes
+
+    def run(self, callback=None):
+        """Watch the data directory until `stop()` is called.
+
+        Parameters
+        ----------
+        callback : function, optional
+            a function that is called with the DataIntegrityFingerprint
+            object initially and after each update
+
+        """
+
+        self.start()
+        try:
+            if callback is not None:
+                callback(self._dif)
+            while not self._stop_event.is_set():
+                if self.update() and callback is not None:
+                    callback(self._dif)
+        finally:
+            self.close()
+
+    def _save(self):
+        if self._checksums_file is not None:
+            self._dif.save_checksums(self._checksums_file)
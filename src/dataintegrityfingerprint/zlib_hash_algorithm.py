@@ -3,20 +3,25 @@
 This module provides a wrapper for zlib hash functions to have a unique
 interface for all types of algorithms.
 
-Each hash algorithm object has the methods `update` and the properties
-`checksum` & `hash_algorithm`
+Each hash algorithm object has the methods `update`, `copy` & `digest` and
+the properties `checksum` & `hash_algorithm`
 
 """
 
 import zlib
+import struct
 
 
 class ZlibHashAlgorithm(object):
     """Zlib hash algorithm."""
 
+    __slots__ = ("hash_algorithm", "_hasher", "_current")
+
     SUPPORTED_ALGORITHMS = sorted(["CRC-32",
                                    "ADLER-32"])
 
+    digest_size = 4
+
     def __init__(self, hash_algorithm):
         """Initialize a ZlibHashAlgorithm.
 
@@ -35,7 +40,7 @@ class ZlibHashAlgorithm(object):
             self._current = 0
             self._hasher = zlib.crc32
         elif hash_algorithm == "ADLER-32":
-            self._current = None
+            self._current = 1  # initial value, i.e. zlib.adler32(b"")
             self._hasher = zlib.adler32
         else:
             raise ValueError("{0} is not a supported hash algorithm.".format(
@@ -52,10 +57,26 @@ class ZlibHashAlgorithm(object):
 
         """
 
-        try:
-            self._current = self._hasher(data, self._current)
-        except:
-            self._current = self._hasher(data)
+        self._current = self._hasher(data, self._current)
+
+    def copy(self):
+        """Return a copy of the hash object."""
+
+        rtn = ZlibHashAlgorithm.__new__(ZlibHashAlgorithm)
+        rtn.hash_algorithm = self.hash_algorithm
+        rtn._hasher = self._hasher
+        rtn._current = self._current
+        return rtn
+
+    def digest(self):
+        """Return the raw (big-endian) digest of the data passed so far.
+
+        Note that `checksum` is not zero-padded, i.e. it is not always the
+        hexadecimal representation of all bytes of the digest.
+
+        """
+
+        return struct.pack(">I", self._current)
 
     @property
     def checksum(self):
@@ -0,0 +1,157 @@
+"""Synthetic test data with known DIFs.
+
+The fixtures are created locally (no network access required) and cover
+edge cases of the file tree: unicode paths, empty files, deep trees and
+symbolic links. The known SHA-256 DIFs have been calculated independently
+of this package (see `reference_dif`).
+
+"""
+
+
+import os
+import zlib
+import hashlib
+
+
+def _deep_tree(depth):
+    path = "/".join("level{0:02d}".format(i) for i in range(depth))
+    return {path + "/leaf.txt": b"leaf", "top.txt": b"top"}
+
+
+FIXTURES = {
+    "unicode": {
+        "files": {u"äöü.txt": b"umlauts",
+                  u"日本/文字.txt": b"cjk",
+                  u"emoji_\U0001f600.bin": bytes(range(256)),
+                  u"space and %25 percent.txt": b"odd",
+                  u"café/naïve.txt": b"accents"},
+        "symlinks": {}},
+    "empty": {
+        "files": {"empty.txt": b"",
+                  "sub/empty.bin": b"",
+                  "sub/not_empty.txt": b"x"},
+        "symlinks": {},
+        "directories": ["empty_dir", "sub/empty_dir"]},
+    "deep": {
+        "files": _deep_tree(40),
+        "symlinks": {}},
+    "symlinks": {
+        "files": {"target/a.txt": b"a",
+                  "target/b.txt": b"b",
+                  "file.txt": b"file"},
+        # link -> target (relative to the link); links are followed
+        "symlinks": {"link_to_file.txt": "file.txt",
+                     "link_to_dir": "target"}},
+}
+
+KNOWN_DIFS = {
+    "unicode":
+        "d5cd81dbf970502fcdeb3c933270481b728fb594ab52e7a2dd898bfb34f186b1",
+    "empty":
+        "c8b366341686a1b089f90f341b7fd7985d67e7c9d81d52db7e3ddb4118612bbf",
+    "deep":
+        "2f8a50bc9874702b7e37756091e6dfee326358f7c014f1768670d5a2294d7428",
+    "symlinks":
+        "c62096559b0f6ff9360b2f1ff6a10e30a0f1cffea793669a93c12853c71917fd",
+}
+
+
+def create_fixture(root, name):
+    """Create a fixture.
+
+    Parameters
+    ----------
+    root : str
+        the directory to create the fixture in (must not exist)
+    name : str
+        one of `FIXTURES`
+
+    Returns
+    -------
+    supported : bool
+        False, if the fixture cannot be created on this platform (e.g.
+        symbolic links on Windows without privileges)
+
+    """
+
+    fixture = FIXTURES[name]
+    os.makedirs(root)
+    for filename, content in fixture["files"].items():
+        path = os.path.join(root, *filename.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+    for directory in fixture.get("directories", []):
+        os.makedirs(os.path.join(root, *directory.split("/")),
+                    exist_ok=True)
+    for link, target in fixture["symlinks"].items():
+        try:
+            os.symlink(target, os.path.join(root, link),
+                       target_is_directory=target in _directories(fixture))
+        except (OSError, NotImplementedError, AttributeError):
+            return False
+    # some file systems (e.g. HFS+) normalize unicode file names
+    for filename in fixture["files"]:
+        path = os.path.join(root, *filename.split("/"))
+        if not os.path.exists(path):
+            return False
+        if os.path.basename(path) not in os.listdir(os.path.dirname(path)):
+            return False
+    return True
+
+
+def _directories(fixture):
+    rtn = set()
+    for filename in fixture["files"]:
+        parts = filename.split("/")[:-1]
+        for i in range(len(parts)):
+            rtn.add("/".join(parts[:i + 1]))
+    return rtn
+
+
+def expected_files(name):
+    """Get the content of each file of a fixture as seen by the DIF.
+
+    Symbolic links are followed, i.e. linked files appear under the path of
+    the link.
+
+    """
+
+    fixture = FIXTURES[name]
+    rtn = dict(fixture["files"])
+    for link, target in fixture["symlinks"].items():
+        if target in fixture["files"]:
+            rtn[link] = fixture["files"][target]
+        prefix = target + "/"
+        for filename, content in fixture["files"].items():
+            if filename.startswith(prefix):
+                rtn[link + "/" + filename[len(prefix):]] = content
+    return rtn
+
+
+def reference_dif(files, hash_algorithm="sha256"):
+    """Calculate the DIF of file contents with hashlib or zlib only.
+
+    Parameters
+    ----------
+    files : dict
+        the content of each file by path
+    hash_algorithm : str, optional
+        a hashlib name, "crc32" or "adler32" (default: "sha256")
+
+    """
+
+    def checksum(content):
+        if hash_algorithm == "crc32":
+            return hex(zlib.crc32(content))[2:]
+        if hash_algorithm == "adler32":
+            return hex(zlib.adler32(content))[2:]
+        return hashlib.new(hash_algorithm, content).hexdigest()
+
+    hash_list = sorted(((checksum(content), path)
+                        for path, content in files.items()),
+                       key=lambda x: x[0] + x[1])
+    concat = "".join(h + path for h, path in hash_list).encode("utf-8")
+    if hash_algorithm in ("crc32", "adler32"):
+        return checksum(concat)
+    return hashlib.new(hash_algorithm, concat).hexdigest()
@@ -0,0 +1,193 @@
+"""A local stand-in for an S3-compatible object store.
+
+Serves the files of a local directory as objects of buckets (the
+subdirectories of the directory) via the subset of the S3 REST API that is
+used by `storage.S3Storage`: ListObjectsV2 (with pagination), HEAD and GET
+(with ranges), using path style addressing and persistent connections.
+
+Example
+-------
+with S3Server(root) as server:
+    storage = S3Storage(server.endpoint_url, "bucket")
+
+"""
+
+
+import os
+import threading
+import urllib.parse
+from email.utils import formatdate
+from xml.sax.saxutils import escape
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class S3Server(object):
+
+    def __init__(self, root, max_keys=1000, access_key=None, truncate=0):
+        """Create an S3Server on a free port of localhost.
+
+        Parameters
+        ----------
+        root : str
+            the directory with a subdirectory per bucket
+        max_keys : int, optional
+            the maximum number of keys per listing (default: 1000)
+        access_key : str, optional
+            only accept requests signed with this access key (default: None,
+            i.e. anonymous requests)
+        truncate : int, optional
+            the number of responses with object data that are cut off in the
+            middle (default: 0)
+
+        """
+
+        self.root = root
+        self.max_keys = max_keys
+        self.access_key = access_key
+        self.truncate = truncate
+        self.requests = []
+        self.connections = 0
+        handler = type("Handler", (_Handler,), {"server_": self})
+        self._httpd = _ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._thread = None
+
+    @property
+    def endpoint_url(self):
+        return "http://127.0.0.1:{0}".format(self._httpd.server_port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"  # persistent connections
+    server_ = None
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server_.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self._handle(head=True)
+
+    def do_GET(self):
+        self._handle(head=False)
+
+    def _handle(self, head):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query,
+                                            keep_blank_values=True))
+        parts = urllib.parse.unquote(url.path).lstrip("/").split("/", 1)
+        bucket, key = parts[0], parts[1] if len(parts) > 1 else ""
+        self.server_.requests.append((self.command, bucket, key,
+                                      self.headers.get("Range")))
+        if self.server_.access_key is not None and \
+                "Credential={0}/".format(self.server_.access_key) not in \
+                self.headers.get("Authorization", ""):
+            return self._error(403, "AccessDenied")
+        bucket_dir = os.path.join(self.server_.root, bucket)
+        if not bucket or not os.path.isdir(bucket_dir):
+            return self._error(404, "NoSuchBucket")
+        if not key:
+            if query.get("list-type") != "2":
+                return self._error(400, "InvalidRequest")
+            return self._list(bucket_dir, query)
+        path = os.path.join(bucket_dir, *key.split("/"))
+        if not os.path.isfile(path):
+            return self._error(404, "NoSuchKey")
+        self._object(path, head)
+
+    def _list(self, bucket_dir, query):
+        prefix = query.get("prefix", "")
+        max_keys = min(int(query.get("max-keys", 1000)),
+                       self.server_.max_keys)
+        start_after = query.get("continuation-token", "")
+        keys = []
+        for dir_, _, files in os.walk(bucket_dir):
+            for filename in files:
+                path = os.path.join(dir_, filename)
+                key = os.path.relpath(path, bucket_dir).replace(os.path.sep,
+                                                                "/")
+                if key.startswith(prefix) and key > start_after:
+                    keys.append((key, os.path.getsize(path)))
+        keys.sort()
+        truncated = len(keys) > max_keys
+        keys = keys[:max_keys]
+        xml = ['<?xml version="1.0" encoding="UTF-8"?>',
+               '<ListBucketResult '
+               'xmlns="http://s3.amazonaws.com/doc/2006-03-01/">',
+               "<Prefix>{0}</Prefix>".format(escape(prefix)),
+               "<KeyCount>{0}</KeyCount>".format(len(keys)),
+               "<IsTruncated>{0}</IsTruncated>".format(
+                   "true" if truncated else "false")]
+        if truncated:
+            xml.append("<NextContinuationToken>{0}</NextContinuationToken>"
+                       .format(escape(keys[-1][0])))
+        for key, size in keys:
+            xml.append("<Contents><Key>{0}</Key><Size>{1}</Size></Contents>"
+                       .format(escape(key), size))
+        xml.append("</ListBucketResult>")
+        self._send(200, "\n".join(xml).encode("utf-8"), "application/xml")
+
+    def _object(self, path, head):
+        size = os.path.getsize(path)
+        headers = {"Last-Modified": formatdate(os.path.getmtime(path),
+                                               usegmt=True)}
+        status, start, end = 200, 0, size - 1
+        range_ = self.headers.get("Range")
+        if range_ is not None:
+            first, last = range_.split("=", 1)[1].split("-")
+            start, end = int(first), min(int(last or size - 1), size - 1)
+            status = 206
+            headers["Content-Range"] = "bytes {0}-{1}/{2}".format(
+                start, end, size)
+        if head:
+            return self._send(status, b"", headers=headers,
+                              content_length=size)
+        with open(path, "rb") as f:
+            f.seek(start)
+            body = f.read(max(0, end - start + 1))
+        if self.server_.truncate > 0 and len(body) > 1:
+            self.server_.truncate -= 1
+            self.close_connection = True
+            return self._send(status, body[:len(body) // 2],
+                              headers=headers, content_length=len(body))
+        self._send(status, body, headers=headers)
+
+    def _error(self, status, code):
+        self._send(status, "<Error><Code>{0}</Code></Error>".format(
+            code).encode("utf-8"), "application/xml")
+
+    def _send(self, status, body, content_type="application/octet-stream",
+              headers=None, content_length=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(
+            len(body) if content_length is None else content_length))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
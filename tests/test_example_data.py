@@ -5,19 +5,29 @@ import os
 import shutil
 import tempfile
 import unittest
+import urllib.error
 import urllib.request
 import zipfile
 
 from dataintegrityfingerprint import DataIntegrityFingerprint
 
 
+EXAMPLE_DATA_URL = "https://github.com/expyriment/dataintegrityfingerprint/archive/refs/heads/master.zip"
+
+
 def setUpModule():
     print("Downloading example data...")
     global TMP_DIR
     global EXAMPLE_DATA_PATH
+    try:
+        http_response = urllib.request.urlopen(EXAMPLE_DATA_URL, timeout=30)
+        content = http_response.read()
+    except (urllib.error.URLError, OSError) as e:
+        # e.g. air-gapped build nodes; see test_synthetic_data.py instead
+        raise unittest.SkipTest(
+            "Example data cannot be downloaded ({0})".format(e))
     TMP_DIR = tempfile.mkdtemp()
-    http_response = urllib.request.urlopen("https://github.com/expyriment/dataintegrityfingerprint/archive/refs/heads/master.zip")
-    z = zipfile.ZipFile(io.BytesIO(http_response.read()))
+    z = zipfile.ZipFile(io.BytesIO(content))
     z.extractall(path=TMP_DIR)
     EXAMPLE_DATA_PATH = os.path.join(TMP_DIR,
                                      "dataintegrityfingerprint-master",
@@ -40,14 +50,15 @@ class AllAlgorithmsTestCase(unittest.TestCase):
         global TMP_DIR
         global EXAMPLE_DATA_PATH
         for data in glob.glob(f"{EXAMPLE_DATA_PATH}/*/"):
-            for algorithm in available_algorithms:
-                for multiprocessing in (False, True):
-                    dif = DataIntegrityFingerprint(
-                        data, hash_algorithm=algorithm,
-            multiprocessing=multiprocessing,
-                        allow_non_cryptographic_algorithms=True)
-                    dif.generate()
-                    self.difs.append(dif)
+            for i, algorithm in enumerate(available_algorithms):
+                # alternate, since both result in the same hash list
+                multiprocessing = i % 2 == 1
+                dif = DataIntegrityFingerprint(
+                    data, hash_algorithm=algorithm,
+                    multiprocessing=multiprocessing,
+                    allow_non_cryptographic_algorithms=True)
+                dif.generate()
+                self.difs.append(dif)
         self.tmp_filenames = []
         print("Running tests...")
 
@@ -103,18 +114,17 @@ class AllAlgorithmsFromChecksumsFileTestCase(unittest.TestCase):
         global EXAMPLE_DATA_PATH
         for data in glob.glob(f"{EXAMPLE_DATA_PATH}/*/"):
             for algorithm in available_algorithms:
-                for multiprocessing in (False, True):
-                    extension = "".join(
-                        x for x in algorithm.lower() if x.isalnum())
-                    checksums_file = glob.glob(
-                        f"{os.path.split(data)[0]}-*.{extension}")[0]
-                    dif = DataIntegrityFingerprint(
-                        checksums_file, from_checksums_file=True,
-                        hash_algorithm=algorithm,
-                        multiprocessing=multiprocessing,
-                        allow_non_cryptographic_algorithms=True)
-                    dif.generate()
-                    self.difs.append(dif)
+                # reading a checksums file does not use multiprocessing
+                extension = "".join(
+                    x for x in algorithm.lower() if x.isalnum())
+                checksums_file = glob.glob(
+                    f"{os.path.split(data)[0]}-*.{extension}")[0]
+                dif = DataIntegrityFingerprint(
+                    checksums_file, from_checksums_file=True,
+                    hash_algorithm=algorithm,
+                    allow_non_cryptographic_algorithms=True)
+                dif.generate()
+                self.difs.append(dif)
         self.tmp_filenames = []
         print("Running tests...")
 
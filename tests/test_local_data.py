@@ -0,0 +1,636 @@
+import hashlib
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from dataintegrityfingerprint import DataIntegrityFingerprint
+from dataintegrityfingerprint.dif import plan_execution
+
+
+def create_files(root, files):
+    for filename, content in files.items():
+        path = os.path.join(root, *filename.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+
+
+def expected_dif(files):
+    hash_list = sorted((hashlib.sha256(content).hexdigest(), filename)
+                       for filename, content in files.items())
+    concat = "".join(h + fl for h, fl in hash_list)
+    return hashlib.sha256(concat.encode("utf-8")).hexdigest()
+
+
+FILES = {"a.txt": b"a",
+         "b.txt": b"bb" * 1000,
+         "sub/c.bin": bytes(range(256)) * 100,
+         "sub/deeper/d.txt": b"",
+         "sub/deeper/e.txt": b"a"}
+
+
+class LocalDataTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data = os.path.join(self.tmp_dir, "data")
+        create_files(self.data, FILES)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def create_broken_link(self, path):
+        # a file that is listed, but cannot be read
+        try:
+            os.symlink(os.path.join(self.tmp_dir, "nowhere"), path)
+        except (OSError, NotImplementedError, AttributeError):
+            self.skipTest("symlinks are not supported")
+
+    def test_execution_modes(self):
+        for execution in DataIntegrityFingerprint.EXECUTION_MODES:
+            with self.subTest(execution=execution):
+                dif = DataIntegrityFingerprint(self.data, execution=execution,
+                                               workers=2)
+                self.assertEqual(dif.dif, expected_dif(FILES))
+                self.assertEqual(dif.stats["files"], len(FILES))
+
+    def test_plan_execution(self):
+        self.assertEqual(plan_execution(3, 3000, cpu_count=16),
+                         ("serial", 1))
+        self.assertEqual(plan_execution(10 ** 6, 10 ** 9, cpu_count=16),
+                         ("processes", 16))
+        dif = DataIntegrityFingerprint(self.data)
+        dif.generate()
+        self.assertEqual(dif.stats["execution"], "serial")
+        self.assertEqual(dif.stats["bytes"],
+                         sum(len(x) for x in FILES.values()))
+
+    def test_rehash(self):
+        dif = DataIntegrityFingerprint(self.data)
+        dif.generate()
+        files = dict(FILES)
+        files["a.txt"] = b"changed"
+        files["new/f.txt"] = b"new"
+        del files["sub/c.bin"]
+        create_files(self.data, {"a.txt": b"changed", "new/f.txt": b"new"})
+        os.remove(os.path.join(self.data, "sub", "c.bin"))
+        dif.rehash([os.path.join(self.data, "a.txt"),
+                    os.path.join(self.data, "new"),
+                    os.path.join(self.data, "sub", "c.bin")])
+        self.assertEqual(dif.dif, expected_dif(files))
+        # before generate()
+        dif = DataIntegrityFingerprint(self.data)
+        dif.rehash([os.path.join(self.data, "a.txt")])
+        self.assertEqual(dif.dif, expected_dif(files))
+        self.assertEqual(dif.file_count, len(files))
+
+    def test_watch(self):
+        from dataintegrityfingerprint.watch import Watcher
+        files = dict(FILES)
+        for use_inotify in (True, False):
+            with self.subTest(use_inotify=use_inotify):
+                dif = DataIntegrityFingerprint(self.data)
+                watcher = Watcher(dif, interval=0.05, use_inotify=use_inotify)
+                watcher.start()
+                self.assertEqual(dif.dif, expected_dif(files))
+                files["w/{0}.txt".format(use_inotify)] = b"watched"
+                create_files(self.data, files)
+                for _ in range(20):
+                    watcher.update(timeout=0.1)
+                    if dif.dif == expected_dif(files):
+                        break
+                watcher.close()
+                self.assertEqual(dif.dif, expected_dif(files))
+
+    def test_hard_links_and_duplicates(self):
+        files = dict(FILES)
+        files["linked.txt"] = FILES["b.txt"]
+        try:
+            os.link(os.path.join(self.data, "b.txt"),
+                    os.path.join(self.data, "linked.txt"))
+        except (OSError, NotImplementedError, AttributeError):
+            self.skipTest("hard links are not supported")
+        dif = DataIntegrityFingerprint(self.data)
+        dif.generate()
+        self.assertEqual(dif.dif, expected_dif(files))
+        self.assertEqual(dif.stats["hard_links"], 1)
+        self.assertEqual(sorted(dif.duplicates()),
+                         [["a.txt", "sub/deeper/e.txt"],
+                          ["b.txt", "linked.txt"]])
+
+    def test_duplicates_of_unpadded_checksums(self):
+        # CRC-32 checksums 7d3c9f1 and 7d3c9f15: the entries of the
+        # duplicates are not adjacent ("7d3c9f10.txt" < "7d3c9f15other.bin"
+        # < "7d3c9f1z.txt")
+        create_files(self.data, {"0.txt": b"duplicate 57",
+                                 "z.txt": b"duplicate 57",
+                                 "other.bin": b"other L\x97\x1a\xe1"})
+        dif = DataIntegrityFingerprint(
+            self.data, hash_algorithm="CRC-32",
+            allow_non_cryptographic_algorithms=True)
+        dif.generate()
+        self.assertEqual(sorted(dif.duplicates()),
+                         [["0.txt", "z.txt"],
+                          ["a.txt", "sub/deeper/e.txt"]])
+
+    def test_path_filter(self):
+        create_files(self.data, {"cache/x.txt": b"x", "sub/cache/y": b"y",
+                                 "tmp.tmp": b"t",
+                                 ".difignore": b"# comment\ncache/\n"})
+        files = dict(FILES)
+        files[".difignore"] = b"# comment\ncache/\n"
+        dif = DataIntegrityFingerprint(self.data, exclude=["*.tmp"],
+                                       ignore_file=".difignore")
+        self.assertEqual(dif.dif, expected_dif(files))
+        dif = DataIntegrityFingerprint(self.data, include=["re:\\.txt$"],
+                                       exclude=["sub/deeper", "/cache"])
+        self.assertEqual(dif.dif, expected_dif(
+            {"a.txt": FILES["a.txt"], "b.txt": FILES["b.txt"]}))
+
+    def test_io_modes(self):
+        for io_mode in DataIntegrityFingerprint.IO_MODES:
+            with self.subTest(io_mode=io_mode):
+                dif = DataIntegrityFingerprint(self.data, io_mode=io_mode,
+                                               execution="threads")
+                self.assertEqual(dif.dif, expected_dif(FILES))
+
+    def test_device_scheduling(self):
+        from dataintegrityfingerprint.scheduler import DeviceScheduler
+        for read_order in DataIntegrityFingerprint.READ_ORDERS:
+            with self.subTest(read_order=read_order):
+                dif = DataIntegrityFingerprint(self.data, execution="threads",
+                                               workers=4,
+                                               max_workers_per_device=1,
+                                               read_order=read_order)
+                self.assertEqual(dif.dif, expected_dif(FILES))
+                self.assertEqual(dif.stats["devices"], 1)
+
+        file_ids = {"a": (1, 3), "b": (1, 2), "c": (2, 1)}
+        scheduler = DeviceScheduler(["a", "b", "c"], file_ids,
+                                    max_per_device=1, read_order="inode")
+        tasks = iter(scheduler)
+        self.assertEqual(next(tasks), ("b", "a"))
+        self.assertEqual(next(tasks), ("c", None))
+        scheduler.done("b")
+        self.assertEqual(next(tasks), ("a", None))
+
+    def test_rate_limiter(self):
+        from dataintegrityfingerprint.throttle import RateLimiter
+        limiter = RateLimiter(files_per_second=50, burst=0.01)
+        for execution in ("serial", "processes"):
+            with self.subTest(execution=execution):
+                dif = DataIntegrityFingerprint(self.data, execution=execution,
+                                               workers=2,
+                                               rate_limiter=limiter)
+                dif.generate()
+                self.assertEqual(dif.dif, expected_dif(FILES))
+                self.assertGreater(dif.stats["elapsed"],
+                                   (len(FILES) - 1) / 50.0)
+        limiter.set_rates()
+        self.assertTrue(limiter.unlimited)
+
+    def test_hash_algorithms(self):
+        import zlib
+        from dataintegrityfingerprint.dif import new_hash_instance, \
+            _hex_checksums
+        references = dict(
+            (x, lambda d, n=y: hashlib.new(n, d).hexdigest())
+            for x, y in (("MD5", "md5"), ("SHA-1", "sha1"),
+                         ("SHA-256", "sha256"), ("SHA3-512", "sha3_512")))
+        references["CRC-32"] = lambda d: hex(zlib.crc32(d))[2:]
+        references["ADLER-32"] = lambda d: hex(zlib.adler32(d))[2:]
+        for algorithm, reference in references.items():
+            with self.subTest(algorithm=algorithm):
+                hasher = new_hash_instance(algorithm.lower().replace("-", "_"),
+                                           True)
+                self.assertEqual(hasher.hash_algorithm, algorithm)
+                self.assertEqual(hasher.checksum, reference(b""))
+                copy = hasher.copy()
+                hasher.update(b"data")
+                self.assertEqual(hasher.checksum, reference(b"data"))
+                self.assertEqual(int(hasher.checksum, 16),
+                                 int.from_bytes(hasher.digest(), "big"))
+                self.assertEqual(copy.checksum, reference(b""))
+                # batch conversion of raw digests (b"62": CRC-32 0x12d20a)
+                data = [b"", b"62", b"data" * 1000]
+                digests = []
+                for content in data:
+                    hasher = new_hash_instance(algorithm, True)
+                    hasher.update(content)
+                    digests.append(hasher.digest())
+                self.assertEqual(_hex_checksums(digests, algorithm),
+                                 [reference(x) for x in data])
+        self.assertIsNone(new_hash_instance("CRC-32"))
+        self.assertIsNone(new_hash_instance("unknown", True))
+
+    def test_manifest_formats(self):
+        from dataintegrityfingerprint import manifest_formats
+        create_files(self.data, {"odd %0A\\\\ name": b"odd"})
+        files = dict(FILES)
+        files["odd %0A\\\\ name"] = b"odd"
+        dif = DataIntegrityFingerprint(self.data)
+        for manifest_format in DataIntegrityFingerprint.MANIFEST_FORMATS:
+            with self.subTest(manifest_format=manifest_format):
+                filename = os.path.join(self.tmp_dir, "manifest")
+                dif.export_manifest(filename, manifest_format)
+                other = DataIntegrityFingerprint(
+                    filename, from_checksums_file=True,
+                    checksums_format=manifest_format)
+                self.assertEqual(other.dif, expected_dif(files))
+                self.assertEqual(
+                    dif.diff_checksums(filename,
+                                       checksums_format=manifest_format), "")
+        records = list(manifest_formats.read_jsonl(filename))
+        self.assertEqual(records[0]["size"], len(FILES["a.txt"]))
+
+    def test_quick_check(self):
+        dif = DataIntegrityFingerprint(self.data, record_stats=True)
+        dif.generate()
+        filename = os.path.join(self.tmp_dir, "data.sha256")
+        dif.save_checksums(filename, extended=True)
+        self.assertTrue(os.path.isfile(filename + ".jsonl"))
+        check = DataIntegrityFingerprint(self.data)
+        self.assertEqual(check.quick_check(filename),
+                         {"modified": [], "missing": [], "new": []})
+        create_files(self.data, {"a.txt": b"changed", "new.txt": b"new"})
+        os.remove(os.path.join(self.data, "sub", "c.bin"))
+        self.assertEqual(check.quick_check(filename),
+                         {"modified": ["a.txt"], "missing": ["sub/c.bin"],
+                          "new": ["new.txt"]})
+
+    def test_audit(self):
+        dif = DataIntegrityFingerprint(self.data)
+        filename = os.path.join(self.tmp_dir, "data.sha256")
+        dif.save_checksums(filename)
+        report = dif.audit(filename, sample_size=len(FILES), seed=1)
+        self.assertEqual(report["sampled"], len(FILES))
+        self.assertEqual(report["mismatches"], [])
+        self.assertEqual(report["rate"], 0)
+        self.assertTrue(0 < report["upper"] < 1)
+        create_files(self.data, {"a.txt": b"changed"})
+        os.remove(os.path.join(self.data, "b.txt"))
+        for execution in ("serial", "threads"):
+            with self.subTest(execution=execution):
+                dif = DataIntegrityFingerprint(self.data, execution=execution,
+                                               workers=2)
+                report = dif.audit(filename, sample_size=len(FILES),
+                                   weighted=True)
+                self.assertEqual(report["mismatches"], ["a.txt"])
+                self.assertEqual(report["missing"], ["b.txt"])
+                self.assertEqual(report["rate"], 2 / len(FILES))
+                self.assertLess(report["lower"], report["rate"])
+        samples = [dif.audit(filename, sample_size=0.5, seed=7)
+                   for _ in range(2)]
+        self.assertEqual(samples[0]["sampled"], 3)
+        self.assertEqual(samples[0], dict(samples[1],
+                                          elapsed=samples[0]["elapsed"]))
+
+    @unittest.skipUnless(hasattr(socket, "AF_UNIX"), "requires Unix sockets")
+    def test_audit_unreadable_file(self):
+        filename = os.path.join(self.tmp_dir, "data.sha256")
+        DataIntegrityFingerprint(self.data).save_checksums(filename)
+        with open(filename, "a") as f:
+            f.write("{0}  sock\n".format(hashlib.sha256(b"").hexdigest()))
+        # a socket can be listed, but not opened
+        sock = socket.socket(socket.AF_UNIX)
+        try:
+            sock.bind(os.path.join(self.data, "sock"))
+            report = DataIntegrityFingerprint(self.data).audit(
+                filename, sample_size=len(FILES) + 1)
+        finally:
+            sock.close()
+        self.assertEqual([x["path"] for x in report["errors"]], ["sock"])
+        self.assertEqual(report["mismatches"], [])
+        self.assertEqual(report["rate"], 1 / (len(FILES) + 1))
+
+    def test_cancel(self):
+        files = dict(("many/{0:03d}.txt".format(i), b"x" * i)
+                     for i in range(200))
+        create_files(self.data, files)
+        for execution in ("serial", "threads", "processes"):
+            with self.subTest(execution=execution):
+                dif = DataIntegrityFingerprint(self.data, execution=execution,
+                                               workers=2)
+                results = []
+
+                def result(checksum, path):
+                    results.append(path)
+                    if len(results) == 10:
+                        dif.cancel()
+
+                self.assertFalse(dif.generate(result=result))
+                self.assertTrue(dif.stats["cancelled"])
+                self.assertLess(len(dif.file_hash_list),
+                                len(FILES) + len(files))
+                self.assertEqual(sorted(x[1] for x in dif.file_hash_list),
+                                 sorted(results))
+                self.assertTrue(dif.generate())
+                self.assertEqual(dif.stats["files_done"],
+                                 len(FILES) + len(files))
+
+    def test_generate_external(self):
+        from dataintegrityfingerprint import external_sort
+        files = dict(("many/{0:03d}.txt".format(i), b"x" * i)
+                     for i in range(300))
+        create_files(self.data, files)
+        files.update(FILES)
+        dif = DataIntegrityFingerprint(self.data)
+        filename = os.path.join(self.tmp_dir, "data.sha256")
+        # a few entries per run
+        budget = 20 * (external_sort.ENTRY_OVERHEAD + 100)
+        self.assertEqual(dif.generate_external(filename, memory_budget=budget),
+                         expected_dif(files))
+        self.assertGreater(dif.stats["runs"], 10)
+        self.assertEqual(dif.file_count, len(files))
+        self.assertEqual(dif.diff_checksums(filename), "")
+        other = DataIntegrityFingerprint(filename, from_checksums_file=True)
+        self.assertEqual(other.generate_external(memory_budget=budget),
+                         expected_dif(files))
+
+    def test_external_sort(self):
+        import random
+        from dataintegrityfingerprint import external_sort
+        entries = [("{0:08x}".format(random.getrandbits(32)),
+                    "dir/{0}".format(i)) for i in range(1000)]
+        # one entry per run: more runs than are merged at once
+        sorter = external_sort.ExternalSorter(
+            memory_budget=external_sort.ENTRY_OVERHEAD)
+        with sorter:
+            sorter.extend(entries)
+            self.assertGreater(sorter.runs, 2 * external_sort.MAX_FAN_IN)
+            merged = iter(sorter)
+            self.assertEqual(next(merged), min(
+                entries, key=external_sort.hash_order))
+            if os.path.isdir("/proc/self/fd"):
+                # run files are only open while they are merged
+                self.assertLess(len(os.listdir("/proc/self/fd")),
+                                external_sort.MAX_FAN_IN + 20)
+            self.assertEqual([next(merged)] + list(merged), sorted(
+                entries, key=external_sort.hash_order)[1:])
+
+    def test_manifest_index(self):
+        from dataintegrityfingerprint.manifest_index import ManifestIndex
+        create_files(self.data, {"ä/x.txt": b"x", "z.txt": b"z"})
+        dif = DataIntegrityFingerprint(self.data)
+        filename = dif.save_index(os.path.join(self.tmp_dir, "a.difidx"))
+        create_files(self.data, {"a.txt": b"changed"})
+        os.remove(os.path.join(self.data, "z.txt"))
+        changed = DataIntegrityFingerprint(self.data)
+        other = changed.save_index(os.path.join(self.tmp_dir, "b.difidx"))
+        with ManifestIndex(filename) as index, \
+                ManifestIndex(filename) as same, \
+                ManifestIndex(other) as different:
+            self.assertEqual(index.dif, dif.dif)
+            self.assertEqual(len(index), len(FILES) + 2)
+            self.assertEqual(sorted(index, key=lambda x: x[0] + x[1]),
+                             dif.file_hash_list)
+            self.assertTrue(index == same)
+            self.assertFalse(index == different)
+            self.assertEqual(index.lookup("ä/x.txt"),
+                             hashlib.sha256(b"x").hexdigest())
+            self.assertIsNone(index.lookup("missing.txt"))
+            self.assertTrue(index.verify(self.data, "sub/c.bin"))
+            self.assertFalse(index.verify(self.data, "a.txt"))
+            self.assertEqual(
+                [(x[0], x[2]) for x in different.diff(index)],
+                [("-", "a.txt"), ("+", "a.txt"), ("-", "z.txt")])
+            self.assertEqual(list(index.diff(same)), [])
+
+    def test_archives(self):
+        import tarfile
+        import zipfile
+        create_files(self.data, {"sub/big.bin": os.urandom(200000)})
+        files = dict(FILES)
+        with open(os.path.join(self.data, "sub", "big.bin"), "rb") as f:
+            files["sub/big.bin"] = f.read()
+        try:
+            os.symlink("a.txt", os.path.join(self.data, "link.txt"))
+            files["link.txt"] = files["a.txt"]
+        except (OSError, NotImplementedError, AttributeError):
+            pass  # e.g. Windows without the privilege to create symlinks
+        archives = []
+        for name, mode in (("data.tar", "w"), ("data.tar.gz", "w:gz")):
+            path = os.path.join(self.tmp_dir, name)
+            with tarfile.open(path, mode) as tar:
+                tar.add(self.data, arcname="./")
+            archives.append(path)
+        path = os.path.join(self.tmp_dir, "data.zip")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+            for filename, content in files.items():
+                z.writestr(filename, content)
+            z.writestr("empty_dir/", b"")
+        archives.append(path)
+        for archive in archives:
+            for execution in ("serial", "threads", "processes"):
+                with self.subTest(archive=archive, execution=execution):
+                    dif = DataIntegrityFingerprint(archive,
+                                                   execution=execution,
+                                                   workers=2)
+                    self.assertEqual(dif.dif, expected_dif(files))
+        dif = DataIntegrityFingerprint(archives[0], exclude=["sub/"])
+        self.assertEqual(sorted(x[1] for x in dif.file_hash_list),
+                         sorted(x for x in files if "/" not in x))
+        # tasks close their archives (workers of a shared pool are not
+        # closed after a generation)
+        from dataintegrityfingerprint import archive_reader
+        from dataintegrityfingerprint.dif import _hash_members
+        members = archive_reader.list_members(path, "zip")
+        _hash_members((0, [x[1] for x in members.values()],
+                       "SHA-256", (path, "zip"), (False, 0, 5.0), None))
+        self.assertEqual(archive_reader._open_archives, {})
+
+    def test_archive_processes(self):
+        import zipfile
+        files = dict(("dir/{0}.bin".format(i), os.urandom(400000))
+                     for i in range(16))
+        path = os.path.join(self.tmp_dir, "many.zip")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+            for filename, content in files.items():
+                z.writestr(filename, content)
+        # forked workers must not share the archive opened for listing
+        for _ in range(5):
+            dif = DataIntegrityFingerprint(path, execution="processes",
+                                           workers=4)
+            self.assertEqual(dif.dif, expected_dif(files))
+
+    def test_path_store(self):
+        import sys
+        from dataintegrityfingerprint.path_store import PathStore, HashList
+        paths = ["top.txt", u"sub/äöü.txt", "sub/deeper/x", "sub/\udcff.bin",
+                 "sub/deeper/y"]
+        store = PathStore(paths)
+        self.assertEqual(list(store), paths)
+        self.assertEqual(store[-1], "sub/deeper/y")
+        self.assertEqual(store.directories, 3)
+        self.assertEqual(list(store.reordered([4, 0])),
+                         ["sub/deeper/y", "top.txt"])
+        # checksums of different lengths (e.g. CRC-32)
+        entries = [("1f", "b"), ("1f", "a"), ("abc", "x"), ("1", "fz")]
+        hash_list = HashList(entries)
+        hash_list.sort()
+        self.assertEqual(hash_list, sorted(entries,
+                                           key=lambda x: x[0] + x[1]))
+        self.assertEqual(list(hash_list.by_path()), sorted(
+            entries, key=lambda x: x[1]))
+        # less memory than separate strings for deep trees (with a margin
+        # for the sizes of objects in different Python versions: about a
+        # third here)
+        deep = ["project/derivatives/subject_{0:03d}/session_{1:02d}/raw/"
+                "run_{2:04d}.edf".format(i // 1000, i // 50 % 20, i)
+                for i in range(2000)]
+        self.assertLess(PathStore(deep).nbytes(),
+                        sum(sys.getsizeof(x) for x in deep) / 2)
+
+    def test_batch(self):
+        from dataintegrityfingerprint.batch import fingerprint_many
+        other = os.path.join(self.tmp_dir, "other")
+        create_files(other, {"x.txt": b"x"})
+        empty = os.path.join(self.tmp_dir, "empty")
+        os.makedirs(empty)
+        missing = os.path.join(self.tmp_dir, "missing")
+        for execution in ("serial", "threads", "processes"):
+            with self.subTest(execution=execution):
+                results = dict(
+                    (x["path"], x) for x in fingerprint_many(
+                        iter([self.data, other, empty, missing]),
+                        execution=execution, workers=2, concurrent_roots=2))
+                self.assertEqual(results[self.data]["dif"],
+                                 expected_dif(FILES))
+                self.assertEqual(results[self.data]["files"], len(FILES))
+                self.assertEqual(results[other]["dif"],
+                                 expected_dif({"x.txt": b"x"}))
+                self.assertIsNone(results[empty]["dif"])
+                self.assertIn("error", results[missing])
+
+    @unittest.skipUnless(hasattr(os, "symlink"), "requires symlinks")
+    def test_batch_unreadable(self):
+        from dataintegrityfingerprint.batch import fingerprint_many
+        unreadable = os.path.join(self.tmp_dir, "unreadable")
+        os.makedirs(unreadable)
+        try:
+            os.symlink(os.path.join(self.tmp_dir, "nowhere"),
+                       os.path.join(unreadable, "broken"))
+        except (OSError, NotImplementedError):
+            self.skipTest("symlinks are not supported")
+        result, = fingerprint_many([unreadable], execution="serial",
+                                   on_error="skip")
+        self.assertEqual(result["error"], "No file could be read")
+        self.assertEqual(result["file_errors"][0]["path"], "broken")
+
+    def test_metrics(self):
+        import urllib.request
+        from dataintegrityfingerprint.metrics import Metrics, \
+            MetricsServer, TextfileExporter
+        metrics = Metrics(labels={"node": "test"})
+        filename = os.path.join(self.tmp_dir, "dif.prom")
+        with MetricsServer(metrics, port=0) as server, \
+                TextfileExporter(metrics, filename, interval=0.01):
+            dif = DataIntegrityFingerprint(self.data, execution="threads",
+                                           workers=2, metrics=metrics)
+            dif.generate()
+            url = "http://127.0.0.1:{0}/metrics".format(server.port)
+            text = urllib.request.urlopen(url).read().decode("utf-8")
+            request = urllib.request.Request(
+                url, headers={"Accept": "application/openmetrics-text"})
+            openmetrics = urllib.request.urlopen(request).read().decode(
+                "utf-8")
+        self.assertIn('dif_files_hashed_total{node="test"} 5\n', text)
+        self.assertIn("# TYPE dif_files_hashed_total counter\n", text)
+        self.assertIn('dif_bytes_hashed_total{node="test"} 27602\n', text)
+        self.assertIn('dif_running{node="test"} 0\n', text)
+        self.assertIn("# TYPE dif_files_hashed counter\n", openmetrics)
+        self.assertTrue(openmetrics.endswith("# EOF\n"))
+        with open(filename) as f:
+            self.assertEqual(f.read(), metrics.render())
+        if os.name == "posix":
+            umask = os.umask(0o022)
+            os.umask(umask)
+            self.assertEqual(os.stat(filename).st_mode & 0o777,
+                             0o666 & ~umask)
+        values = metrics.snapshot()
+        self.assertEqual((values["workers"], values["queue_depth"]), (2, 0))
+        self.assertEqual(values["worker_utilization_estimate"], 0.0)
+        # no temporary files are left
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         ["data", "dif.prom"])
+
+    def test_error_policies(self):
+        self.create_broken_link(os.path.join(self.data, "sub", "broken"))
+        with self.assertRaises(OSError):
+            DataIntegrityFingerprint(self.data, execution="threads").generate()
+        for execution in DataIntegrityFingerprint.EXECUTION_MODES:
+            with self.subTest(execution=execution):
+                dif = DataIntegrityFingerprint(self.data, execution=execution,
+                                               workers=2, on_error="skip")
+                self.assertEqual(dif.dif, expected_dif(FILES))
+                self.assertEqual([(x["path"], x["attempts"])
+                                  for x in dif.errors], [("sub/broken", 1)])
+                self.assertEqual(dif.stats["errors"], 1)
+        dif = DataIntegrityFingerprint(self.data, execution="serial",
+                                       on_error="retry", retries=2)
+        dif.generate()
+        self.assertEqual(dif.errors[0]["attempts"], 3)
+        self.assertTrue(dif.errors[0]["error"].startswith(
+            "FileNotFoundError"))
+        with self.assertRaises(ValueError):
+            DataIntegrityFingerprint(self.data, on_error="ignore")
+
+    @unittest.skipUnless(hasattr(socket, "AF_UNIX"), "requires Unix sockets")
+    def test_skipped_hard_links(self):
+        # a socket is listed (and can be hard linked), but cannot be opened
+        sock = socket.socket(socket.AF_UNIX)
+        try:
+            sock.bind(os.path.join(self.data, "sock"))
+            os.link(os.path.join(self.data, "sock"),
+                    os.path.join(self.data, "sub", "link"))
+        except OSError:
+            self.skipTest("the socket cannot be hard linked")
+        finally:
+            sock.close()
+        dif = DataIntegrityFingerprint(self.data, on_error="skip")
+        self.assertEqual(dif.dif, expected_dif(FILES))
+        self.assertEqual(sorted(x["path"] for x in dif.errors),
+                         ["sock", "sub/link"])
+        self.assertEqual(dif.stats["errors"], 2)
+
+    @unittest.skipUnless(hasattr(os, "mkfifo"), "requires named pipes")
+    def test_read_timeout(self):
+        fifo = os.path.join(self.data, "hung")
+        os.mkfifo(fifo)  # opening it blocks like a hung network mount
+        try:
+            dif = DataIntegrityFingerprint(self.data, execution="threads",
+                                           on_error="skip", read_timeout=0.2)
+            self.assertEqual(dif.dif, expected_dif(FILES))
+            self.assertEqual(dif.errors[0]["path"], "hung")
+            self.assertTrue(dif.errors[0]["error"].startswith(
+                "TimeoutError"))
+        finally:
+            open(fifo, "wb").close()  # releases the abandoned reader
+
+    def test_digest_buffer(self):
+        from dataintegrityfingerprint import digest_buffer
+        if not digest_buffer.AVAILABLE:
+            self.skipTest("requires shared memory (Python 3.8 or later)")
+        with digest_buffer.DigestBuffer(4, 4) as buffer:
+            name = buffer.name
+            digest_buffer.write_digests(name, 1, 4,
+                                        [b"abcd", None, b"efgh"])
+            self.assertEqual(buffer.digests(1, 3),
+                             [b"abcd", b"\x00" * 4, b"efgh"])
+        if os.path.exists("/proc/self/maps"):
+            # the writer has detached, the unlinked memory is released
+            with open("/proc/self/maps") as f:
+                self.assertNotIn(name.lstrip("/"), f.read())
+        self.create_broken_link(os.path.join(self.data, "broken"))
+        for algorithm in ("SHA-256", "CRC-32"):
+            with self.subTest(algorithm=algorithm):
+                difs = [DataIntegrityFingerprint(
+                    self.data, execution=execution, workers=2,
+                    hash_algorithm=algorithm, on_error="skip",
+                    allow_non_cryptographic_algorithms=True)
+                    for execution in ("serial", "processes")]
+                self.assertEqual(difs[0].file_hash_list,
+                                 difs[1].file_hash_list)
+                self.assertEqual(difs[1].errors[0]["path"], "broken")
@@ -0,0 +1,148 @@
+"""Performance regression tests.
+
+The tests measure throughput and peak memory (of Python allocations, see
+`tracemalloc`) of `generate()`, `checksums` and `diff_checksums()` on
+synthetic data and compare them to the baselines stored in
+`performance_baselines.json`.
+
+Since the results depend on the machine, the tests only run if the
+environment variable `DIF_PERFORMANCE_TESTS` is set, e.g.
+
+    DIF_PERFORMANCE_TESTS=1 python -m unittest test_performance
+
+`DIF_PERFORMANCE_TOLERANCE` is the allowed relative deviation from the
+baselines (default: 0.5) and `DIF_PERFORMANCE_RECORD=1` records new
+baselines (e.g. on a new build node) instead of testing.
+
+"""
+
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import unittest
+import tracemalloc
+
+from dataintegrityfingerprint import DataIntegrityFingerprint
+
+
+BASELINES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "performance_baselines.json")
+TOLERANCE = float(os.environ.get("DIF_PERFORMANCE_TOLERANCE", 0.5))
+RECORD = os.environ.get("DIF_PERFORMANCE_RECORD") == "1"
+
+SMALL_FILES = 2000
+SMALL_FILE_SIZE = 1024
+LARGE_FILES = 8
+LARGE_FILE_SIZE = 4 * 1024 * 1024
+CHECKSUMS_ENTRIES = 100000
+REPETITIONS = 3
+
+
+def measure(func):
+    """Return the best elapsed time and the peak memory in bytes."""
+
+    elapsed = []
+    peak = 0
+    for _ in range(REPETITIONS):
+        tracemalloc.start()
+        start = time.perf_counter()
+        func()
+        elapsed.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return min(elapsed), peak
+
+
+@unittest.skipUnless(os.environ.get("DIF_PERFORMANCE_TESTS") or RECORD,
+                     "set DIF_PERFORMANCE_TESTS=1 to run performance tests")
+class PerformanceTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.data = os.path.join(cls.tmp_dir, "data")
+        block = os.urandom(LARGE_FILE_SIZE)
+        for i in range(SMALL_FILES):
+            directory = os.path.join(cls.data, "dir_{0:02d}".format(i // 100))
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, "file_{0:04d}".format(i)),
+                      "wb") as f:
+                f.write(block[i:i + SMALL_FILE_SIZE])
+        for i in range(LARGE_FILES):
+            with open(os.path.join(cls.data, "large_{0}".format(i)),
+                      "wb") as f:
+                f.write(block[i:] + block[:i])
+        cls.total_bytes = SMALL_FILES * SMALL_FILE_SIZE + \
+            LARGE_FILES * LARGE_FILE_SIZE
+
+        # checksums file with many entries (without data)
+        cls.checksums_file = os.path.join(cls.tmp_dir, "many.sha256")
+        with open(cls.checksums_file, "w", encoding="utf-8") as f:
+            for i in range(CHECKSUMS_ENTRIES):
+                path = "dir_{0:03d}/file_{1:06d}.dat".format(i // 1000, i)
+                f.write("{0}  {1}\n".format(
+                    hashlib.sha256(path.encode()).hexdigest(), path))
+
+        if os.path.isfile(BASELINES_FILE):
+            with open(BASELINES_FILE) as f:
+                cls.baselines = json.load(f)
+        else:
+            cls.baselines = {}
+        cls.results = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+        if RECORD:
+            cls.baselines.update(cls.results)
+            with open(BASELINES_FILE, "w") as f:
+                json.dump(cls.baselines, f, indent=4, sort_keys=True)
+                f.write("\n")
+
+    def check(self, name, throughput, unit, peak):
+        result = {unit: round(throughput, 1),
+                  "peak_memory_mb": round(peak / 1e6, 2)}
+        self.results[name] = result
+        if RECORD:
+            return
+        baseline = self.baselines.get(name)
+        if baseline is None:
+            self.skipTest("no baseline for {0}".format(name))
+        self.assertGreaterEqual(
+            throughput, baseline[unit] * (1 - TOLERANCE),
+            "{0}: {1} {2} below baseline {3}".format(
+                name, result[unit], unit, baseline[unit]))
+        self.assertLessEqual(
+            result["peak_memory_mb"],
+            baseline["peak_memory_mb"] * (1 + TOLERANCE),
+            "{0}: peak memory {1} MB above baseline {2} MB".format(
+                name, result["peak_memory_mb"], baseline["peak_memory_mb"]))
+
+    def test_generate(self):
+        # serial, since the memory of worker processes is not traced
+        def generate():
+            DataIntegrityFingerprint(self.data, execution="serial").generate()
+        elapsed, peak = measure(generate)
+        self.check("generate", self.total_bytes / elapsed / 1e6,
+                   "mb_per_second", peak)
+
+    def test_checksums(self):
+        dif = DataIntegrityFingerprint(self.checksums_file,
+                                       from_checksums_file=True)
+        dif.generate()
+        elapsed, peak = measure(lambda: dif.checksums)
+        self.check("checksums", CHECKSUMS_ENTRIES / elapsed,
+                   "entries_per_second", peak)
+
+    def test_diff_checksums(self):
+        dif = DataIntegrityFingerprint(self.checksums_file,
+                                       from_checksums_file=True)
+        dif.generate()
+        elapsed, peak = measure(
+            lambda: dif.diff_checksums(self.checksums_file))
+        self.check("diff_checksums", CHECKSUMS_ENTRIES / elapsed,
+                   "entries_per_second", peak)
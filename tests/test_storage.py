@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from dataintegrityfingerprint import DataIntegrityFingerprint
+from dataintegrityfingerprint.storage import LocalStorage, S3Storage, \
+    S3Error, from_url
+
+from fixtures import create_fixture
+from s3_server import S3Server
+
+
+class StorageTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.data = os.path.join(cls.tmp_dir, "bucket", "data")
+        create_fixture(cls.data, "unicode")
+        with open(os.path.join(cls.data, "large.bin"), "wb") as f:
+            f.write(os.urandom(300000))
+        with open(os.path.join(cls.tmp_dir, "bucket", "other.txt"),
+                  "wb") as f:
+            f.write(b"not part of the data")
+        cls.expected = DataIntegrityFingerprint(cls.data).dif
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_local_storage(self):
+        storage = LocalStorage(os.path.join(self.tmp_dir, "bucket"))
+        dif = DataIntegrityFingerprint("data", storage=storage)
+        self.assertEqual(dif.dif, self.expected)
+        self.assertEqual(dif.data, self.data)
+        self.assertEqual(storage.read_range("data/large.bin", 10, 5),
+                         storage.read_range("data/large.bin", 0, 15)[10:])
+
+    def test_s3_storage(self):
+        with S3Server(self.tmp_dir, max_keys=2) as server:
+            for execution in DataIntegrityFingerprint.EXECUTION_MODES:
+                with self.subTest(execution=execution):
+                    storage = S3Storage(server.endpoint_url, "bucket",
+                                        chunk_size=65536, prefetch=3)
+                    dif = DataIntegrityFingerprint(
+                        "data", storage=storage, execution=execution,
+                        workers=2)
+                    self.assertEqual(dif.dif, self.expected)
+                    self.assertEqual(dif.data, "s3://bucket/data")
+            # large objects are read with concurrent ranged requests
+            ranges = [x[3] for x in server.requests if x[2].endswith(
+                "large.bin")]
+            self.assertIn("bytes=262144-327679", ranges)
+
+            storage = S3Storage(server.endpoint_url, "bucket")
+            self.assertEqual(
+                sorted(storage.list()),
+                sorted([("other.txt", 20)] +
+                       [("data/" + x, y) for x, y in storage.list("data")]))
+            self.assertEqual(storage.stat("other.txt")[0], 20)
+            self.assertEqual(storage.read_range("other.txt", 4, 4), b"part")
+            # connections are reused
+            connections = server.connections
+            for _ in range(10):
+                storage.stat("other.txt")
+            self.assertEqual(server.connections, connections)
+            with self.assertRaises(S3Error):
+                storage.stat("missing.txt")
+            storage.close()
+
+    def test_s3_connection_reuse(self):
+        bucket = os.path.join(self.tmp_dir, "many")
+        os.makedirs(bucket)
+        for i in range(40):
+            with open(os.path.join(bucket, "{0}.bin".format(i)), "wb") as f:
+                f.write(os.urandom(300000))
+        try:
+            with S3Server(self.tmp_dir) as server:
+                storage = S3Storage(server.endpoint_url, "many",
+                                    chunk_size=65536, prefetch=4)
+                for key, size in storage.list():
+                    for _ in storage.read_blocks(key, size):
+                        pass
+                # the threads of the ranged requests keep their connections
+                self.assertLessEqual(server.connections, 10)
+                storage.close()
+        finally:
+            shutil.rmtree(bucket)
+
+    def test_s3_shared_connections(self):
+        with S3Server(self.tmp_dir) as server:
+            storage = S3Storage(server.endpoint_url, "bucket")
+            other = S3Storage(server.endpoint_url, "bucket")
+            storage.stat("other.txt")
+            other.stat("other.txt")
+            connections = server.connections
+            # the connection is still used by the other storage
+            storage.close()
+            other.stat("other.txt")
+            self.assertEqual(server.connections, connections)
+            other.close()
+            storage.stat("other.txt")
+            self.assertEqual(server.connections, connections + 1)
+            storage.close()
+
+    def test_s3_incomplete_response(self):
+        with S3Server(self.tmp_dir, truncate=1) as server:
+            storage = S3Storage(server.endpoint_url, "bucket")
+            # retried
+            self.assertEqual(storage.read_range("other.txt", 4, 4), b"part")
+            server.truncate = 2
+            with self.assertRaises(S3Error):
+                storage.read_range("other.txt", 4, 4)
+            server.truncate = 0
+            self.assertEqual(storage.read_range("other.txt", 4, 4), b"part")
+            storage.close()
+
+    def test_s3_signed_requests(self):
+        with S3Server(self.tmp_dir, access_key="KEY") as server:
+            with self.assertRaises(S3Error):
+                list(S3Storage(server.endpoint_url, "bucket").list())
+            storage = S3Storage(server.endpoint_url, "bucket",
+                                access_key="KEY", secret_key="SECRET")
+            dif = DataIntegrityFingerprint("data", storage=storage)
+            self.assertEqual(dif.dif, self.expected)
+
+    def test_from_url(self):
+        storage, path = from_url("s3://bucket/some/data/",
+                                 endpoint_url="http://localhost:9000")
+        self.assertIsInstance(storage, S3Storage)
+        self.assertEqual((storage.bucket, path), ("bucket", "some/data"))
+        storage, path = from_url(self.data)
+        self.assertIsInstance(storage, LocalStorage)
+        self.assertEqual(storage.url(path), self.data)
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from dataintegrityfingerprint import DataIntegrityFingerprint
+from dataintegrityfingerprint.manifest_formats import algorithm_name
+
+from fixtures import FIXTURES, KNOWN_DIFS, create_fixture, expected_files, \
+    reference_dif
+
+
+class SyntheticDataTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.fixtures = {}
+        for name in FIXTURES:
+            root = os.path.join(cls.tmp_dir, name)
+            if create_fixture(root, name):
+                cls.fixtures[name] = root
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_known_difs(self):
+        for name in FIXTURES:
+            if name not in self.fixtures:
+                continue  # not supported on this platform
+            self.assertEqual(reference_dif(expected_files(name)),
+                             KNOWN_DIFS[name])
+            for execution in DataIntegrityFingerprint.EXECUTION_MODES:
+                with self.subTest(fixture=name, execution=execution):
+                    dif = DataIntegrityFingerprint(self.fixtures[name],
+                                                   execution=execution,
+                                                   workers=2)
+                    self.assertEqual(dif.dif, KNOWN_DIFS[name])
+
+    def test_all_algorithms(self):
+        algorithms = DataIntegrityFingerprint.CRYPTOGRAPHIC_ALGORITHMS + \
+            DataIntegrityFingerprint.NON_CRYPTOGRAPHIC_ALGORITHMS
+        for name, root in self.fixtures.items():
+            for algorithm in algorithms:
+                with self.subTest(fixture=name, algorithm=algorithm):
+                    dif = DataIntegrityFingerprint(
+                        root, hash_algorithm=algorithm,
+                        allow_non_cryptographic_algorithms=True)
+                    self.assertEqual(
+                        dif.dif, reference_dif(expected_files(name),
+                                               algorithm_name(algorithm)))
+
+    def test_checksums_file(self):
+        for name, root in self.fixtures.items():
+            with self.subTest(fixture=name):
+                dif = DataIntegrityFingerprint(root)
+                filename = os.path.join(self.tmp_dir, name + ".sha256")
+                dif.save_checksums(filename)
+                other = DataIntegrityFingerprint(filename,
+                                                 from_checksums_file=True)
+                self.assertEqual(other.dif, KNOWN_DIFS[name])
+                self.assertEqual(dif.diff_checksums(filename), "")